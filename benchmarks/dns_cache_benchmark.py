@@ -0,0 +1,156 @@
+"""
+Check the resolver cache of the lambda function with a fake resolver and measure the lookups it saves, without any network.
+
+The fake resolver answers after a delay like a DNS server would and fails for the hosts it does not know.
+The checks move a fake clock past the TTLs, and the benchmark makes requests with requests to a local HTTP server
+through a made up host name, with every connection closed by the server so that every request resolves the host again.
+
+Usage:
+python benchmarks/dns_cache_benchmark.py --requests 50 --lookup-ms 20 --output dns-cache-results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import statistics
+from http.server import ThreadingHTTPServer
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda-api-call')
+sys.path.insert(0, LAMBDA_DIR)
+
+import requests
+import resolver
+from tls_stub import StubHandler
+
+# the host name the local server is reached through, which only the fake resolver knows
+STUB_HOST = 'raider.io.benchmark'
+
+class FakeResolver(resolver.Resolver):
+    """
+    Resolves the hosts it is given to their addresses after a delay and fails for every other host.
+
+    Parameters:
+    hosts (dict): The address of each host.
+    delay (float): Seconds that every lookup takes.
+    """
+    def __init__(self, hosts, delay=0):
+        self.hosts = hosts
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def resolve(self, host, port, family):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if host not in self.hosts:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (self.hosts[host], port))]
+
+class FakeClock:
+    """
+    A clock that only moves when it is told to.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def check_cache():
+    """
+    Check that the cache reuses addresses until the TTL is over, reuses failures until the negative TTL is over
+    and counts the lookups it saved.
+    """
+    fake = FakeResolver({STUB_HOST: '127.0.0.1'})
+    clock = FakeClock()
+    cache = resolver.CachingResolver(fake, ttl=60, negative_ttl=5, clock=clock)
+
+    first = cache.resolve(STUB_HOST, 443, socket.AF_UNSPEC)
+    assert cache.resolve(STUB_HOST, 443, socket.AF_UNSPEC) == first
+    assert fake.calls == 1, 'the addresses of a host are reused within the TTL'
+    cache.resolve(STUB_HOST, 80, socket.AF_UNSPEC)
+    assert fake.calls == 2, 'every port is cached on its own'
+    clock.now = 60
+    cache.resolve(STUB_HOST, 443, socket.AF_UNSPEC)
+    assert fake.calls == 3, 'the host is resolved again once the TTL is over'
+
+    for _ in range(3):
+        try:
+            cache.resolve('unknown.benchmark', 443, socket.AF_UNSPEC)
+            raise AssertionError('a host that cannot be resolved raises gaierror')
+        except socket.gaierror as e:
+            assert e.args[0] == socket.EAI_NONAME
+    assert fake.calls == 4, 'a host that could not be resolved is not resolved again within the negative TTL'
+    clock.now = 65
+    try:
+        cache.resolve('unknown.benchmark', 443, socket.AF_UNSPEC)
+    except socket.gaierror:
+        pass
+    assert fake.calls == 5, 'the host is resolved again once the negative TTL is over'
+
+    assert cache.get_stats() == {'lookups': 8, 'hits': 1, 'negative_hits': 2}
+
+def measure(cache, url, count):
+    """
+    Make requests that each open a new connection.
+
+    Returns:
+    dict: The median and 95th percentile of the latency in milliseconds.
+    """
+    session = requests.Session()
+    latencies = []
+    for _ in range(count):
+        start_time = time.perf_counter()
+        session.get(url).raise_for_status()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    session.close()
+    return {
+        'median_ms': statistics.median(latencies),
+        'p95_ms': statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the resolver cache and benchmark it against a local HTTP server.')
+    parser.add_argument('--requests', type=int, default=50, help='The number of requests of each run.')
+    parser.add_argument('--lookup-ms', type=float, default=20, help='The milliseconds every lookup of the fake resolver takes.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    check_cache()
+    print('resolver cache checks passed')
+
+    handler = type('Handler', (StubHandler,), {'close_connections': True})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://{STUB_HOST}:{server.server_port}/'
+    results = {'requests': args.requests, 'lookup_ms': args.lookup_ms}
+    try:
+        for name, ttl in [('no_cache', 0), ('cache', 60)]:
+            fake = FakeResolver({STUB_HOST: '127.0.0.1'}, delay=args.lookup_ms / 1000)
+            cache = resolver.CachingResolver(fake, ttl=ttl) if ttl else fake
+            resolver.install(cache)
+            results[name] = measure(cache, url, args.requests)
+            results[name]['lookups_resolved'] = fake.calls
+            if ttl:
+                stats = cache.get_stats()
+                results[name]['lookups_saved'] = stats['hits'] + stats['negative_hits']
+    finally:
+        server.shutdown()
+
+    for name in ['no_cache', 'cache']:
+        result = results[name]
+        print(f"{name:<10} median {result['median_ms']:6.1f}ms, p95 {result['p95_ms']:6.1f}ms, "
+              f"lookups resolved: {result['lookups_resolved']}")
+    print(f"lookups saved by the cache: {results['cache']['lookups_saved']}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Measure how many rows a second the data quality rules are evaluated over with get_violation_bitmap, the way the
+parquet engine of the data quality job checks the temporary table a chunk at a time.
+
+A synthetic cutoff table of 10M rows is built a chunk at a time with violations of known rules injected at fixed
+intervals. The counts of violating rows found are checked against the injected ones, and the bitmap of the first
+chunk is checked against the query the athena engine runs, evaluated with DuckDB.
+
+Usage:
+python benchmarks/dq_rules_benchmark.py --rows 10000000 --chunk-rows 1000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+GLUE_JOBS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'raiderio-glue-jobs')
+sys.path.insert(0, GLUE_JOBS_DIR)
+
+from dq_rules import RULES, PERCENTILES, get_violation_bitmap, get_violations_query, count_violations
+
+# every this many-th row violates the rules named
+INJECTED = {
+    1000: ['p900_range', 'percentile_order'],
+    1500: ['population_not_null'],
+    2500: ['population_consistency']
+}
+
+def build_chunk(start, count, rng):
+    """
+    Build rows start to start + count of the synthetic cutoff table, with violations injected at INJECTED intervals.
+    """
+    index = np.arange(start, start + count)
+    population = rng.integers(100000, 500000, count).astype('float64')
+    columns = {}
+    score = rng.uniform(3000, 4000, count)
+    for rank, percentile in enumerate(PERCENTILES):
+        columns[percentile] = score - rank * 400
+        columns[f'{percentile}_population'] = np.floor(population * (0.001 * 10 ** min(rank, 2) + 0.1 * max(rank - 2, 0)))
+    columns['population'] = population
+    columns['p900'][index % 1000 == 0] = 6000
+    columns['population'][index % 1500 == 0] = np.nan
+    columns['p600_population'][index % 2500 == 0] = population[index % 2500 == 0] + 1
+    return pd.DataFrame(columns)
+
+def get_expected_counts(rows):
+    """
+    The number of rows that violate each rule in a table built by build_chunk.
+    """
+    expected = {rule['name']: 0 for rule in RULES}
+    for interval, names in INJECTED.items():
+        for name in names:
+            expected[name] += -(-rows // interval)
+    # a row whose population is missing can not be checked for consistency
+    both = -(-rows // 7500)
+    expected['population_consistency'] -= both
+    return expected
+
+def check_against_sql(chunk):
+    """
+    Check that get_violation_bitmap sets the same bits as the violations query of the athena engine.
+    """
+    connection = duckdb.connect()
+    connection.register('cutoffs', chunk.assign(row_number=np.arange(len(chunk))))
+    query = get_violations_query(RULES, 'cutoffs')
+    expected = connection.execute(f'SELECT row_number, violation_bitmap FROM ({query}) ORDER BY row_number').fetchnumpy()
+    bitmap = get_violation_bitmap(chunk, RULES)
+    violating = np.flatnonzero(bitmap)
+    assert np.array_equal(violating, expected['row_number']), 'the same rows violate the rules in python and in sql'
+    assert np.array_equal(bitmap[violating], expected['violation_bitmap'].astype(np.uint64)), 'the same rules are violated in python and in sql'
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark evaluating the data quality rules over a synthetic cutoff table.')
+    parser.add_argument('--rows', type=int, default=10000000, help='The number of rows of the synthetic table.')
+    parser.add_argument('--chunk-rows', type=int, default=1000000, help='The number of rows evaluated at a time.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic scores and populations.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    counts = {rule['name']: 0 for rule in RULES}
+    violating_rows = 0
+    build_seconds = 0
+    evaluate_seconds = 0
+    for start in range(0, args.rows, args.chunk_rows):
+        start_time = time.perf_counter()
+        chunk = build_chunk(start, min(args.chunk_rows, args.rows - start), rng)
+        build_seconds += time.perf_counter() - start_time
+        if start == 0:
+            check_against_sql(chunk)
+        start_time = time.perf_counter()
+        bitmap = get_violation_bitmap(chunk, RULES)
+        violating = bitmap != 0
+        violations = chunk[violating].assign(violation_bitmap=bitmap[violating])
+        evaluate_seconds += time.perf_counter() - start_time
+        violating_rows += len(violations)
+        for name, count in count_violations(violations['violation_bitmap'].to_numpy(), RULES).items():
+            counts[name] += count
+    assert counts == get_expected_counts(args.rows), f'the injected violations are found, got {counts}'
+
+    results = {
+        'rows': args.rows,
+        'chunk_rows': args.chunk_rows,
+        'rules': len(RULES),
+        'violating_rows': violating_rows,
+        'violations': counts,
+        'build_seconds': build_seconds,
+        'evaluate_seconds': evaluate_seconds,
+        'rows_per_second': args.rows / evaluate_seconds
+    }
+    print(f"{len(RULES)} rules over {args.rows} rows in chunks of {args.chunk_rows}: {evaluate_seconds:.2f}s, "
+          f"{results['rows_per_second']:.0f} rows/sec, {violating_rows} violating rows (table built in {build_seconds:.2f}s)")
+    for name, count in counts.items():
+        if count:
+            print(f'{name:<24} {count:8d} rows')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+In-memory fakes of the boto3 clients for the benchmarks that exercise a single part of the pipeline,
+with a latency for every call like a round trip to AWS and failures that can be injected.
+"""
+import time
+import random
+import threading
+
+class InMemoryS3:
+    """
+    The list_objects_v2 paginator and the delete_objects and delete_object calls of the boto3 s3 client,
+    over a dict of keys for each bucket.
+
+    Parameters:
+    latency (float): Seconds that every call takes.
+    delete_latency (float): Seconds that a delete_objects call takes, the same as latency if not given.
+    failing_keys (set): Keys that delete_objects reports as errors instead of deleting.
+    """
+    def __init__(self, latency=0, delete_latency=None, failing_keys=None):
+        self.buckets = {}
+        self.latency = latency
+        self.delete_latency = latency if delete_latency is None else delete_latency
+        self.failing_keys = failing_keys or set()
+        self.lock = threading.Lock()
+        self.calls = {'list_objects_v2': 0, 'delete_objects': 0, 'delete_object': 0}
+        self.largest_delete = 0
+
+    def put_keys(self, bucket, keys):
+        self.buckets.setdefault(bucket, {}).update((key, b'') for key in keys)
+
+    def count_keys(self, bucket, prefix=''):
+        return sum(1 for key in self.buckets.get(bucket, {}) if key.startswith(prefix))
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+        time.sleep(self.delete_latency if name == 'delete_objects' else self.latency)
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix='', PaginationConfig=None):
+        page_size = min((PaginationConfig or {}).get('PageSize', 1000), 1000)
+        bucket = self.buckets.get(Bucket, {})
+        with self.lock:
+            listing = sorted(key for key in bucket if key.startswith(Prefix))
+        position = 0
+        while True:
+            # like S3 every page continues after the last key of the previous page, so deleting while listing is safe
+            self.call('list_objects_v2')
+            keys = []
+            with self.lock:
+                while position < len(listing) and len(keys) < page_size:
+                    if listing[position] in bucket:
+                        keys.append(listing[position])
+                    position += 1
+            yield {'KeyCount': len(keys), 'Contents': [{'Key': key} for key in keys]} if keys else {'KeyCount': 0}
+            if position >= len(listing):
+                return
+
+    def delete_objects(self, Bucket, Delete):
+        self.call('delete_objects')
+        if len(Delete['Objects']) > 1000:
+            raise ValueError('delete_objects accepts at most 1000 keys')
+        errors = []
+        with self.lock:
+            self.largest_delete = max(self.largest_delete, len(Delete['Objects']))
+            for obj in Delete['Objects']:
+                if obj['Key'] in self.failing_keys:
+                    errors.append({'Key': obj['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'})
+                else:
+                    self.buckets.get(Bucket, {}).pop(obj['Key'], None)
+        return {'Errors': errors} if errors else {}
+
+    def delete_object(self, Bucket, Key):
+        self.call('delete_object')
+        with self.lock:
+            self.buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+class FlakyFirehose:
+    """
+    The put_record_batch call of the boto3 firehose client, failing records at random the way the firehose does
+    when it is throttled or has an internal error, and keeping every record it accepted in the order it accepted them.
+
+    Parameters:
+    failure_rate (float): The chance that any record of a call fails.
+    throttle_every (int): Every record of every this many-th call fails as throttled, 0 to never throttle.
+    seed (int): The seed of the random failures, so that runs can be repeated.
+    latency (float): Seconds that every call takes.
+    """
+    def __init__(self, failure_rate=0, throttle_every=0, seed=0, latency=0):
+        self.failure_rate = failure_rate
+        self.throttle_every = throttle_every
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.delivered = []
+        self.calls = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self.calls += 1
+        time.sleep(self.latency)
+        # the firehose rejects the whole call when any of its limits is exceeded
+        if len(Records) > 500:
+            raise ValueError('put_record_batch accepts at most 500 records')
+        if sum(len(record['Data']) for record in Records) > 4 * 1024 * 1024:
+            raise ValueError('put_record_batch accepts at most 4 MiB')
+        if any(len(record['Data']) > 1000 * 1024 for record in Records):
+            raise ValueError('put_record_batch accepts records of at most 1,000 KiB')
+        throttle = self.throttle_every and self.calls % self.throttle_every == 0
+        self.throttled += 1 if throttle else 0
+        responses = []
+        for record in Records:
+            if throttle:
+                responses.append({'ErrorCode': 'ServiceUnavailableException', 'ErrorMessage': 'Slow down.'})
+            elif self.random.random() < self.failure_rate:
+                responses.append({'ErrorCode': 'InternalFailure', 'ErrorMessage': 'Internal service failure.'})
+            else:
+                self.delivered.append(record['Data'])
+                responses.append({'RecordId': str(len(self.delivered))})
+        failed = sum(1 for response in responses if 'ErrorCode' in response)
+        self.failed += failed
+        return {'FailedPutCount': failed, 'RequestResponses': responses}
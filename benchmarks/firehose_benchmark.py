@@ -0,0 +1,86 @@
+"""
+Check how the lambda function puts records onto the firehose against a fake firehose that fails records at random
+and throttles whole calls, and measure the records it puts per second as the failures grow.
+
+The checks make sure that every record is delivered exactly once however many times it had to be retried, that
+the retries are counted, that records which keep failing raise an error, and that a record over the 1,000 KiB
+limit of the firehose is rejected before anything is sent.
+
+Usage:
+python benchmarks/firehose_benchmark.py --rows 10000 --failure-rates 0,0.01,0.05,0.1 --latency-ms 20
+"""
+import json
+import argparse
+import tempfile
+from collections import Counter
+
+from fake_aws import FlakyFirehose
+from ndjson_benchmark import build_rows
+from pipeline_benchmark import load_lambda
+
+def expect_error(put, message):
+    try:
+        put()
+    except Exception as e:
+        return e
+    raise AssertionError(message)
+
+def check_put_records(lambda_module, records):
+    """
+    Check that put_records delivers every record exactly once through failures and rejects what it cannot deliver.
+    """
+    firehose = FlakyFirehose()
+    stats = lambda_module.put_records(firehose, records)
+    assert firehose.delivered == records, 'without failures every record is delivered once and in order'
+    assert stats['retries'] == 0 and firehose.calls == -(-len(records) // lambda_module.FIREHOSE_BATCH_RECORDS), 'full batches are sent once each'
+
+    firehose = FlakyFirehose(failure_rate=0.05, throttle_every=10, seed=7)
+    stats = lambda_module.put_records(firehose, records)
+    assert Counter(firehose.delivered) == Counter(records), 'with failures every record is still delivered exactly once'
+    assert stats['retries'] == firehose.failed > 0 and firehose.throttled > 0, 'every failed or throttled record is retried and counted'
+
+    firehose = FlakyFirehose(failure_rate=1)
+    error = expect_error(lambda: lambda_module.put_records(firehose, records[:10]), 'records that keep failing raise an error')
+    assert firehose.calls == lambda_module.FIREHOSE_MAX_ATTEMPTS and 'Internal service failure' in str(error), 'a batch is given up on after FIREHOSE_MAX_ATTEMPTS calls'
+
+    large = [bytes(900 * 1024) for _ in range(10)]
+    firehose = FlakyFirehose()
+    lambda_module.put_records(firehose, large)
+    assert firehose.delivered == large and firehose.calls == 3, 'batches of large records stay within 4 MiB'
+
+    firehose = FlakyFirehose()
+    oversized = records[:5] + [bytes(lambda_module.FIREHOSE_RECORD_BYTES + 1)] + records[5:10]
+    error = expect_error(lambda: lambda_module.put_records(firehose, oversized), 'a record over the limit raises an error')
+    assert firehose.calls == 0 and 'record 5' in str(error), 'a record over the limit is rejected before anything is sent'
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and benchmark putting records onto a fake firehose that fails records.')
+    parser.add_argument('--rows', type=int, default=10000, help='The number of cutoff rows to put onto the firehose.')
+    parser.add_argument('--failure-rates', default='0,0.01,0.05,0.1', help='The comma separated chances that a record of a call fails.')
+    parser.add_argument('--latency-ms', type=float, default=20, help='The milliseconds every put_record_batch call takes.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the random failures.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        lambda_module = load_lambda(root, root)
+    records = [lambda_module.serialize_cutoff_row(row) for row in build_rows(args.rows)]
+    check_put_records(lambda_module, records)
+    print(f'firehose checks passed with {args.rows} records')
+
+    results = {'rows': args.rows, 'latency_ms': args.latency_ms, 'runs': []}
+    for failure_rate in [float(rate) for rate in args.failure_rates.split(',')]:
+        firehose = FlakyFirehose(failure_rate=failure_rate, seed=args.seed, latency=args.latency_ms / 1000)
+        stats = lambda_module.put_records(firehose, records)
+        assert Counter(firehose.delivered) == Counter(records)
+        results['runs'].append({'failure_rate': failure_rate, 'calls': firehose.calls, **stats})
+
+    for run in results['runs']:
+        print(f"failure rate {run['failure_rate']:<5} {run['records_per_second']:10.0f} records/sec "
+              f"{run['bytes_per_second'] / 1024 / 1024:8.2f} MiB/sec {run['retries']:6d} retries {run['calls']:4d} calls")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
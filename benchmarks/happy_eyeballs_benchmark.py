@@ -0,0 +1,178 @@
+"""
+Compare the latency of new connections when the addresses of a host are tried one after the other, as urllib3 does,
+and when they are raced as RFC 8305 describes, with the create_connection of the lambda function.
+
+A fake resolver returns an IPv6 address on ::1 followed by an IPv4 address on 127.0.0.1, like getaddrinfo does for a host
+with both. The IPv6 address is made to behave in different ways without any network:
+healthy     a listening socket
+refused     a port that nothing listens on
+blackholed  a listening socket whose accept queue is full, so the SYN is dropped and the connect never finishes
+slow        a listening socket whose accept queue is full until shortly after the connect starts, so it only connects
+            once the SYN is sent again, about a second later
+
+Usage:
+python benchmarks/happy_eyeballs_benchmark.py --runs 5 --timeout 1.5 --delay 0.25 --output happy-eyeballs-results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import statistics
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda-api-call')
+sys.path.insert(0, LAMBDA_DIR)
+
+import resolver
+
+STUB_HOST = 'raider.io.benchmark'
+# the addresses the sockets of each family listen on
+LOOPBACK = {socket.AF_INET6: '::1', socket.AF_INET: '127.0.0.1'}
+# the behaviour of the IPv6 and IPv4 address of each scenario
+SCENARIOS = {
+    'ipv6_healthy': ('healthy', 'healthy'),
+    'ipv6_refused': ('refused', 'healthy'),
+    'ipv6_slow': ('slow', 'healthy'),
+    'ipv6_blackholed': ('blackholed', 'healthy'),
+    'all_blackholed': ('blackholed', 'blackholed'),
+}
+
+class FakeResolver(resolver.Resolver):
+    """
+    Resolves every host to the addresses it is given.
+    """
+    def __init__(self, addresses):
+        self.addresses = addresses
+
+    def resolve(self, host, port, family):
+        return self.addresses
+
+def listen(family, backlog):
+    """
+    Create a socket that listens on the loopback address of a family on a free port.
+    """
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.bind((LOOPBACK[family], 0))
+    sock.listen(backlog)
+    return sock
+
+def accept_forever(listener):
+    """
+    Accept and close every connection to a listening socket in a background thread.
+    """
+    def accept():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            connection.close()
+    threading.Thread(target=accept, daemon=True).start()
+
+def fill_queue(listener):
+    """
+    Fill the accept queue of a socket that listens with a backlog of 0, so that the SYN of every other connection is dropped.
+
+    Returns:
+    socket: The connection that fills the queue.
+    """
+    filler = socket.socket(listener.family, socket.SOCK_STREAM)
+    filler.connect(listener.getsockname())
+    return filler
+
+def create_address(family, behaviour, sockets):
+    """
+    Create an address that behaves in a way, keeping the sockets it needs in sockets so that they can be closed afterwards.
+
+    Returns:
+    tuple: The address like getaddrinfo returns it.
+    """
+    if behaviour == 'healthy':
+        listener = listen(family, 128)
+        accept_forever(listener)
+    elif behaviour == 'refused':
+        # the port is free again once the socket is closed, so nothing listens on it
+        listener = listen(family, 0)
+        address = listener.getsockname()
+        listener.close()
+        return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', address)
+    else:
+        listener = listen(family, 0)
+        filler = fill_queue(listener)
+        sockets.append(filler)
+        if behaviour == 'slow':
+            # the queue is emptied once the first SYN has been dropped, so the SYN that is sent again is answered
+            threading.Timer(0.05, lambda: listener.accept()[0].close()).start()
+    sockets.append(listener)
+    return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', listener.getsockname())
+
+def connect(scenario, delay, timeout):
+    """
+    Connect once to the addresses of a scenario, creating them again so that a slow address is slow every time.
+
+    Returns:
+    tuple: The milliseconds the connection took and the family it connected with, or None if it failed.
+    """
+    sockets = []
+    addresses = [create_address(family, behaviour, sockets) for family, behaviour in zip([socket.AF_INET6, socket.AF_INET], SCENARIOS[scenario])]
+    resolver.install(FakeResolver(addresses), delay)
+    start_time = time.perf_counter()
+    try:
+        sock = resolver.create_connection((STUB_HOST, 443), timeout=timeout)
+        family = sock.family
+        sock.close()
+    except OSError:
+        family = None
+    elapsed = (time.perf_counter() - start_time) * 1000
+    for sock in sockets:
+        sock.close()
+    return elapsed, family
+
+def count_open_files():
+    """
+    Count the file descriptors of the process, or None where /proc is not available.
+    """
+    return len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark racing the addresses of a host against trying them one after the other.')
+    parser.add_argument('--runs', type=int, default=5, help='The number of connections of each scenario and mode.')
+    parser.add_argument('--timeout', type=float, default=1.5, help='The connect timeout in seconds.')
+    parser.add_argument('--delay', type=float, default=0.25, help='The connection attempt delay of the racing mode in seconds.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    if not socket.has_ipv6:
+        sys.exit('the benchmark needs IPv6 on the loopback interface')
+    results = {'runs': args.runs, 'timeout_s': args.timeout, 'connection_attempt_delay_s': args.delay, 'scenarios': {}}
+    open_files = count_open_files()
+    for scenario in SCENARIOS:
+        results['scenarios'][scenario] = {}
+        for mode, delay in [('sequential', None), ('racing', args.delay)]:
+            connections = [connect(scenario, delay, args.timeout) for _ in range(args.runs)]
+            latencies = [elapsed for elapsed, _ in connections]
+            families = [{socket.AF_INET6: 'ipv6', socket.AF_INET: 'ipv4', None: 'failed'}[family] for _, family in connections]
+            results['scenarios'][scenario][mode] = {
+                'median_ms': statistics.median(latencies),
+                'max_ms': max(latencies),
+                'connected_with': {family: families.count(family) for family in sorted(set(families))}
+            }
+    # the sockets of the attempts that lost the race must be closed
+    if open_files is not None:
+        results['leaked_file_descriptors'] = count_open_files() - open_files
+
+    print(f"{'scenario':<18}{'sequential':>26}{'racing':>26}")
+    for scenario, modes in results['scenarios'].items():
+        cells = [f"{modes[mode]['median_ms']:8.1f}ms {','.join(modes[mode]['connected_with']):>14}" for mode in ['sequential', 'racing']]
+        print(f'{scenario:<18}{cells[0]:>26}{cells[1]:>26}')
+    if 'leaked_file_descriptors' in results:
+        print(f"leaked file descriptors: {results['leaked_file_descriptors']}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
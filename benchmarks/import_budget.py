@@ -0,0 +1,126 @@
+"""
+Measure the time the lambda function takes to import on a cold start and fail if it is over budget.
+
+The lambda function is imported in a fresh interpreter with -X importtime a number of times and the median
+of the cumulative import time of the function is compared to the baseline stored in import_baseline.json.
+The time of each top level package is reported so that a regression can be traced to the package that caused it.
+
+Usage:
+python benchmarks/import_budget.py                    # check the eager imports against the budget
+python benchmarks/import_budget.py --lazy             # check with RAIDERIO_LAZY_IMPORTS=1
+python benchmarks/import_budget.py --update-baseline  # store the current import time as the baseline
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_ROOT, 'lambda-api-call')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_baseline.json')
+# the module name the lambda function is imported under
+LAMBDA_MODULE = '__init__'
+# how much slower than the baseline the import is allowed to be before the budget is exceeded
+DEFAULT_TOLERANCE = 0.2
+
+def parse_importtime(output):
+    """
+    Parse the report that -X importtime writes to stderr.
+
+    Parameters:
+    output (str): The stderr of the interpreter.
+
+    Returns:
+    list: One tuple per imported module of its name, the microseconds spent in the module itself and
+    the microseconds including the modules it imported.
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def measure(lazy):
+    """
+    Import the lambda function in a fresh interpreter.
+
+    Parameters:
+    lazy (bool): Whether RAIDERIO_LAZY_IMPORTS is set.
+
+    Returns:
+    tuple: The cumulative microseconds of the lambda function and the microseconds spent in each top level package.
+    """
+    env = dict(os.environ, RAIDERIO_LAZY_IMPORTS='1' if lazy else '0')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {LAMBDA_MODULE}'],
+        cwd=LAMBDA_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f'the lambda function could not be imported:\n{result.stderr}')
+    modules = parse_importtime(result.stderr)
+    total = next(cumulative_us for name, _, cumulative_us in modules if name == LAMBDA_MODULE)
+    packages = {}
+    for name, self_us, _ in modules:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return total, packages
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the cold start import time of the lambda function against its budget.')
+    parser.add_argument('--lazy', action='store_true', help='Import with RAIDERIO_LAZY_IMPORTS=1.')
+    parser.add_argument('--runs', type=int, default=7, help='The number of imports to take the median of.')
+    parser.add_argument('--tolerance', type=float, help=f'How much slower than the baseline is allowed, defaults to the stored tolerance or {DEFAULT_TOLERANCE}.')
+    parser.add_argument('--update-baseline', action='store_true', help='Store the measured import time as the baseline.')
+    parser.add_argument('--top', type=int, default=10, help='The number of packages to report.')
+    args = parser.parse_args()
+
+    mode = 'lazy' if args.lazy else 'eager'
+    # the first import writes the bytecode caches, which a deployed package already has
+    measure(args.lazy)
+    runs = [measure(args.lazy) for _ in range(args.runs)]
+    total = statistics.median(total for total, _ in runs)
+    packages = {package: statistics.median(run.get(package, 0) for _, run in runs) for package in set().union(*(run for _, run in runs))}
+    print(f'{mode} import of the lambda function: {total / 1000:.1f}ms (median of {args.runs})')
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'    {package:<24} {self_us / 1000:8.1f}ms')
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_file:
+            baselines = json.load(baseline_file)
+    if args.update_baseline:
+        baselines[mode] = {
+            'total_us': int(total),
+            'tolerance': args.tolerance if args.tolerance is not None else baselines.get(mode, {}).get('tolerance', DEFAULT_TOLERANCE),
+            'python': sys.version.split()[0],
+            # packages that take less than a millisecond are left out to keep the baseline readable
+            'packages_us': {package: int(self_us) for package, self_us in sorted(packages.items()) if self_us >= 1000}
+        }
+        with open(BASELINE_FILE, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f'baseline for {mode} imports stored in {BASELINE_FILE}')
+        return
+    if mode not in baselines:
+        sys.exit(f'there is no baseline for {mode} imports, store one with --update-baseline')
+
+    baseline = baselines[mode]
+    tolerance = args.tolerance if args.tolerance is not None else baseline['tolerance']
+    budget = baseline['total_us'] * (1 + tolerance)
+    print(f'budget: {budget / 1000:.1f}ms ({baseline["total_us"] / 1000:.1f}ms baseline + {tolerance:.0%})')
+    if total > budget:
+        growth = sorted(
+            ((package, self_us - baseline['packages_us'].get(package, 0)) for package, self_us in packages.items()),
+            key=lambda item: item[1], reverse=True
+        )
+        print('packages that grew the most since the baseline:')
+        for package, grown_us in growth[:args.top]:
+            print(f'    {package:<24} {grown_us / 1000:+8.1f}ms')
+        sys.exit(f'the {mode} import of the lambda function is over budget by {(total - budget) / 1000:.1f}ms')
+
+if __name__ == '__main__':
+    main()
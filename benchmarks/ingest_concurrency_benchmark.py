@@ -0,0 +1,121 @@
+"""
+Measure how long the lambda function takes to ingest a growing number of seasons at different concurrency limits.
+
+The season cutoffs are served from the local stub of the raiderio api of pipeline_benchmark.py, which answers every
+request after a delay like raiderio would, and the lambda function writes to the same local fakes of S3 and the firehose.
+The lambda function is loaded again for every concurrency so that RAIDERIO_MAX_CONCURRENT_REQUESTS also sizes its
+connection pool, and the rows it writes are compared to those of the first concurrency to check that their order
+does not depend on the order the calls finish in.
+
+Usage:
+python benchmarks/ingest_concurrency_benchmark.py --concurrency 1,4,16,64 --seasons 8,32,128 --latency-ms 50
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer
+
+from pipeline_benchmark import StubHandler, build_expansions, load_lambda
+
+class SlowStubHandler(StubHandler):
+    """
+    Answers like StubHandler after waiting for latency seconds.
+    """
+    latency = 0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+class StubServer(ThreadingHTTPServer):
+    """
+    A threading HTTP server whose listen backlog fits the highest concurrency, so that no connection waits for its SYN to be sent again.
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+def read_rows(path):
+    """
+    Read the rows the fake firehose wrote, in the order they were put.
+    """
+    rows = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as batch:
+            rows.extend(batch.read().splitlines())
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ingest time of the lambda function against the number of seasons and concurrent calls.')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='The comma separated values of RAIDERIO_MAX_CONCURRENT_REQUESTS to run with.')
+    parser.add_argument('--seasons', default='8,32,128', help='The comma separated numbers of seasons to ingest.')
+    parser.add_argument('--regions', default='us', help='The comma separated regions to fetch.')
+    parser.add_argument('--factions', default='all', help='The comma separated factions to write a row for.')
+    parser.add_argument('--latency-ms', type=float, default=50, help='The milliseconds the stub server takes to answer a call.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    concurrencies = [int(concurrency) for concurrency in args.concurrency.split(',')]
+    season_counts = [int(seasons) for seasons in args.seasons.split(',')]
+    regions = args.regions.split(',')
+    factions = args.factions.split(',')
+
+    handler = type('Handler', (SlowStubHandler,), {'factions': factions, 'latency': args.latency_ms / 1000})
+    server = StubServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['RAIDERIO_API_URL'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ['RAIDERIO_REGIONS'] = ','.join(regions)
+    os.environ['RAIDERIO_FACTIONS'] = ','.join(factions)
+    os.environ.pop('RAIDERIO_FINGERPRINT_MANIFEST', None)
+
+    results = {'latency_ms': args.latency_ms, 'regions': regions, 'factions': factions, 'runs': []}
+    # the rows of the first concurrency for every number of seasons, which every other concurrency has to match
+    expected_rows = {}
+    root = tempfile.mkdtemp(prefix='raiderio-ingest-benchmark-')
+    try:
+        for concurrency in concurrencies:
+            os.environ['RAIDERIO_MAX_CONCURRENT_REQUESTS'] = str(concurrency)
+            firehose_path = os.path.join(root, 'firehose')
+            lambda_module = load_lambda(root, firehose_path)
+            lambda_module.FIREHOSE_BUCKET = os.path.basename(firehose_path)
+            for seasons in season_counts:
+                lambda_module.EXPANSIONS = build_expansions(seasons)
+                # the handler logs every call, which would drown out the results
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    start_time = time.perf_counter()
+                    lambda_module.lambda_handler({}, None)
+                    seconds = time.perf_counter() - start_time
+                rows = read_rows(firehose_path)
+                if len(rows) != seasons * len(regions) * len(factions):
+                    sys.exit(f'{len(rows)} rows were written for {seasons} seasons at concurrency {concurrency}')
+                # ingested_at differs between runs so only the rows without it are compared
+                rows = [{key: value for key, value in json.loads(row).items() if key != 'ingested_at'} for row in rows]
+                if expected_rows.setdefault(seasons, rows) != rows:
+                    sys.exit(f'the rows for {seasons} seasons at concurrency {concurrency} are not in the same order as at concurrency {concurrencies[0]}')
+                results['runs'].append({
+                    'concurrency': concurrency,
+                    'seasons': seasons,
+                    'calls': seasons * len(regions),
+                    'seconds': seconds,
+                    'calls_per_second': seasons * len(regions) / seconds
+                })
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"ingest seconds with a {args.latency_ms:.0f}ms raiderio latency, every row in the same order at every concurrency")
+    print(f"{'seasons':>8}" + ''.join(f'{f"concurrency {concurrency}":>16}' for concurrency in concurrencies))
+    for seasons in season_counts:
+        seconds = {run['concurrency']: run['seconds'] for run in results['runs'] if run['seasons'] == seasons}
+        print(f'{seasons:>8}' + ''.join(f'{seconds[concurrency]:>15.2f}s' for concurrency in concurrencies))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
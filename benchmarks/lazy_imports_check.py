@@ -0,0 +1,63 @@
+"""
+Check that a module deferred by lazy_imports.py can be used by several threads at once while it loads,
+as the lambda function does when it fetches seasons concurrently.
+
+A package that takes a while to import is deferred and a number of threads use it at the same time,
+every one of them has to find its attributes rather than an empty module.
+
+Usage:
+python benchmarks/lazy_imports_check.py --threads 8 --load-seconds 0.3
+"""
+import os
+import sys
+import argparse
+import tempfile
+import importlib
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_ROOT, 'lambda-api-call')
+sys.path.insert(0, LAMBDA_DIR)
+
+import lazy_imports
+
+PACKAGE = 'raiderio_slow_package'
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that deferred modules can be used by several threads while they load.')
+    parser.add_argument('--threads', type=int, default=8, help='The number of threads that use the module at once.')
+    parser.add_argument('--load-seconds', type=float, default=0.3, help='The seconds the module takes to import.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, PACKAGE))
+        with open(os.path.join(root, PACKAGE, '__init__.py'), 'w') as package:
+            package.write(f"import time\n__version__ = '1.0'\ntime.sleep({args.load_seconds})\nfrom .values import VALUE\n")
+        with open(os.path.join(root, PACKAGE, 'values.py'), 'w') as values:
+            values.write('VALUE = 42\n')
+        sys.path.insert(0, root)
+        lazy_imports.LAZY_MODULES[PACKAGE] = '__init__.py'
+        lazy_imports.install()
+        module = importlib.import_module(PACKAGE)
+        assert isinstance(module, lazy_imports.DeferredModule) and module.__version__ == '1.0', 'the version is read without loading the module'
+
+        barrier = threading.Barrier(args.threads)
+        results = []
+        def use_module():
+            barrier.wait()
+            try:
+                results.append(module.VALUE)
+            except AttributeError as e:
+                results.append(e)
+        threads = [threading.Thread(target=use_module) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        failures = [result for result in results if isinstance(result, Exception)]
+        assert not failures, f'{len(failures)} of {args.threads} threads found the module empty: {failures[0]}'
+        assert results == [42] * args.threads and type(module) is not lazy_imports.DeferredModule, 'the module is loaded once for every thread'
+    print(f'{args.threads} threads used a module that took {args.load_seconds}s to load and all of them found its attributes')
+
+if __name__ == '__main__':
+    main()
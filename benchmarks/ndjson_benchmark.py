@@ -0,0 +1,84 @@
+"""
+Compare how the lambda function used to build its firehose payload, concatenating the python repr of every row
+onto a growing string, with the newline delimited json serializer it uses now.
+
+Both are run over the same synthetic cutoff rows and the output of the serializer is checked to be json that
+the crawler and Athena can read, which the repr of a row is not.
+
+Usage:
+python benchmarks/ndjson_benchmark.py --rows 10000 --repeat 7
+"""
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+from pipeline_benchmark import load_lambda, PERCENTILES
+
+def build_rows(count):
+    """
+    Build synthetic cutoff rows with every column of CUTOFF_COLUMNS.
+    """
+    rows = []
+    for i in range(count):
+        row = {'expansion': 'Dragonflight', 'season': i % 4 + 1, 'full_season': i % 8 + 1}
+        for rank, percentile in enumerate(PERCENTILES):
+            row[percentile] = round(3500 - rank * 400 - i % 200 + 0.5, 1)
+            row[f'{percentile}_population'] = 1000 * (rank + 1) + i
+        row.update({'population': 250000 + i, 'faction': ['all', 'horde', 'alliance'][i % 3], 'region': 'us', 'ingested_at': '2024-01-02 03:04:05'})
+        rows.append(row)
+    return rows
+
+def repr_concat(rows):
+    """
+    Build the payload the way the lambda function used to.
+    """
+    payload = ''
+    for row in rows:
+        payload = payload + str(row) + '\n'
+    return payload.encode('utf-8')
+
+def measure(build, rows, repeat):
+    """
+    Run a payload builder repeat times.
+
+    Returns:
+    tuple: The median milliseconds of a run and the payload of the last run.
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        payload = build(rows)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings), payload
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark building the firehose payload with repr concatenation and with the ndjson serializer.')
+    parser.add_argument('--rows', type=int, default=10000, help='The number of cutoff rows to serialize.')
+    parser.add_argument('--repeat', type=int, default=7, help='The number of runs to take the median of.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        lambda_module = load_lambda(root, root)
+    rows = build_rows(args.rows)
+    results = {
+        'repr_concat': measure(repr_concat, rows, args.repeat),
+        'ndjson_encoder': measure(lambda rows: b''.join(lambda_module.serialize_cutoff_row(row) for row in rows), rows, args.repeat)
+    }
+
+    lines = results['ndjson_encoder'][1].splitlines()
+    assert len(lines) == args.rows and all(json.loads(line) == row for line, row in zip(lines, rows)), 'every line of the serializer is the json of its row'
+    try:
+        json.loads(results['repr_concat'][1].splitlines()[0])
+        repr_is_json = True
+    except ValueError:
+        repr_is_json = False
+
+    print(f'{args.rows} rows, median of {args.repeat} runs')
+    for name, (milliseconds, payload) in results.items():
+        print(f'{name:<16} {milliseconds:8.2f}ms {args.rows / milliseconds * 1000:12.0f} rows/sec {len(payload):10d} bytes')
+    print(f"the repr payload {'is' if repr_is_json else 'is not'} valid json, the ndjson payload is")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+"""
+Benchmark the Lambda -> Firehose -> Glue -> Grafana path of the pipeline without AWS.
+
+Synthetic raiderio season cutoffs are served from a local stub server, the lambda function is run against
+fake S3, Firehose and Parameter Store clients that write to local directories, the glue jobs are run with the
+duckdb query backend and the grafana queries are run against the summary table they publish.
+
+The latency, bytes written and peak memory of every stage are written as json so that runs can be compared across commits.
+
+Usage:
+python benchmarks/pipeline_benchmark.py --seasons 8 --regions us,eu,kr,tw --factions all,horde,alliance --snapshots 3
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import importlib.util
+from types import ModuleType
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_ROOT, 'lambda-api-call')
+GLUE_JOBS_DIR = os.path.join(REPO_ROOT, 'raiderio-glue-jobs')
+GRAFANA_QUERIES_DIR = os.path.join(REPO_ROOT, 'grafana-queries')
+# the glue jobs in the order the workflow runs them
+GLUE_JOBS = ['delete_raiderio_table', 'create_raiderio_table', 'data_quality_raiderio_table', 'publish_raiderio_table']
+SEASONS_PER_EXPANSION = 4
+PERCENTILES = ['p999', 'p990', 'p900', 'p750', 'p600']
+# the fraction of the population above each percentile
+PERCENTILE_FRACTIONS = {'p999': 0.001, 'p990': 0.01, 'p900': 0.1, 'p750': 0.25, 'p600': 0.4}
+FIREHOSE_NAME = 'benchmark-firehose'
+# the bucket the firehose writes to and the crawler reads from
+FIREHOSE_BUCKET_NAME = 's3://firehose'
+# the directory of the local root that the query cache is kept in
+QUERY_CACHE_DIR = 'query-cache'
+# the parameters the glue jobs read, the buckets are directories of the local root
+PARAMETERS = {
+    'raiderio_database': 'raiderio',
+    'raiderio_temp_table': 'raiderio_temp',
+    'raiderio_prod_table': 'raiderio_prod',
+    'raiderio_summary_table': 'raiderio_summary_table',
+    'raiderio_partition_column': 'expansion',
+    'raiderio_temp_bucket': 'temp',
+    'raiderio_prod_bucket': 'prod',
+    'raiderio_firehose_table': 'raiderio_firehose',
+    'raiderio_query_results_bucket': 'results',
+    'raiderio_data_quality_bucket': 'dq',
+    'raiderio_publish_mode': 'full',
+}
+
+def build_expansions(seasons):
+    """
+    Build synthetic expansions in the shape of EXPANSIONS of the lambda function.
+
+    Parameters:
+    seasons (int): The total number of seasons.
+
+    Returns:
+    list: The expansions, each holding up to SEASONS_PER_EXPANSION seasons.
+    """
+    expansions = []
+    for full_season in range(1, seasons + 1):
+        index = (full_season - 1) // SEASONS_PER_EXPANSION
+        if index == len(expansions):
+            expansions.append({'title': f'Expansion {index + 1}', 'slug': f'x{index + 1}', 'seasons': []})
+        expansions[index]['seasons'].append({
+            'expansion_season': len(expansions[index]['seasons']) + 1,
+            'full_season': full_season
+        })
+    return expansions
+
+def build_payload(season, region, factions, snapshot):
+    """
+    Build a synthetic season-cutoffs response. The cutoffs rise with every snapshot, as they do during a season.
+
+    Parameters:
+    season (str): The season key of the request, for example season-x1-2.
+    region (str): The region of the request.
+    factions (list): The factions to include.
+    snapshot (int): The number of the snapshot being served.
+
+    Returns:
+    dict: The response body.
+    """
+    seed = int(hashlib.sha256(f'{season}-{region}'.encode('utf-8')).hexdigest()[:8], 16)
+    population = 100000 + seed % 900000 + snapshot * 1000
+    cutoffs = {}
+    for rank, percentile in enumerate(PERCENTILES):
+        cutoffs[percentile] = {}
+        for offset, faction in enumerate(factions):
+            faction_population = population // (1 if faction == 'all' else 2) - offset
+            cutoffs[percentile][faction] = {
+                # the scores descend with the percentile so that the data quality rules pass
+                'quantileMinValue': round(3500 - rank * 400 - (seed % 200) + snapshot * 5.5, 1),
+                'quantilePopulationCount': int(faction_population * PERCENTILE_FRACTIONS[percentile]),
+                'totalPopulationCount': faction_population
+            }
+    return {'cutoffs': cutoffs}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves /mythic-plus/season-cutoffs like the raiderio api, including conditional requests on the ETag.
+    """
+    factions = []
+    snapshot = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if not url.path.endswith('/mythic-plus/season-cutoffs'):
+            self.send_error(404)
+            return
+        body = json.dumps(build_payload(query['season'][0], query['region'][0], self.factions, self.snapshot)).encode('utf-8')
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class NoSuchKey(Exception):
+    pass
+
+class FakeS3:
+    """
+    The calls of the boto3 s3 client used by the lambda function and the glue jobs, backed by a directory per bucket.
+    """
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix='', Delimiter=None, PaginationConfig=None):
+        page_size = (PaginationConfig or {}).get('PageSize', 1000)
+        path = os.path.join(self.root, Bucket)
+        keys = sorted(
+            key
+            for directory, _, names in os.walk(path)
+            for name in names
+            for key in [os.path.relpath(os.path.join(directory, name), path)]
+            if key.startswith(Prefix)
+        )
+        if Delimiter:
+            # keys below a delimiter after the prefix are rolled up into a common prefix, as s3 does
+            prefixes = sorted({Prefix + key[len(Prefix):].split(Delimiter)[0] + Delimiter for key in keys if Delimiter in key[len(Prefix):]})
+            keys = [key for key in keys if Delimiter not in key[len(Prefix):]]
+            yield {'Contents': [{'Key': key} for key in keys], 'CommonPrefixes': [{'Prefix': prefix} for prefix in prefixes], 'KeyCount': len(keys) + len(prefixes)}
+            return
+        for i in range(0, len(keys), page_size):
+            yield {'Contents': [{'Key': key} for key in keys[i:i + page_size]], 'KeyCount': len(keys[i:i + page_size])}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            os.remove(os.path.join(self.root, Bucket, obj['Key']))
+        return {}
+
+    def get_object(self, Bucket, Key):
+        path = os.path.join(self.root, Bucket, Key)
+        if not os.path.exists(path):
+            raise NoSuchKey(Key)
+        with open(path, 'rb') as obj:
+            return {'Body': io.BytesIO(obj.read())}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        path = os.path.join(self.root, Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as obj:
+            obj.write(Body)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        path = os.path.join(self.root, Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(os.path.join(self.root, CopySource['Bucket'], CopySource['Key']), path)
+        return {}
+
+class FakeFirehose:
+    """
+    The put_record_batch call of the boto3 firehose client, writing every batch as a file of the firehose bucket.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.batches = 0
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, f'{DeliveryStreamName}-{self.batches:05d}.json'), 'wb') as batch:
+            for record in Records:
+                batch.write(record['Data'])
+        self.batches += 1
+        return {'FailedPutCount': 0, 'RequestResponses': [{'RecordId': str(i)} for i in range(len(Records))]}
+
+class FakeSSM:
+    def get_parameter(self, Name, WithDecryption=False):
+        return {'Parameter': {'Name': Name, 'Value': FIREHOSE_NAME}}
+
+def load_lambda(root, firehose_bucket_path):
+    """
+    Import the lambda function with boto3 replaced by the fake clients.
+
+    Parameters:
+    root (str): The local root that holds a directory for each bucket.
+    firehose_bucket_path (str): The directory the fake firehose writes to.
+
+    Returns:
+    module: The lambda function module.
+    """
+    fake_boto3 = ModuleType('boto3')
+    clients = {'s3': FakeS3(root), 'ssm': FakeSSM()}
+    fake_boto3.client = lambda name, **kwargs: clients[name] if name in clients else FakeFirehose(firehose_bucket_path)
+    real_boto3 = sys.modules.get('boto3')
+    sys.modules['boto3'] = fake_boto3
+    # the lambda function imports the requests library that is packaged with it
+    sys.path.insert(0, LAMBDA_DIR)
+    try:
+        spec = importlib.util.spec_from_file_location('raiderio_lambda', os.path.join(LAMBDA_DIR, '__init__.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(LAMBDA_DIR)
+        if real_boto3 is None:
+            del sys.modules['boto3']
+        else:
+            sys.modules['boto3'] = real_boto3
+    return module
+
+def get_directory_size(path):
+    """
+    The total size in bytes of the files under a directory.
+    """
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+def run_lambda(module):
+    """
+    Run the lambda handler, measuring its latency and peak python memory.
+
+    Returns:
+    dict: The seconds, peak memory in bytes and the response of the handler.
+    """
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    response = module.lambda_handler({}, None)
+    seconds = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_memory_bytes': peak, 'status_code': response['statusCode']}
+
+def get_peak_resident_memory(pid):
+    """
+    The peak resident memory of a running process in bytes, or 0 if it is not available.
+    """
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def run_glue_job(job, env):
+    """
+    Run a glue job in its own process, measuring its latency and peak resident memory.
+
+    Parameters:
+    job (str): The name of the glue job script without .py.
+    env (dict): The environment of the process.
+
+    Returns:
+    dict: The seconds, peak memory in bytes and exit code of the job.
+    """
+    start_time = time.perf_counter()
+    peak = 0
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen([sys.executable, f'{job}.py'], cwd=GLUE_JOBS_DIR, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+        # the high water mark of the process is sampled until it exits because the rusage of a child
+        # also counts the memory of this process when it was started with vfork
+        while process.poll() is None:
+            peak = max(peak, get_peak_resident_memory(process.pid))
+            time.sleep(0.02)
+        seconds = time.perf_counter() - start_time
+        stderr.seek(0)
+        errors = stderr.read().decode('utf-8', errors='replace').strip().splitlines()
+    result = {
+        'seconds': seconds,
+        'peak_memory_bytes': peak,
+        'exit_code': process.returncode
+    }
+    if process.returncode != 0:
+        result['error'] = errors[-1:]
+    return result
+
+def run_grafana_queries(root):
+    """
+    Run every grafana query against the published summary table and read the summary the publish job cached.
+
+    Returns:
+    dict: The seconds, peak python memory in bytes and the number of rows of every query.
+    """
+    sys.path.insert(0, GLUE_JOBS_DIR)
+    try:
+        from query_backend import DuckDBBackend
+    finally:
+        sys.path.remove(GLUE_JOBS_DIR)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    backend = DuckDBBackend(PARAMETERS['raiderio_database'], root)
+    rows = {}
+    for name in sorted(os.listdir(GRAFANA_QUERIES_DIR)):
+        with open(os.path.join(GRAFANA_QUERIES_DIR, name)) as query:
+            rows[name] = len(backend.execute(query.read()))
+    backend.connection.close()
+    with open(os.path.join(root, QUERY_CACHE_DIR, 'summary.json')) as summary:
+        rows['summary.json'] = len(json.load(summary))
+    seconds = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_memory_bytes': peak, 'rows': rows}
+
+def register_firehose_table(root):
+    """
+    Create the firehose table over the files of the firehose bucket, which the crawler does in AWS.
+    """
+    sys.path.insert(0, GLUE_JOBS_DIR)
+    try:
+        from query_backend import DuckDBBackend
+    finally:
+        sys.path.remove(GLUE_JOBS_DIR)
+    backend = DuckDBBackend(PARAMETERS['raiderio_database'], root)
+    backend.register_json_table(PARAMETERS['raiderio_firehose_table'], f'{FIREHOSE_BUCKET_NAME}/')
+    backend.connection.close()
+
+def get_commit():
+    """
+    The commit being benchmarked, or None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the raiderio pipeline against local stand-ins for AWS.')
+    parser.add_argument('--seasons', type=int, default=8, help='The number of seasons to generate.')
+    parser.add_argument('--regions', default='us', help='The comma separated regions to fetch.')
+    parser.add_argument('--factions', default='all', help='The comma separated factions to write a row for.')
+    parser.add_argument('--snapshots', type=int, default=1, help='The number of times the whole pipeline is run, with the cutoffs changing each time.')
+    parser.add_argument('--skip-job', action='append', default=[], choices=GLUE_JOBS, help='A glue job to leave out, may be given more than once.')
+    parser.add_argument('--workdir', help='The directory that stands in for S3. A temporary directory is used and removed if not given.')
+    parser.add_argument('--output', default='benchmark-results.json', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    regions = args.regions.split(',')
+    factions = args.factions.split(',')
+    root = args.workdir or tempfile.mkdtemp(prefix='raiderio-benchmark-')
+    os.makedirs(root, exist_ok=True)
+    parameters_file = os.path.join(root, 'parameters.json')
+    with open(parameters_file, 'w') as parameters:
+        # the publish job writes the summary the dashboards read to the query cache
+        json.dump(dict(PARAMETERS, raiderio_query_cache_location=os.path.join(root, QUERY_CACHE_DIR)), parameters)
+
+    StubHandler.factions = factions
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # the lambda function reads its configuration from the environment when it is imported
+    os.environ['RAIDERIO_API_URL'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ['RAIDERIO_REGIONS'] = ','.join(regions)
+    os.environ['RAIDERIO_FACTIONS'] = ','.join(factions)
+    os.environ.pop('RAIDERIO_FINGERPRINT_MANIFEST', None)
+    firehose_path = os.path.join(root, FIREHOSE_BUCKET_NAME.replace('s3://', '', 1))
+    lambda_module = load_lambda(root, firehose_path)
+    lambda_module.EXPANSIONS = build_expansions(args.seasons)
+    lambda_module.FIREHOSE_BUCKET = os.path.basename(firehose_path)
+
+    job_env = dict(
+        os.environ,
+        RAIDERIO_QUERY_BACKEND='duckdb',
+        RAIDERIO_LOCAL_ROOT=root,
+        RAIDERIO_PARAMETERS_FILE=parameters_file,
+        PYTHONPATH=os.pathsep.join(filter(None, [GLUE_JOBS_DIR, os.environ.get('PYTHONPATH')]))
+    )
+    job_env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    results = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'config': {
+            'seasons': args.seasons,
+            'regions': regions,
+            'factions': factions,
+            'snapshots': args.snapshots,
+            'rows_per_snapshot': args.seasons * len(regions) * len(factions)
+        },
+        'snapshots': []
+    }
+    try:
+        for snapshot in range(args.snapshots):
+            StubHandler.snapshot = snapshot
+            stages = {}
+            stages['lambda'] = run_lambda(lambda_module)
+            stages['lambda']['bytes_written'] = get_directory_size(firehose_path)
+            if snapshot == 0:
+                register_firehose_table(root)
+            for job in GLUE_JOBS:
+                if job in args.skip_job:
+                    continue
+                stages[job] = run_glue_job(job, job_env)
+                if stages[job]['exit_code'] != 0:
+                    break
+            else:
+                # the grafana queries read the summary table that the publish job creates
+                if 'publish_raiderio_table' not in args.skip_job:
+                    stages['grafana'] = run_grafana_queries(root)
+            stages['bytes_in_buckets'] = {
+                bucket: get_directory_size(os.path.join(root, PARAMETERS[parameter]))
+                for bucket, parameter in [('temp', 'raiderio_temp_bucket'), ('prod', 'raiderio_prod_bucket'), ('data_quality', 'raiderio_data_quality_bucket')]
+            }
+            results['snapshots'].append({'snapshot': snapshot, 'stages': stages})
+            print(f"snapshot {snapshot}: " + ', '.join(f"{name} {stage['seconds']:.2f}s" for name, stage in stages.items() if 'seconds' in stage))
+            if any(stage.get('exit_code') for stage in stages.values()):
+                break
+    finally:
+        server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results['total_seconds'] = sum(
+        stage['seconds'] for snapshot in results['snapshots'] for stage in snapshot['stages'].values() if 'seconds' in stage
+    )
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f"results written to {args.output}")
+    if any(stage.get('exit_code') for snapshot in results['snapshots'] for stage in snapshot['stages'].values()):
+        sys.exit('a glue job failed, see the results for its error')
+
+if __name__ == '__main__':
+    main()
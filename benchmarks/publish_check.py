@@ -0,0 +1,460 @@
+"""
+Check the incremental, swap and snapshot publish modes of the publish job without AWS.
+
+The delete, create and publish jobs are run in this process with boto3 replaced by the fake S3 client of
+pipeline_benchmark and a fake Glue data catalog, and their queries are run with the duckdb query backend. The duckdb
+backend keeps no data catalog, so the tables the jobs create are recorded in the fake catalog and a partitioned table
+is read through the locations of its partitions there, the way Athena reads it.
+
+incremental: a changed partition is repointed at new files and its old files are deleted, a season that lost rows is
+    rewritten, and a partition that fails to be repointed leaves no partition pointing at deleted files
+swap: partitions are created, repointed and removed, and a partition that fails to be created stops the publish
+    before the table is repointed or any partition is removed
+snapshot: a rerun appends no row twice, the partitions of an earlier day are compacted into a single file and marked,
+    and marked partitions are not listed again
+
+Usage:
+python benchmarks/publish_check.py --regions us,eu
+"""
+import os
+import re
+import sys
+import copy
+import glob
+import json
+import runpy
+import logging
+import argparse
+import datetime
+import tempfile
+from types import ModuleType
+
+from pipeline_benchmark import FakeS3, PARAMETERS, GLUE_JOBS_DIR
+
+FACTIONS = ['all', 'horde', 'alliance']
+SEASONS_PER_EXPANSION = 2
+PERCENTILES = ['p999', 'p990', 'p900', 'p750', 'p600']
+# the jobs of the workflow that the publish modes depend on, in the order it runs them
+GLUE_JOBS = ['delete_raiderio_table', 'create_raiderio_table', 'publish_raiderio_table']
+# the glue types of the duckdb types of the columns the jobs write
+GLUE_TYPES = {'VARCHAR': 'string', 'DATE': 'string', 'BIGINT': 'bigint', 'INTEGER': 'int', 'DOUBLE': 'double'}
+# the publish job names the latest snapshot table after the production table when raiderio_latest_table is not set
+LATEST_TABLE = f"{PARAMETERS['raiderio_prod_table']}_latest"
+
+clients = {}
+fake_boto3 = ModuleType('boto3')
+fake_boto3.client = lambda name, **kwargs: clients[name]
+sys.modules['boto3'] = fake_boto3
+sys.path.insert(0, GLUE_JOBS_DIR)
+
+import ssm_config
+import query_backend
+from query_backend import DuckDBBackend
+
+class EntityNotFoundException(Exception):
+    pass
+
+class FakeGlue:
+    """
+    The table and partition calls of the boto3 glue client used by the publish job, over a dict of the tables of a
+    single database and a dict of the partitions of each table.
+
+    Parameters:
+    failing_partitions (set): Value tuples of the partitions that the batch partition calls report as errors instead of changing.
+    """
+    class exceptions:
+        EntityNotFoundException = EntityNotFoundException
+
+    def __init__(self, failing_partitions=None):
+        self.tables = {}
+        self.partitions = {}
+        self.failing_partitions = failing_partitions or set()
+
+    def get_table(self, DatabaseName, Name):
+        if Name not in self.tables:
+            raise EntityNotFoundException(Name)
+        return {'Table': copy.deepcopy(self.tables[Name])}
+
+    def create_table(self, DatabaseName, TableInput):
+        self.tables[TableInput['Name']] = copy.deepcopy(TableInput)
+        self.partitions[TableInput['Name']] = {}
+
+    def update_table(self, DatabaseName, TableInput):
+        if TableInput['Name'] not in self.tables:
+            raise EntityNotFoundException(TableInput['Name'])
+        self.tables[TableInput['Name']] = copy.deepcopy(TableInput)
+
+    def delete_table(self, DatabaseName, Name):
+        self.tables.pop(Name, None)
+        self.partitions.pop(Name, None)
+
+    def add_partitions(self, table_name, partitions):
+        """
+        Add the partitions a query wrote to a table, which Athena does without the batch calls that failures are injected into.
+        """
+        self.partitions[table_name].update((tuple(partition['Values']), copy.deepcopy(partition)) for partition in partitions)
+
+    def get_partition(self, DatabaseName, TableName, PartitionValues):
+        partition = self.partitions.get(TableName, {}).get(tuple(PartitionValues))
+        if partition is None:
+            raise EntityNotFoundException('/'.join(PartitionValues))
+        return {'Partition': copy.deepcopy(partition)}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, DatabaseName, TableName):
+        yield {'Partitions': [copy.deepcopy(partition) for partition in self.partitions.get(TableName, {}).values()]}
+
+    def change_partitions(self, table_name, changes, values_key):
+        """
+        Put or remove partitions of a table, reporting the failing ones as errors the way the batch calls do.
+
+        Parameters:
+        table_name (str): The name of the table.
+        changes (list): The values of each partition and what to put, or None to remove it.
+        values_key (str): The key the values of a failed partition are returned under.
+
+        Returns:
+        dict: The response of the batch call.
+        """
+        errors = []
+        for values, partition in changes:
+            if tuple(values) in self.failing_partitions:
+                errors.append({values_key: values, 'ErrorDetail': {'ErrorCode': 'InternalServiceException', 'ErrorMessage': f"partition {'/'.join(values)} failed"}})
+            elif partition is None:
+                self.partitions[table_name].pop(tuple(values), None)
+            else:
+                self.partitions[table_name][tuple(values)] = copy.deepcopy(dict(partition, Values=list(values)))
+        return {'Errors': errors} if errors else {}
+
+    def batch_create_partition(self, DatabaseName, TableName, PartitionInputList):
+        return self.change_partitions(TableName, [(partition['Values'], partition) for partition in PartitionInputList], 'PartitionValues')
+
+    def batch_update_partition(self, DatabaseName, TableName, Entries):
+        return self.change_partitions(TableName, [(entry['PartitionValueList'], entry['PartitionInput']) for entry in Entries], 'PartitionValueList')
+
+    def batch_delete_partition(self, DatabaseName, TableName, PartitionsToDelete):
+        return self.change_partitions(TableName, [(partition['Values'], None) for partition in PartitionsToDelete], 'PartitionValues')
+
+class RecordingS3(FakeS3):
+    """
+    The fake S3 client of pipeline_benchmark, recording the prefix of every listing.
+    """
+    def __init__(self, root):
+        super().__init__(root)
+        self.listed = []
+
+    def paginate(self, Bucket, Prefix='', Delimiter=None, PaginationConfig=None):
+        self.listed.append(f'{Bucket}/{Prefix}')
+        return super().paginate(Bucket, Prefix, Delimiter, PaginationConfig)
+
+class CatalogBackend(DuckDBBackend):
+    """
+    The duckdb query backend with the tables it creates recorded in a fake Glue data catalog, as Athena records them.
+
+    Every partitioned table of the catalog is read through the locations of its partitions, so a partition the publish
+    job repoints or removes is read from its new files or not at all. INSERT INTO, which the duckdb backend does not
+    translate, appends files to the partitions of the table under its location.
+    """
+    def __init__(self, database, root, glue):
+        super().__init__(database, root)
+        self.glue = glue
+
+    def get_partitions(self, table_name):
+        """
+        The partitions of a table in its location that are not in the catalog yet, as Athena adds them.
+        """
+        table = self.glue.tables[table_name]
+        location = table['StorageDescriptor']['Location']
+        names = [key['Name'] for key in table['PartitionKeys']]
+        partitions = []
+        for path in sorted(glob.glob(os.path.join(self.get_local_path(location), *[f'{name}=*' for name in names]))):
+            values = [segment.split('=', 1)[1] for segment in os.path.relpath(path, self.get_local_path(location)).split(os.sep)]
+            if tuple(values) not in self.glue.partitions[table_name] and glob.glob(os.path.join(path, '*.parquet')):
+                partitions.append({
+                    'Values': values,
+                    'StorageDescriptor': dict(table['StorageDescriptor'], Location=location + '/'.join(f'{name}={value}' for name, value in zip(names, values)) + '/'),
+                    'Parameters': {}
+                })
+        return partitions
+
+    def register(self, table_name, query_string):
+        """
+        Record a table created by a CTAS query in the catalog, with the partitions it wrote.
+        """
+        location = re.search(r"external_location\s*=\s*'([^']*)'", query_string).group(1)
+        partitions = re.search(r'partitioned_by\s*=\s*ARRAY\s*\[([^\]]*)\]', query_string)
+        names = [name.strip().strip("'") for name in partitions.group(1).split(',')] if partitions else []
+        columns = [
+            {'Name': name, 'Type': GLUE_TYPES.get(column_type, column_type.lower())}
+            for name, column_type, *_ in self.connection.execute(f'DESCRIBE {table_name}').fetchall()
+        ]
+        self.glue.create_table(self.database, {
+            'Name': table_name,
+            'StorageDescriptor': {'Columns': [column for column in columns if column['Name'] not in names], 'Location': location},
+            'PartitionKeys': [column for name in names for column in columns if column['Name'] == name],
+            'TableType': 'EXTERNAL_TABLE',
+            'Parameters': {}
+        })
+        if names:
+            self.glue.add_partitions(table_name, self.get_partitions(table_name))
+
+    def insert(self, table_name, select):
+        """
+        Append the rows of a query to a table of the catalog and add the partitions they created.
+        """
+        table = self.glue.tables[table_name]
+        names = ', '.join(key['Name'] for key in table['PartitionKeys'])
+        cursor = self.connection.cursor()
+        # the rows are read before any file is written, the query may read the table it inserts into
+        cursor.execute(f'CREATE OR REPLACE TEMP TABLE inserted_rows AS {select}')
+        cursor.execute(f"COPY inserted_rows TO '{self.get_local_path(table['StorageDescriptor']['Location'])}' (FORMAT PARQUET, PARTITION_BY ({names}), APPEND)")
+        cursor.execute('DROP TABLE inserted_rows')
+        self.glue.add_partitions(table_name, self.get_partitions(table_name))
+
+    def refresh_views(self):
+        """
+        Point the view of every partitioned table of the catalog at the files of its partitions.
+        """
+        for table_name, table in self.glue.tables.items():
+            files = [
+                os.path.join(self.get_local_path(partition['StorageDescriptor']['Location']), '*.parquet')
+                for partition in self.glue.partitions[table_name].values()
+            ]
+            if table['PartitionKeys'] and files:
+                paths = ', '.join(f"'{path}'" for path in files)
+                self.connection.execute(f'CREATE OR REPLACE VIEW {table_name} AS SELECT * FROM read_parquet([{paths}], hive_partitioning = true, union_by_name = true)')
+
+    def execute(self, query_string):
+        self.refresh_views()
+        query_string = query_string.strip().rstrip(';').strip()
+        table_name = lambda name: name.split('.')[-1].strip('"')
+        insert = re.match(r'INSERT\s+INTO\s+(\S+)\s+(.*)$', query_string, re.IGNORECASE | re.DOTALL)
+        if insert:
+            self.insert(table_name(insert.group(1)), insert.group(2))
+            return []
+        rows = super().execute(query_string)
+        drop = re.match(r'DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?(\S+)$', query_string, re.IGNORECASE)
+        ctas = re.match(r'CREATE\s+TABLE\s+(\S+)\s+WITH', query_string, re.IGNORECASE)
+        if drop:
+            self.glue.delete_table(self.database, table_name(drop.group(1)))
+        elif ctas:
+            self.register(table_name(ctas.group(1)), query_string)
+        return rows
+
+class Workflow:
+    """
+    Runs the jobs of the workflow in one publish mode against a local root that stands in for S3.
+
+    Parameters:
+    root (str): The directory that holds a directory for each bucket.
+    mode (str): The publish mode.
+    """
+    def __init__(self, root, mode):
+        self.root = root
+        self.glue = FakeGlue()
+        self.s3 = RecordingS3(root)
+        self.backend = CatalogBackend(PARAMETERS['raiderio_database'], root, self.glue)
+        self.parameters_file = os.path.join(root, 'parameters.json')
+        with open(self.parameters_file, 'w') as parameters:
+            json.dump(dict(PARAMETERS, raiderio_publish_mode=mode), parameters)
+
+    def run(self, rows, day=None):
+        """
+        Put rows onto the firehose and run the jobs of the workflow.
+
+        Parameters:
+        rows (list): The rows the lambda function puts onto the firehose this run.
+        day (date): The day the jobs run on, today if not given.
+
+        Returns:
+        int: The exit code of the first job that failed, or 0.
+        """
+        path = os.path.join(self.root, 'firehose')
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'rows.json'), 'w') as firehose:
+            firehose.write(''.join(json.dumps(row) + '\n' for row in rows))
+        # the crawler types ingested_at as a string, read_json_auto would read it as a timestamp
+        self.backend.connection.execute(
+            f"CREATE OR REPLACE VIEW {PARAMETERS['raiderio_firehose_table']} AS "
+            f"SELECT * REPLACE (CAST(ingested_at AS VARCHAR) AS ingested_at) FROM read_json_auto('{path}/*.json', format = 'newline_delimited')"
+        )
+        clients.update({'s3': self.s3, 'glue': self.glue})
+        query_backend.get_backend = lambda database, output_bucket: self.backend
+        ssm_config.PARAMETERS_FILE = self.parameters_file
+        for job in GLUE_JOBS:
+            ssm_config.loaded_at = None
+            exit_code = run_job(job, day or datetime.date.today())
+            if exit_code:
+                return exit_code
+        return 0
+
+    def get_rows(self, table_name=None):
+        """
+        The rows of a table as sorted tuples of the columns that identify them and a score.
+        """
+        rows = self.backend.execute(f'SELECT expansion, region, full_season, faction, p999 FROM "raiderio"."{table_name or PARAMETERS["raiderio_prod_table"]}"')
+        return sorted((row['expansion'], row['region'], row['full_season'], row['faction'], row['p999']) for row in rows)
+
+    def get_partitions(self):
+        """
+        The locations of the partitions of the production table, keyed on their values.
+        """
+        return {values: partition['StorageDescriptor']['Location'] for values, partition in self.glue.partitions[PARAMETERS['raiderio_prod_table']].items()}
+
+    def count_files(self, location):
+        return len(glob.glob(os.path.join(self.backend.get_local_path(location), '*.parquet')))
+
+def run_job(job, day):
+    """
+    Run a glue job in this process on a given day.
+
+    The job reads the time from datetime, so it is replaced with a copy whose utcnow is the time of day on the given day.
+
+    Returns:
+    int: The exit code of the job.
+    """
+    real_datetime = sys.modules['datetime']
+    clock = ModuleType('datetime')
+    clock.__dict__.update(real_datetime.__dict__)
+    class FrozenDatetime(real_datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return cls.combine(day, real_datetime.datetime.utcnow().time())
+    clock.datetime = FrozenDatetime
+    sys.modules['datetime'] = clock
+    try:
+        runpy.run_path(os.path.join(GLUE_JOBS_DIR, f'{job}.py'), run_name='__main__')
+    except SystemExit as e:
+        return e.code
+    finally:
+        sys.modules['datetime'] = real_datetime
+    return 0
+
+def build_rows(seasons, regions, factions=FACTIONS, bump=0, ingested_at='2024-01-01 00:00:00'):
+    """
+    Build the rows the lambda function puts onto the firehose for some seasons.
+
+    Parameters:
+    seasons (dict): The full seasons of each expansion.
+    regions (list): The regions.
+    factions (list): The factions to write a row for.
+    bump (int): Raises every score, as a new snapshot of the cutoffs does.
+    ingested_at (str): The time the rows were fetched.
+
+    Returns:
+    list: The rows.
+    """
+    rows = []
+    for expansion, full_seasons in seasons.items():
+        for full_season in full_seasons:
+            for region in regions:
+                for offset, faction in enumerate(factions):
+                    population = 100000 + full_season * 1000 - offset
+                    row = {'expansion': expansion, 'season': (full_season - 1) % SEASONS_PER_EXPANSION + 1, 'full_season': full_season}
+                    for rank, percentile in enumerate(PERCENTILES):
+                        row[percentile] = 3500.5 - rank * 400 + full_season + bump * 10
+                        row[f'{percentile}_population'] = population // 10 ** (3 - min(rank, 2))
+                    rows.append(dict(row, population=population, faction=faction, region=region, ingested_at=ingested_at))
+    return rows
+
+def get_expected(rows):
+    return sorted((row['expansion'], row['region'], row['full_season'], row['faction'], row['p999']) for row in rows)
+
+def check_incremental(root, regions):
+    workflow = Workflow(root, 'incremental')
+    first = build_rows({'x1': [1, 2], 'x2': [3, 4]}, regions)
+    assert workflow.run(first) == 0 and workflow.get_rows() == get_expected(first), 'the first incremental publish creates the production table'
+    before = workflow.get_partitions()
+
+    # season 4 changed, season 2 did not and season 3 was not fetched
+    changed = build_rows({'x2': [4]}, regions, bump=1)
+    expected = [row for row in first if row['full_season'] != 4] + changed
+    assert workflow.run(build_rows({'x1': [2]}, regions) + changed) == 0 and workflow.get_rows() == get_expected(expected), 'a changed season is rewritten and the other seasons of its partition are kept'
+    after = workflow.get_partitions()
+    assert all(after[('x1', region)] == before[('x1', region)] for region in regions), 'a partition that did not change is not repointed'
+    assert all(after[('x2', region)] != before[('x2', region)] and not workflow.count_files(before[('x2', region)]) for region in regions), 'a changed partition is repointed and its old files are deleted'
+
+    # the factions of season 4 other than all are no longer fetched
+    shrunk = build_rows({'x2': [4]}, regions, factions=['all'], bump=1)
+    expected = [row for row in expected if row['full_season'] != 4] + shrunk
+    assert workflow.run(shrunk) == 0 and workflow.get_rows() == get_expected(expected), 'a season that lost rows is rewritten'
+
+    failing = ('x2', regions[0])
+    workflow.glue.failing_partitions = {failing}
+    before = workflow.get_partitions()
+    assert workflow.run(build_rows({'x2': [4]}, regions, bump=2)) == 1, 'a partition that fails to be repointed fails the publish'
+    after = workflow.get_partitions()
+    assert after[failing] == before[failing], 'the failed partition keeps its location'
+    assert all(workflow.count_files(location) for location in after.values()), 'no partition points at deleted files'
+    return len(workflow.get_partitions())
+
+def check_swap(root, regions):
+    workflow = Workflow(root, 'swap')
+    prod_table = PARAMETERS['raiderio_prod_table']
+    first = build_rows({'x1': [1, 2], 'x2': [3, 4]}, regions)
+    assert workflow.run(first) == 0 and workflow.get_rows() == get_expected(first), 'the first swap creates the production table'
+    before = workflow.get_partitions()
+
+    second = build_rows({'x2': [3, 4], 'x3': [5, 6]}, regions, bump=1)
+    assert workflow.run(second) == 0 and workflow.get_rows() == get_expected(second), 'the production table holds the rows of the latest run only'
+    after = workflow.get_partitions()
+    assert set(after) == {(expansion, region) for expansion in ['x2', 'x3'] for region in regions}, 'new partitions are created and missing ones removed'
+    assert all(after[('x2', region)] != before[('x2', region)] for region in regions), 'the partitions that are kept are repointed'
+
+    location = workflow.glue.tables[prod_table]['StorageDescriptor']['Location']
+    workflow.glue.failing_partitions = {('x4', regions[0])}
+    assert workflow.run(build_rows({'x3': [5, 6], 'x4': [7]}, regions, bump=2)) == 1, 'a partition that fails to be created fails the publish'
+    assert workflow.glue.tables[prod_table]['StorageDescriptor']['Location'] == location, 'the table is not repointed'
+    assert all(workflow.get_partitions()[values] == after[values] for values in after), 'no partition is repointed or removed'
+    return len(workflow.get_partitions())
+
+def check_snapshot(root, regions):
+    workflow = Workflow(root, 'snapshot')
+    prod_table = PARAMETERS['raiderio_prod_table']
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=2), today - datetime.timedelta(days=1), today]
+    seasons = {'x1': [1, 2]}
+    snapshot_rows = len(build_rows(seasons, regions))
+
+    first = build_rows(seasons, regions, ingested_at=f'{days[0]} 01:00:00')
+    second = build_rows(seasons, regions, bump=1, ingested_at=f'{days[0]} 02:00:00')
+    assert workflow.run(first, days[0]) == 0 and workflow.run(second, days[0]) == 0, 'two snapshots are published on the first day'
+    assert workflow.run(second, days[0]) == 0 and len(workflow.get_rows()) == 2 * snapshot_rows, 'a rerun appends no rows twice'
+    fragmented = workflow.get_partitions()
+    assert all(workflow.count_files(location) == 2 for location in fragmented.values()), 'every run adds a file to the partitions of its day'
+
+    assert workflow.run(build_rows(seasons, regions, bump=2, ingested_at=f'{days[1]} 01:00:00'), days[1]) == 0, 'a snapshot is published on the second day'
+    assert len(workflow.get_rows()) == 3 * snapshot_rows, 'compaction keeps every row'
+    partitions = workflow.glue.partitions[prod_table]
+    for values, location in fragmented.items():
+        partition = partitions[values]
+        assert partition['Parameters'].get('compacted') == 'true' and '/compacted/' in partition['StorageDescriptor']['Location'], 'the partitions of the first day are compacted and marked'
+        assert workflow.count_files(partition['StorageDescriptor']['Location']) == 1 and not workflow.count_files(location), 'a compacted partition is a single file and its small files are deleted'
+
+    workflow.s3.listed = []
+    latest = build_rows(seasons, regions, bump=3, ingested_at=f'{days[2]} 01:00:00')
+    assert workflow.run(latest, days[2]) == 0 and len(workflow.get_rows()) == 4 * snapshot_rows, 'a snapshot is published on the third day'
+    second_day = [partition for values, partition in partitions.items() if values[-1] == str(days[1])]
+    assert all(partition['Parameters'].get('compacted') == 'true' and '/compacted/' not in partition['StorageDescriptor']['Location'] for partition in second_day), 'a partition that is a single file is marked without being rewritten'
+    listed = {f's3://{prefix}' for prefix in workflow.s3.listed}
+    assert not any(partitions[values]['StorageDescriptor']['Location'] in listed for values in fragmented), 'marked partitions are not listed again'
+    assert workflow.get_rows(LATEST_TABLE) == get_expected(latest), 'the latest table holds the latest snapshot'
+    return len(workflow.get_partitions())
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the incremental, swap and snapshot publish modes against local stand-ins for AWS.')
+    parser.add_argument('--regions', default='us,eu', help='The comma separated regions to put rows onto the firehose for.')
+    args = parser.parse_args()
+
+    regions = args.regions.split(',')
+    # the jobs log every query, only their failures are of interest here
+    logging.basicConfig(level=logging.ERROR)
+    for mode, check in [('incremental', check_incremental), ('swap', check_swap), ('snapshot', check_snapshot)]:
+        with tempfile.TemporaryDirectory() as root:
+            partitions = check(root, regions)
+        print(f'{mode} publish checks passed, the production table ended with {partitions} partitions')
+
+if __name__ == '__main__':
+    main()
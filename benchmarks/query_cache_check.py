@@ -0,0 +1,89 @@
+"""
+Check the query cache of the dashboards against a summary table in DuckDB, without AWS.
+
+The summary query misses the cache once and is then served from it, also when written with other whitespace,
+while the table it reads stays the same. Queries that only differ in the whitespace inside a quoted literal have
+their own entries. Once a new version of the production table is recorded, as the publish job does after every
+publish, the query misses again and returns the new rows, the entries of the previous version are deleted, and the
+summary the dashboards read is rewritten with them.
+
+Usage:
+python benchmarks/query_cache_check.py --queries 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+GLUE_JOBS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'raiderio-glue-jobs')
+sys.path.insert(0, GLUE_JOBS_DIR)
+
+import query_cache
+from query_backend import DuckDBBackend
+
+DATABASE = 'raiderio'
+SUMMARY_QUERY = 'SELECT season_label, percentile, score FROM "raiderio"."raiderio_summary_table" ORDER BY season_label, percentile'
+
+def create_summary(backend, seasons):
+    """
+    Replace the summary table with one row per season and percentile.
+    """
+    backend.connection.execute(f'''
+        CREATE OR REPLACE TABLE raiderio_summary_table AS
+        SELECT 'Season ' || season AS season_label, percentile, CAST(3000 - season * 10 AS DOUBLE) AS score
+        FROM range(1, {seasons + 1}) AS seasons (season)
+        CROSS JOIN (VALUES ('p999'), ('p990'), ('p900')) AS percentiles (percentile)
+    ''')
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the query cache against a DuckDB summary table.')
+    parser.add_argument('--queries', type=int, default=20, help='The number of times the dashboard runs the summary query.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        backend = DuckDBBackend(DATABASE, root)
+        location = os.path.join(root, 'query-cache')
+        executed = []
+        def execute(sql):
+            executed.append(sql)
+            return backend.execute(sql)
+
+        create_summary(backend, 4)
+        query_cache.set_version(location, '2024_01_01_00_00_00_000000')
+        start_time = time.perf_counter()
+        rows = query_cache.publish_rows(SUMMARY_QUERY, execute, location, 'summary.json')
+        miss_seconds = time.perf_counter() - start_time
+        assert len(executed) == 1 and len(rows) == 12, 'the first query misses and runs against duckdb'
+
+        start_time = time.perf_counter()
+        for i in range(args.queries):
+            sql = SUMMARY_QUERY.replace(' ', '\n  ') + ';' if i % 2 else SUMMARY_QUERY
+            assert query_cache.get_rows(sql, execute, location) == rows, 'a hit returns the rows of the miss'
+        hit_seconds = (time.perf_counter() - start_time) / args.queries
+        assert len(executed) == 1, 'the same query with other whitespace is served from the cache'
+        season_query = "SELECT percentile, score FROM \"raiderio\".\"raiderio_summary_table\" WHERE season_label = 'Season 1'"
+        assert len(query_cache.get_rows(season_query, execute, location)) == 3, 'a query with a literal misses and runs against duckdb'
+        assert query_cache.get_rows(season_query.replace('Season 1', 'Season  1'), execute, location) == [], 'whitespace inside a literal is not normalized away'
+        assert len(executed) == 3, 'queries that differ inside a literal have their own cache entries'
+
+        # the table changes but the cache only finds out when a new version is recorded
+        create_summary(backend, 5)
+        assert query_cache.get_rows(SUMMARY_QUERY, execute, location) == rows and len(executed) == 3, 'the cache is not invalidated before a publish'
+        query_cache.set_version(location, '2024_01_02_00_00_00_000000')
+        assert not os.path.exists(os.path.join(location, '2024_01_01_00_00_00_000000')), 'the entries of the previous version are deleted'
+        rows = query_cache.publish_rows(SUMMARY_QUERY, execute, location, 'summary.json')
+        assert len(executed) == 4 and len(rows) == 15, 'a new version invalidates every cached result'
+        assert os.listdir(os.path.join(location, '2024_01_02_00_00_00_000000')) and sorted(os.listdir(location)) == ['2024_01_02_00_00_00_000000', 'summary.json', 'version'], 'only the entries of the new version are kept'
+        with open(os.path.join(location, 'summary.json')) as summary:
+            assert json.load(summary) == rows, 'the summary the dashboards read holds the rows of the new version'
+        backend.connection.close()
+
+    stats = query_cache.get_stats()
+    print(f"query cache checks passed: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{miss_seconds * 1000:.2f}ms for a miss, {hit_seconds * 1000:.2f}ms for a hit")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Check the purge routine the glue jobs and the lambda function share against an in-memory S3 with 100k keys,
+and measure the objects it deletes per second with a round trip latency on every call.
+
+The checks purge a whole bucket and a single prefix, and make sure that keys S3 fails to delete raise an error
+instead of being left behind. The benchmark then compares one delete_object request per key, the way the
+buckets used to be emptied, with batched delete_objects requests fanned out over a growing number of workers.
+
+Usage:
+python benchmarks/s3_purge_benchmark.py --keys 100000 --latency-ms 20 --delete-latency-ms 200 --workers 1,4,16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+GLUE_JOBS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'raiderio-glue-jobs')
+sys.path.insert(0, GLUE_JOBS_DIR)
+
+import s3_purge
+from fake_aws import InMemoryS3
+
+BUCKET = 'raiderio-benchmark'
+
+def create_keys(count):
+    """
+    Keys laid out like the output of the firehose, spread over hourly prefixes.
+    """
+    return [f'2024/01/{i // 24000 + 1:02d}/{i // 1000 % 24:02d}/raiderio-firehose-{i:06d}' for i in range(count)]
+
+def check_purge(count):
+    """
+    Check that a purge deletes every key of a bucket or of a prefix with batches of at most DELETE_BATCH_SIZE keys,
+    and that keys which fail to delete raise an error.
+    """
+    s3_client = InMemoryS3()
+    keys = create_keys(count)
+    s3_client.put_keys(BUCKET, keys)
+    prefix = keys[0].rpartition('/')[0] + '/'
+    in_prefix = s3_client.count_keys(BUCKET, prefix)
+    stats = s3_purge.purge(s3_client, BUCKET, prefix)
+    assert stats['objects'] == in_prefix and s3_client.count_keys(BUCKET, prefix) == 0, 'a purge of a prefix deletes every key under it'
+    assert s3_client.count_keys(BUCKET) == count - in_prefix, 'a purge of a prefix leaves every other key'
+
+    stats = s3_purge.purge(s3_client, BUCKET, max_workers=8)
+    assert stats['objects'] == count - in_prefix and s3_client.count_keys(BUCKET) == 0, 'a purge of a bucket deletes every key'
+    assert s3_client.largest_delete == s3_purge.DELETE_BATCH_SIZE, 'keys are deleted in full batches'
+    expected_calls = -(-(count - in_prefix) // s3_purge.DELETE_BATCH_SIZE) + -(-in_prefix // s3_purge.DELETE_BATCH_SIZE)
+    assert s3_client.calls['delete_objects'] == expected_calls, 'every page of keys is deleted with a single request'
+
+    failing = InMemoryS3(failing_keys={keys[1234]})
+    failing.put_keys(BUCKET, keys)
+    try:
+        s3_purge.purge(failing, BUCKET, max_workers=4)
+        raise AssertionError('a key that could not be deleted raises an error')
+    except Exception as e:
+        assert keys[1234] in str(e), 'the error names the key that could not be deleted'
+
+    failing = InMemoryS3(failing_keys={keys[5]})
+    failing.put_keys(BUCKET, keys[:10])
+    try:
+        s3_purge.delete_keys(failing, BUCKET, keys[:10])
+        raise AssertionError('a key that could not be deleted raises an error')
+    except Exception:
+        pass
+
+def measure_single_deletes(count, latency):
+    """
+    Delete keys with one delete_object request each, the way the buckets used to be emptied.
+
+    Returns:
+    float: The objects deleted per second.
+    """
+    s3_client = InMemoryS3(latency=latency)
+    keys = create_keys(count)
+    s3_client.put_keys(BUCKET, keys)
+    start_time = time.perf_counter()
+    for key in keys:
+        s3_client.delete_object(Bucket=BUCKET, Key=key)
+    return count / (time.perf_counter() - start_time)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and benchmark the batched S3 purge against an in-memory S3.')
+    parser.add_argument('--keys', type=int, default=100000, help='The number of keys in the bucket.')
+    parser.add_argument('--latency-ms', type=float, default=20, help='The milliseconds every list_objects_v2 and delete_object call takes.')
+    parser.add_argument('--delete-latency-ms', type=float, default=200, help='The milliseconds every delete_objects call of up to 1000 keys takes.')
+    parser.add_argument('--workers', default='1,4,16', help='The comma separated numbers of batches deleted at once.')
+    parser.add_argument('--single-delete-keys', type=int, default=200, help='The number of keys deleted one request at a time for comparison.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    check_purge(args.keys)
+    print(f'purge checks passed with {args.keys} keys')
+
+    latency = args.latency_ms / 1000
+    delete_latency = args.delete_latency_ms / 1000
+    results = {'keys': args.keys, 'latency_ms': args.latency_ms, 'delete_latency_ms': args.delete_latency_ms, 'purge': []}
+    results['delete_object_per_key'] = {'objects_per_second': measure_single_deletes(args.single_delete_keys, latency)}
+    for workers in [int(workers) for workers in args.workers.split(',')]:
+        s3_client = InMemoryS3(latency=latency, delete_latency=delete_latency)
+        s3_client.put_keys(BUCKET, create_keys(args.keys))
+        stats = s3_purge.purge(s3_client, BUCKET, max_workers=workers)
+        assert s3_client.count_keys(BUCKET) == 0
+        results['purge'].append({'workers': workers, **stats, 'requests': dict(s3_client.calls)})
+
+    print(f"one delete_object per key: {results['delete_object_per_key']['objects_per_second']:8.0f} objects/sec")
+    for run in results['purge']:
+        print(f"purge with {run['workers']:>2} workers:   {run['objects_per_second']:8.0f} objects/sec, "
+              f"{run['seconds']:.2f}s, {run['requests']['delete_objects']} delete_objects requests")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
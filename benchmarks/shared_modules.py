@@ -0,0 +1,61 @@
+"""
+Copy the helper modules the glue jobs share with the lambda function into the lambda function directory,
+or check that the copies there are up to date.
+
+The lambda function is deployed as a zip of its directory, so it holds a copy of every module it uses rather
+than a link to the glue jobs directory, which zip -y, SAM and CDK packaging and Windows checkouts do not follow.
+Edit the module in the glue jobs directory and run this to regenerate the copy.
+
+Usage:
+python benchmarks/shared_modules.py          # regenerate the copies
+python benchmarks/shared_modules.py --check  # fail if a copy differs from its module
+"""
+import os
+import sys
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GLUE_JOBS_DIR = os.path.join(REPO_ROOT, 'raiderio-glue-jobs')
+LAMBDA_DIR = os.path.join(REPO_ROOT, 'lambda-api-call')
+# the modules of the glue jobs directory that the lambda function uses
+SHARED_MODULES = ['s3_purge.py']
+
+def render(module):
+    """
+    The contents the copy of a shared module should have.
+    """
+    with open(os.path.join(GLUE_JOBS_DIR, module)) as source:
+        return f'# generated from raiderio-glue-jobs/{module} by benchmarks/shared_modules.py, edit that file instead\n' + source.read()
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the modules shared with the glue jobs into the lambda function directory.')
+    parser.add_argument('--check', action='store_true', help='Fail if a copy differs from its module instead of writing it.')
+    args = parser.parse_args()
+
+    stale = []
+    copied = []
+    for module in SHARED_MODULES:
+        path = os.path.join(LAMBDA_DIR, module)
+        expected = render(module)
+        current = None
+        if os.path.isfile(path) and not os.path.islink(path):
+            with open(path) as copy:
+                current = copy.read()
+        if current == expected:
+            continue
+        if args.check:
+            stale.append(module)
+            continue
+        if os.path.lexists(path):
+            os.remove(path)
+        with open(path, 'w') as copy:
+            copy.write(expected)
+        copied.append(module)
+        print(f'copied raiderio-glue-jobs/{module} to lambda-api-call/{module}')
+    if stale:
+        sys.exit(f"the copies of {', '.join(stale)} in lambda-api-call are out of date, run python benchmarks/shared_modules.py")
+    if not copied:
+        print(f"the copies of {', '.join(SHARED_MODULES)} in lambda-api-call are up to date")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare the latency of HTTPS requests made through the default HTTPAdapter of requests and through the
+SharedContextAdapter of the lambda function, which parses the CA bundle once and shares the TLS context.
+
+The server closes the connection after every response so that every request opens a new connection,
+as the lambda function does when raiderio closes an idle keep-alive connection.
+
+Usage:
+python benchmarks/tls_context_benchmark.py --requests 50 --output tls-context-results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda-api-call')
+sys.path.insert(0, LAMBDA_DIR)
+
+import requests
+import tls
+from tls_stub import create_certificates, start_server
+
+def create_bundle(directory, ca_file):
+    """
+    Write a CA bundle of the certifi bundle the lambda function uses and the authority of the stub server,
+    so that loading it costs as much as loading the real bundle.
+
+    Returns:
+    str: The path of the bundle.
+    """
+    bundle = os.path.join(directory, 'bundle.pem')
+    with open(bundle, 'w') as bundle_file:
+        for path in [requests.certs.where(), ca_file]:
+            with open(path) as certificates:
+                bundle_file.write(certificates.read())
+    return bundle
+
+def measure(adapter, url, bundle, count):
+    """
+    Make requests through an adapter with a new session.
+
+    Returns:
+    dict: The latency of the first request and the median and 95th percentile of the rest in milliseconds.
+    """
+    session = requests.Session()
+    session.mount('https://', adapter)
+    latencies = []
+    for _ in range(count + 1):
+        start_time = time.perf_counter()
+        session.get(url, verify=bundle).raise_for_status()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    session.close()
+    steady = latencies[1:]
+    return {
+        'first_request_ms': latencies[0],
+        'steady_state_median_ms': statistics.median(steady),
+        'steady_state_p95_ms': statistics.quantiles(steady, n=20)[-1] if len(steady) > 1 else steady[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark shared TLS contexts against a local TLS server.')
+    parser.add_argument('--requests', type=int, default=50, help='The number of requests after the first one.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ca_file, cert_file, key_file = create_certificates(directory)
+        bundle = create_bundle(directory, ca_file)
+        server = start_server(cert_file, key_file, close_connections=True)
+        url = f'https://localhost:{server.server_port}/'
+        try:
+            results = {'bundle_bytes': os.path.getsize(bundle), 'requests': args.requests}
+            results['default_adapter'] = measure(requests.adapters.HTTPAdapter(), url, bundle, args.requests)
+            results['shared_context_adapter'] = measure(tls.SharedContextAdapter(), url, bundle, args.requests)
+            results['contexts_created'], results['contexts_reused'] = tls.get_context_stats()
+        finally:
+            server.shutdown()
+
+    for name in ['default_adapter', 'shared_context_adapter']:
+        result = results[name]
+        print(f"{name:<24} first request {result['first_request_ms']:6.1f}ms, "
+              f"steady state median {result['steady_state_median_ms']:6.1f}ms, p95 {result['steady_state_p95_ms']:6.1f}ms")
+    print(f"tls contexts created: {results['contexts_created']}, reused: {results['contexts_reused']}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare the latency of new HTTPS connections made with full TLS handshakes and with resumed TLS sessions,
+through the SharedContextAdapter of the lambda function against a local TLS server.
+
+The server closes the connection after every response so that every request opens a new connection,
+as the lambda function does when raiderio closes an idle keep-alive connection.
+
+Usage:
+python benchmarks/tls_resumption_benchmark.py --requests 50 --output tls-resumption-results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda-api-call')
+sys.path.insert(0, LAMBDA_DIR)
+
+import requests
+import tls
+from tls_stub import create_certificates, start_server
+
+def measure(resume_sessions, url, ca_file, count):
+    """
+    Make requests that each need a new connection with a new session.
+
+    Returns:
+    dict: The median and 95th percentile latency in milliseconds along with the full and resumed handshakes seen by the client.
+    """
+    full_before, resumed_before = tls.get_handshake_stats()
+    session = requests.Session()
+    session.mount('https://', tls.SharedContextAdapter(resume_sessions=resume_sessions))
+    latencies = []
+    for _ in range(count):
+        start_time = time.perf_counter()
+        session.get(url, verify=ca_file).raise_for_status()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    session.close()
+    full_after, resumed_after = tls.get_handshake_stats()
+    return {
+        'median_ms': statistics.median(latencies),
+        'p95_ms': statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0],
+        'full_handshakes': full_after - full_before,
+        'resumed_handshakes': resumed_after - resumed_before
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TLS session resumption against a local TLS server.')
+    parser.add_argument('--requests', type=int, default=50, help='The number of requests to make in each mode.')
+    parser.add_argument('--output', help='The json file to write the results to.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ca_file, cert_file, key_file = create_certificates(directory)
+        server = start_server(cert_file, key_file, close_connections=True)
+        url = f'https://localhost:{server.server_port}/'
+        try:
+            results = {'requests': args.requests}
+            for name, resume_sessions in [('full_handshakes', False), ('resumed_sessions', True)]:
+                handshakes_before, resumed_before = server.handshakes, server.resumed
+                results[name] = measure(resume_sessions, url, ca_file, args.requests)
+                results[name]['server_resumed_handshakes'] = server.resumed - resumed_before
+                results[name]['server_handshakes'] = server.handshakes - handshakes_before
+        finally:
+            server.shutdown()
+
+    for name in ['full_handshakes', 'resumed_sessions']:
+        result = results[name]
+        print(f"{name:<18} median {result['median_ms']:6.2f}ms, p95 {result['p95_ms']:6.2f}ms, "
+              f"{result['server_resumed_handshakes']} of {result['server_handshakes']} handshakes resumed")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
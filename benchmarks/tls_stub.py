@@ -0,0 +1,104 @@
+"""
+A local HTTPS server for the TLS benchmarks, with a certificate authority of its own that is made with the openssl command.
+"""
+import os
+import ssl
+import json
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def create_certificates(directory):
+    """
+    Create a certificate authority and a certificate for localhost and 127.0.0.1 signed by it.
+
+    Parameters:
+    directory (str): The directory to write the keys and certificates to.
+
+    Returns:
+    tuple: The paths of the certificate of the authority, the certificate of the server and the key of the server.
+    """
+    ca_key = os.path.join(directory, 'ca.key')
+    ca_file = os.path.join(directory, 'ca.pem')
+    key_file = os.path.join(directory, 'server.key')
+    request_file = os.path.join(directory, 'server.csr')
+    cert_file = os.path.join(directory, 'server.pem')
+    extensions_file = os.path.join(directory, 'server.ext')
+    with open(extensions_file, 'w') as extensions:
+        extensions.write('subjectAltName = DNS:localhost, IP:127.0.0.1, IP:::1\n')
+    commands = [
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', ca_key, '-out', ca_file, '-days', '1', '-subj', '/CN=raiderio benchmark ca'],
+        ['openssl', 'req', '-newkey', 'rsa:2048', '-nodes', '-keyout', key_file, '-out', request_file, '-subj', '/CN=localhost'],
+        ['openssl', 'x509', '-req', '-in', request_file, '-CA', ca_file, '-CAkey', ca_key, '-CAcreateserial', '-out', cert_file, '-days', '1', '-extfile', extensions_file],
+    ]
+    for command in commands:
+        subprocess.run(command, check=True, capture_output=True)
+    return ca_file, cert_file, key_file
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with a small json body, closing the connection afterwards if close_connections is set.
+    """
+    protocol_version = 'HTTP/1.1'
+    close_connections = False
+    body = json.dumps({'cutoffs': {}}).encode('utf-8')
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        if self.close_connections:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TLSServer(ThreadingHTTPServer):
+    """
+    A threading HTTP server that wraps every connection in TLS and counts the handshakes that resumed a session.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, handler, context):
+        super().__init__(address, handler)
+        self.context = context
+        self.handshakes = 0
+        self.resumed = 0
+        self.lock = threading.Lock()
+
+    def get_request(self):
+        sock, address = super().get_request()
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), address
+
+    def finish_request(self, request, client_address):
+        try:
+            request.do_handshake()
+        except (ssl.SSLError, OSError):
+            return
+        with self.lock:
+            self.handshakes += 1
+            self.resumed += request.session_reused
+        super().finish_request(request, client_address)
+
+def start_server(cert_file, key_file, close_connections=False, host='127.0.0.1'):
+    """
+    Start an HTTPS server on a free port in a background thread.
+
+    Parameters:
+    cert_file (str): The certificate of the server.
+    key_file (str): The key of the server.
+    close_connections (bool): Whether the connection is closed after every response, so that every request needs a new handshake.
+    host (str): The address to listen on.
+
+    Returns:
+    TLSServer: The running server. Stop it with shutdown().
+    """
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_file, key_file)
+    handler = type('Handler', (StubHandler,), {'close_connections': close_connections})
+    server = TLSServer((host, 0), handler, context)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
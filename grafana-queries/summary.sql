@@ -0,0 +1,14 @@
+SELECT 
+  season_label,
+  percentile,
+  total_population as "Total # of Players",
+  population_in_percentile as "Population in Percentile",
+  score as "Mythic Plus Score"
+FROM 
+  raiderio_summary_table 
+WHERE
+  full_season NOT IN (1,2)
+  AND region = 'us'
+  AND faction = 'all'
+ORDER BY 
+  full_season;
\ No newline at end of file
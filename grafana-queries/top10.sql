@@ -1,11 +1,14 @@
 SELECT 
-  CONCAT(expansion, concat(' - S', cast(season as varchar(10)))) AS season_label,
-  population as "Total # of Players",
-  p900_population as "Population in Percentile",
-  p900 as "Mythic Plus Score"
+  season_label,
+  total_population as "Total # of Players",
+  population_in_percentile as "Population in Percentile",
+  score as "Mythic Plus Score"
 FROM 
-  raiderio_prod_table 
+  raiderio_summary_table 
 WHERE
-  full_season NOT IN (1,2)
+  percentile = 'p900'
+  AND full_season NOT IN (1,2)
+  AND region = 'us'
+  AND faction = 'all'
 ORDER BY 
   full_season;
\ No newline at end of file
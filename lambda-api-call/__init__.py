@@ -1,12 +1,72 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import lazy_imports
+# defer the packaged modules that a cold start does not need until they are used, see benchmarks/import_budget.py
+if os.environ.get('RAIDERIO_LAZY_IMPORTS') == '1':
+    lazy_imports.install()
 import requests
 import boto3
+import tls
+import resolver
+import s3_purge
 
-ssm_client = boto3.client('ssm')
-
-FACTION='all'
+# every season is fetched for each region and a cutoff row is written for each faction
+REGIONS = [region.strip() for region in os.environ.get('RAIDERIO_REGIONS', 'us').split(',') if region.strip()]
+FACTIONS = [faction.strip() for faction in os.environ.get('RAIDERIO_FACTIONS', 'all').split(',') if faction.strip()]
 FIREHOSE_BUCKET='raiderio-source-firehose-bucket-new-bill-jellesma'
+# the base url of the raiderio api, which can be pointed at a local stub server for benchmarks
+RAIDERIO_API_URL = os.environ.get('RAIDERIO_API_URL', 'https://raider.io/api/v1')
 PERCENTILES = ['p999', 'p990', 'p900', 'p750', 'p600']
-FIREHOSE_NAME = ssm_client.get_parameter(Name='raiderio_firehose_name', WithDecryption=True)['Parameter']['Value']
+# the columns of a cutoff row in the order they are written to the firehose
+CUTOFF_COLUMNS = ['expansion', 'season', 'full_season'] + [column for percentile in PERCENTILES for column in (percentile, f'{percentile}_population')] + ['population', 'faction', 'region', 'ingested_at']
+# cutoff rows are written as compact json so that the crawler and athena can read them with the json serde
+ROW_ENCODER = json.JSONEncoder(separators=(',', ':'))
+# put_record_batch accepts at most 500 records and 4 MiB per call, and at most 1,000 KiB per record
+FIREHOSE_BATCH_RECORDS = 500
+FIREHOSE_BATCH_BYTES = 4 * 1024 * 1024
+FIREHOSE_RECORD_BYTES = 1000 * 1024
+# the number of times a batch is sent before records that keep failing are given up on
+FIREHOSE_MAX_ATTEMPTS = 5
+# the number of season cutoff calls to raiderio that are allowed to be in flight at once
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('RAIDERIO_MAX_CONCURRENT_REQUESTS', 8))
+# where the fingerprint of every season is kept between runs, either s3://bucket/key or a local file
+# unchanged seasons are only skipped when this is set, which requires the incremental publish mode of the glue jobs
+FINGERPRINT_MANIFEST = os.environ.get('RAIDERIO_FINGERPRINT_MANIFEST')
+# new connections to raiderio resume the TLS session of the previous connection instead of doing a full handshake
+TLS_SESSION_RESUMPTION = os.environ.get('RAIDERIO_TLS_SESSION_RESUMPTION') == '1'
+# seconds that the addresses of raiderio and the aws endpoints are reused by a warm container before they are resolved again
+# hosts are resolved on every new connection if this is 0
+DNS_CACHE_TTL = float(os.environ.get('RAIDERIO_DNS_CACHE_TTL', 0))
+# seconds that a host that could not be resolved is not resolved again
+DNS_NEGATIVE_CACHE_TTL = 5
+# seconds that a new connection waits for an address of a host to connect before it also tries the next one, 0.25 is what RFC 8305 recommends
+# the addresses are tried one after the other if this is not set, so an address that does not answer costs a whole connect timeout
+CONNECTION_ATTEMPT_DELAY = float(os.environ['RAIDERIO_CONNECTION_ATTEMPT_DELAY']) if os.environ.get('RAIDERIO_CONNECTION_ATTEMPT_DELAY') else None
+# seconds that parameters from the parameter store are reused by a warm container before they are retrieved again
+PARAMETER_CACHE_TTL = 15 * 60
+# the session lives for as long as the lambda container is warm so connections to raiderio are kept alive between invocations
+# the pool is sized so that every concurrent call to raiderio can hold its own connection
+# its connections share a TLS context so the CA bundle is parsed once per container rather than once per connection
+http_adapter = tls.SharedContextAdapter(pool_connections=1, pool_maxsize=max(1, MAX_CONCURRENT_REQUESTS), resume_sessions=TLS_SESSION_RESUMPTION)
+session = requests.Session()
+session.mount('https://', http_adapter)
+session.mount('http://', http_adapter)
+# every urllib3 connection of the container resolves hosts through the cache and races their addresses, which includes the connections of boto3
+dns_cache = None
+if DNS_CACHE_TTL > 0:
+    dns_cache = resolver.CachingResolver(resolver.SystemResolver(), ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_CACHE_TTL)
+if dns_cache is not None or CONNECTION_ATTEMPT_DELAY is not None:
+    resolver.install(dns_cache or resolver.SystemResolver(), CONNECTION_ATTEMPT_DELAY)
+# parameters are retrieved from the parameter store the first time they are needed rather than when the container starts
+ssm_client = None
+parameters = {}
+parameters_loaded_at = None
+# seconds a call to raiderio is expected to take, updated after every run of a warm container
+expected_call_seconds = 0.5
+# seasons that have ended are marked as frozen because their cutoffs will never change again
 EXPANSIONS = [
     {
         'title' : 'Dragonflight',
@@ -14,15 +74,18 @@ EXPANSIONS = [
         'seasons': [
             {
                 'expansion_season': 1,
-                'full_season': 5
+                'full_season': 5,
+                'frozen': True
             },
             {
                 'expansion_season': 2,
-                'full_season': 6
+                'full_season': 6,
+                'frozen': True
             },
             {
                 'expansion_season': 3,
-                'full_season': 7
+                'full_season': 7,
+                'frozen': True
             },
             {
                 'expansion_season': 4,
@@ -36,72 +99,375 @@ EXPANSIONS = [
         'seasons': [
             {
                 'expansion_season': 1,
-                'full_season': 1
+                'full_season': 1,
+                'frozen': True
             },
             {
                 'expansion_season': 2,
-                'full_season': 2
+                'full_season': 2,
+                'frozen': True
             },
             {
                 'expansion_season': 3,
-                'full_season': 3
+                'full_season': 3,
+                'frozen': True
             },
             {
                 'expansion_season': 4,
-                'full_season': 4
+                'full_season': 4,
+                'frozen': True
             }
         ]
     },
 ]
+def get_parameter(name):
+    """
+    Retrieve a parameter from AWS Systems Manager Parameter Store, caching it for PARAMETER_CACHE_TTL seconds.
+
+    Parameters:
+    name (str): The name of the parameter to retrieve.
+
+    Returns:
+    str: The value of the parameter.
+    """
+    global ssm_client, parameters, parameters_loaded_at
+    if parameters_loaded_at is None or time.monotonic() - parameters_loaded_at > PARAMETER_CACHE_TTL:
+        parameters = {}
+        parameters_loaded_at = time.monotonic()
+    if name not in parameters:
+        if ssm_client is None:
+            ssm_client = boto3.client('ssm')
+        start_time = time.perf_counter()
+        parameters[name] = ssm_client.get_parameter(Name=name, WithDecryption=True)['Parameter']['Value']
+        print(f'retrieved parameter {name} in {time.perf_counter() - start_time:.3f}s')
+    return parameters[name]
+
+def get_season_key(expansion, season):
+    """
+    The key of a season in the raiderio api, for example df-3.
+    """
+    return f"{expansion['slug']}-{season['expansion_season']}"
+
+def get_fetch_plan():
+    """
+    Build the calls to raiderio that are needed for every season of EXPANSIONS in every region of REGIONS.
+
+    Returns:
+    list: One dict per call with the expansion, season and region to fetch,
+    and the key of the call in the fingerprint manifest, for example df-3-us.
+    """
+    return [
+        {
+            'expansion': expansion,
+            'season': season,
+            'region': region,
+            'key': f'{get_season_key(expansion, season)}-{region}'
+        }
+        for expansion in EXPANSIONS
+        for season in expansion['seasons']
+        for region in REGIONS
+    ]
+
+def load_fingerprints(s3_client):
+    """
+    Load the fingerprint of every season from FINGERPRINT_MANIFEST.
+
+    Parameters:
+    s3_client: The boto3 s3 client to use.
+
+    Returns:
+    dict: The fingerprint of every season keyed on the key of its call. Empty if there is no manifest yet.
+    """
+    if FINGERPRINT_MANIFEST.startswith('s3://'):
+        bucket, _, key = FINGERPRINT_MANIFEST.replace('s3://', '', 1).partition('/')
+        try:
+            return json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+        except s3_client.exceptions.NoSuchKey:
+            return {}
+    if not os.path.exists(FINGERPRINT_MANIFEST):
+        return {}
+    with open(FINGERPRINT_MANIFEST) as manifest:
+        return json.load(manifest)
+
+def save_fingerprints(s3_client, fingerprints):
+    """
+    Save the fingerprint of every season to FINGERPRINT_MANIFEST.
+
+    Parameters:
+    s3_client: The boto3 s3 client to use.
+    fingerprints (dict): The fingerprint of every season keyed on the key of its call.
+    """
+    body = json.dumps(fingerprints, indent=2, sort_keys=True)
+    if FINGERPRINT_MANIFEST.startswith('s3://'):
+        bucket, _, key = FINGERPRINT_MANIFEST.replace('s3://', '', 1).partition('/')
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode('utf-8'), ContentType='application/json')
+    else:
+        with open(FINGERPRINT_MANIFEST, 'w') as manifest:
+            manifest.write(body)
+
+def get_fingerprint(fingerprints, call):
+    """
+    Look up the fingerprint of a call from the previous run.
+
+    The rows of a season are only unchanged if they were taken for the same factions, so a fingerprint
+    that was taken for other factions, or before the factions were part of the fingerprint, is a miss.
+
+    Parameters:
+    fingerprints (dict): The fingerprint of every season keyed on the key of its call.
+    call (dict): The call from the fetch plan.
+
+    Returns:
+    dict: The fingerprint of the call, or None if there is none for the factions of FACTIONS.
+    """
+    fingerprint = fingerprints.get(call['key'])
+    if fingerprint and fingerprint.get('factions') == sorted(FACTIONS):
+        return fingerprint
+    return None
+
+def get_season_cutoff(expansion, season, region, fingerprint=None):
+    """
+    Retrieve the score cutoffs of a single season and region from the raiderio api.
+
+    When the fingerprint of the previous run is given, the request is conditional and
+    the season is reported as unchanged if neither raiderio nor the cutoffs have changed.
+
+    Parameters:
+    expansion (dict): The expansion from EXPANSIONS that the season belongs to.
+    season (dict): The season to retrieve the cutoffs for.
+    region (str): The region to retrieve the cutoffs for.
+    fingerprint (dict): The fingerprint of the season from the previous run.
+
+    Returns:
+    tuple: The cutoff rows for the season, one per faction of FACTIONS, or None if they are unchanged,
+    and the new fingerprint of the season. All values of the cutoff rows are 0 if the data could not be retrieved.
+    """
+    url = f"{RAIDERIO_API_URL}/mythic-plus/season-cutoffs?season=season-{get_season_key(expansion, season)}&region={region}"
+    headers = {}
+    if fingerprint:
+        if fingerprint.get('etag'):
+            headers['If-None-Match'] = fingerprint['etag']
+        if fingerprint.get('last_modified'):
+            headers['If-Modified-Since'] = fingerprint['last_modified']
+    response = session.get(url, headers=headers)
+    if response.status_code == 304:
+        return None, fingerprint
+    # keep the data of the previous run rather than overwriting it with zeros
+    if response.status_code != 200 and fingerprint:
+        return None, fingerprint
+
+    cutoff_rows = []
+    cutoff = response.json().get('cutoffs') if response.status_code == 200 else None
+    for faction in FACTIONS:
+        cutoff_row = {}
+        cutoff_row['expansion'] = expansion['title']
+        cutoff_row['season'] = season['expansion_season']
+        cutoff_row['full_season'] = season['full_season']
+        cutoff_row['faction'] = faction
+        cutoff_row['region'] = region
+        # if we can't successfully get the data
+        if cutoff is None:
+            for percentile in PERCENTILES:
+                cutoff_row[percentile] = 0
+                cutoff_row[f'{percentile}_population'] = 0
+                cutoff_row['population'] = 0
+        else:
+            for percentile in PERCENTILES:
+                cutoff_row[percentile] = cutoff[percentile][faction]["quantileMinValue"]
+                cutoff_row[f'{percentile}_population'] = cutoff[percentile][faction]["quantilePopulationCount"]
+                # because the total population is always the same, we don't need to get that for every percentil
+                if not 'population' in cutoff_row:
+                    cutoff_row['population'] = cutoff[percentile][faction]["totalPopulationCount"]
+        cutoff_rows.append(cutoff_row)
+    if cutoff is None:
+        return cutoff_rows, None
+
+    new_fingerprint = {
+        'hash': hashlib.sha256(json.dumps(cutoff_rows, sort_keys=True).encode('utf-8')).hexdigest(),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'frozen': season.get('frozen', False),
+        'factions': sorted(FACTIONS)
+    }
+    if fingerprint and fingerprint.get('hash') == new_fingerprint['hash']:
+        return None, new_fingerprint
+    return cutoff_rows, new_fingerprint
+
+def serialize_cutoff_row(cutoff_row):
+    """
+    Serialize a cutoff row as a line of newline delimited json with the columns of CUTOFF_COLUMNS.
+
+    Parameters:
+    cutoff_row (dict): The cutoff row to serialize.
+
+    Returns:
+    bytes: The json object of the row, ending with a newline.
+    """
+    return (ROW_ENCODER.encode({column: cutoff_row[column] for column in CUTOFF_COLUMNS}) + '\n').encode('utf-8')
+
+def batch_records(records):
+    """
+    Pack records into batches that fit within the limits of a single put_record_batch call.
+
+    Parameters:
+    records (list): The records to pack, as bytes.
+
+    Returns:
+    list: The batches of records.
+
+    Raises:
+    Exception: If any record is larger than FIREHOSE_RECORD_BYTES, before any batch is packed.
+    """
+    # the firehose rejects the whole call for a record over the limit, so none are sent rather than some
+    oversized = [i for i, record in enumerate(records) if len(record) > FIREHOSE_RECORD_BYTES]
+    if oversized:
+        raise Exception(f"{len(oversized)} records are larger than the {FIREHOSE_RECORD_BYTES} bytes the firehose accepts, first is record {oversized[0]} with {len(records[oversized[0]])} bytes")
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for record in records:
+        if batch and (len(batch) == FIREHOSE_BATCH_RECORDS or batch_bytes + len(record) > FIREHOSE_BATCH_BYTES):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(record)
+        batch_bytes += len(record)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def put_records(fh, records):
+    """
+    Put records onto the firehose with put_record_batch, retrying only the records that failed.
+
+    Parameters:
+    fh: The boto3 firehose client to use.
+    records (list): The records to put, as bytes.
+
+    Returns:
+    dict: The number of records, bytes and retries along with the records/sec and bytes/sec.
+
+    Raises:
+    Exception: If any record is larger than FIREHOSE_RECORD_BYTES or records are still failing after FIREHOSE_MAX_ATTEMPTS attempts.
+    """
+    start_time = time.perf_counter()
+    retries = 0
+    batches = batch_records(records)
+    firehose_name = get_parameter('raiderio_firehose_name')
+    for batch in batches:
+        pending = batch
+        attempt = 1
+        while True:
+            reply = fh.put_record_batch(DeliveryStreamName=firehose_name, Records=[{'Data': record} for record in pending])
+            if reply['FailedPutCount'] == 0:
+                break
+            failed = [(record, result) for record, result in zip(pending, reply['RequestResponses']) if result.get('ErrorCode')]
+            if attempt >= FIREHOSE_MAX_ATTEMPTS:
+                raise Exception(f"{len(failed)} records could not be put onto the firehose, first error: {failed[0][1].get('ErrorMessage')}")
+            pending = [record for record, _ in failed]
+            retries += len(pending)
+            time.sleep(min(0.1 * 2 ** attempt, 5))
+            attempt += 1
+    elapsed = time.perf_counter() - start_time
+    total_bytes = sum(len(record) for record in records)
+    return {
+        'records': len(records),
+        'bytes': total_bytes,
+        'retries': retries,
+        'records_per_second': len(records) / elapsed if elapsed > 0 else 0,
+        'bytes_per_second': total_bytes / elapsed if elapsed > 0 else 0
+    }
+
+def get_connection_stats():
+    """
+    Count the connections opened and the requests made by the shared session.
+
+    Returns:
+    tuple: The number of connections opened (each of which is a new TLS handshake) and the number of requests made.
+    """
+    connections = 0
+    requests_made = 0
+    pools = http_adapter.poolmanager.pools
+    for pool_key in pools.keys():
+        pool = pools.get(pool_key)
+        if pool is not None:
+            connections += pool.num_connections
+            requests_made += pool.num_requests
+    return connections, requests_made
+
 def lambda_handler(event,context):
     # delete all objects in the bucket
     s3_client = boto3.client('s3')
-    while True:
-        objects = s3_client.list_objects(Bucket=FIREHOSE_BUCKET)
-        content = objects.get('Contents', [])
-        if len(content) == 0:
-            break
-        for obj in content:
-            s3_client.delete_object(Bucket=FIREHOSE_BUCKET, Key=obj['Key'])
+    purge_stats = s3_purge.purge(s3_client, FIREHOSE_BUCKET)
+    print(f"deleted {purge_stats['objects']} objects from {FIREHOSE_BUCKET} in {purge_stats['seconds']:.2f}s ({purge_stats['objects_per_second']:.0f} objects/sec)")
     # connect to firehose and put records from raiderio
     fh = boto3.client('firehose')
-    cutoff_table = ''
-    for expansion in EXPANSIONS:
-        for season in expansion['seasons']:
-            cutoff_row = {}
-            cutoff_row['expansion'] = expansion['title']
-            cutoff_row['season'] = season['expansion_season']
-            cutoff_row['full_season'] = season['full_season']
-            url = f"https://raider.io/api/v1/mythic-plus/season-cutoffs?season=season-{expansion['slug']}-{season['expansion_season']}&region=us"
-            response = requests.get(url)
-            # if we can't successfully get the data
-            if response.status_code != 200:
-                for percentile in PERCENTILES:
-                    cutoff_row[percentile] = 0
-                    cutoff_row[f'{percentile}_population'] = 0
-                    cutoff_row['population'] = 0
-            else:
-                data = response.json()
-                cutoff = data.get('cutoffs')
-                for percentile in PERCENTILES:
-                    cutoff_row[percentile] = cutoff[percentile][FACTION]["quantileMinValue"]
-                    cutoff_row[f'{percentile}_population'] = cutoff[percentile][FACTION]["quantilePopulationCount"]
-                    # because the total population is always the same, we don't need to get that for every percentil
-                    if not 'population' in cutoff_row:
-                        cutoff_row['population'] = cutoff[percentile][FACTION]["totalPopulationCount"]
-            cutoff_table += str(cutoff_row) + '\n'
-
-    # put the record onto the firehose
-    reply = fh.put_record(
-            DeliveryStreamName=FIREHOSE_NAME,
-            Record = {
-                    'Data': cutoff_table
-                    }
-        )
-    print(f'reply: {reply}')
+    global expected_call_seconds
+    fingerprints = load_fingerprints(s3_client) if FINGERPRINT_MANIFEST else {}
+    connections_before, requests_before = get_connection_stats()
+    plan = get_fetch_plan()
+    # frozen seasons that we already have the data for are never fetched again
+    frozen = [call for call in plan if (get_fingerprint(fingerprints, call) or {}).get('frozen')]
+    plan = [call for call in plan if not (get_fingerprint(fingerprints, call) or {}).get('frozen')]
+    workers = max(1, MAX_CONCURRENT_REQUESTS)
+    expected_seconds = -(-len(plan) // workers) * expected_call_seconds
+    print(f'fetch plan: {len(plan)} calls across {len(REGIONS)} regions and {len(FACTIONS)} factions, '
+          f'{workers} at a time, expected to take {expected_seconds:.1f}s')
+    # the calls to raiderio are independent so we make them concurrently
+    # map returns the results in the order of the plan so the output is the same as doing them one at a time
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda call: get_season_cutoff(call['expansion'], call['season'], call['region'], get_fingerprint(fingerprints, call)), plan))
+    elapsed = time.perf_counter() - start_time
+    print(f'fetch plan took {elapsed:.1f}s')
+    if plan:
+        # the average time of a call, accounting for the calls that were made at the same time
+        expected_call_seconds = elapsed / -(-len(plan) // workers)
+    connections_after, requests_after = get_connection_stats()
+    handshakes = connections_after - connections_before
+    reused = (requests_after - requests_before) - handshakes
+    print(f'handshakes performed: {handshakes}, connections reused: {reused}')
+    contexts_created, contexts_reused = tls.get_context_stats()
+    print(f'tls contexts created: {contexts_created}, reused: {contexts_reused}')
+    if TLS_SESSION_RESUMPTION:
+        handshakes_full, handshakes_resumed = tls.get_handshake_stats()
+        print(f'tls handshakes full: {handshakes_full}, resumed: {handshakes_resumed}')
+    if dns_cache is not None:
+        dns_stats = dns_cache.get_stats()
+        print(f"dns lookups: {dns_stats['lookups']}, saved by the cache: {dns_stats['hits'] + dns_stats['negative_hits']}")
+
+    cutoff_rows = []
+    misses = 0
+    for call, (season_rows, fingerprint) in zip(plan, results):
+        if fingerprint:
+            fingerprints[call['key']] = fingerprint
+        if season_rows is not None:
+            cutoff_rows.extend(season_rows)
+            misses += 1
+    hits = len(frozen) + len(plan) - misses
+    print(f'fingerprint hits: {hits} ({len(frozen)} frozen), misses: {misses}')
+    if not cutoff_rows:
+        if FINGERPRINT_MANIFEST:
+            save_fingerprints(s3_client, fingerprints)
+        return {
+            'statusCode': 200,
+            'body': 'No seasons have changed. Nothing was put onto the firehose.'
+        }
+
+    # every row of a run shares the time it was ingested so the snapshot publish mode can keep the history of each season
+    # this is added after the fingerprints are taken so that it does not make every season look changed
+    ingested_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    for cutoff_row in cutoff_rows:
+        cutoff_row['ingested_at'] = ingested_at
+    # put the records onto the firehose, one row per record
+    stats = put_records(fh, [serialize_cutoff_row(cutoff_row) for cutoff_row in cutoff_rows])
+    print(f"put {stats['records']} records ({stats['bytes']} bytes) onto the firehose with {stats['retries']} retries, "
+          f"{stats['records_per_second']:.0f} records/sec, {stats['bytes_per_second']:.0f} bytes/sec")
+    # the fingerprints are only saved once the changed seasons are safely on the firehose
+    if FINGERPRINT_MANIFEST:
+        save_fingerprints(s3_client, fingerprints)
     response = 'All was successful! Logs are located in CloudWatch.'
     
     return {
-        'statusCode': reply['ResponseMetadata']['HTTPStatusCode'],
+        'statusCode': 200,
         'body': response
     }
@@ -0,0 +1,90 @@
+import os
+import re
+import sys
+import types
+import threading
+import importlib.abc
+import importlib.machinery
+
+# the packaged modules that are deferred, keyed on the file of the package that holds its __version__
+# charset_normalizer is only used by requests to guess the encoding of a response that does not declare one
+# idna is only used by requests for hostnames that are not ascii
+# boto3 and the botocore it imports are the largest part of a cold start and are only needed once the handler creates its clients
+LAZY_MODULES = {
+    'charset_normalizer': 'version.py',
+    'idna': 'package_data.py',
+    'boto3': '__init__.py',
+}
+VERSION_PATTERN = re.compile(r'''^__version__\s*=\s*['"]([^'"]+)['"]''', re.MULTILINE)
+
+class DeferredModule(types.ModuleType):
+    """
+    A module whose code is only run the first time one of its attributes is used.
+
+    Attributes that are set before then, such as __name__, __path__ and __version__, never cause the code to run.
+    The code is run under a lock so that threads using the module while it loads wait for it rather than finding it empty.
+    """
+    def __getattr__(self, name):
+        lock = self.__dict__.get('__deferred_lock__')
+        if lock is None:
+            raise AttributeError(f'module {self.__name__!r} has no attribute {name!r}')
+        with lock:
+            loader = self.__dict__.pop('__deferred_loader__', None)
+            if loader is not None:
+                try:
+                    loader.exec_module(self)
+                except BaseException:
+                    self.__deferred_loader__ = loader
+                    raise
+                self.__class__ = types.ModuleType
+                del self.__deferred_lock__
+        # the thread that loads the module finds it partly initialized while it imports its own submodules, like any other import
+        if name in self.__dict__:
+            return self.__dict__[name]
+        raise AttributeError(f'module {self.__name__!r} has no attribute {name!r}')
+
+class DeferredLoader(importlib.abc.Loader):
+    """
+    Wraps the loader of a module so that the module is a DeferredModule.
+    """
+    def __init__(self, loader, version_file):
+        self.loader = loader
+        self.version_file = version_file
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        module.__deferred_loader__ = self.loader
+        # reentrant so that the module can import its own submodules while it is loaded
+        module.__deferred_lock__ = threading.RLock()
+        # requests checks the version of charset_normalizer when it is imported, which is read without running the package
+        for location in module.__spec__.submodule_search_locations or []:
+            path = os.path.join(location, self.version_file)
+            if os.path.exists(path):
+                with open(path) as version_file:
+                    match = VERSION_PATTERN.search(version_file.read())
+                if match:
+                    module.__version__ = match.group(1)
+                break
+        module.__class__ = DeferredModule
+
+class DeferredFinder(importlib.abc.MetaPathFinder):
+    """
+    Finds the modules of LAZY_MODULES and defers them.
+    """
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in LAZY_MODULES:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or spec.loader is None:
+            return None
+        spec.loader = DeferredLoader(spec.loader, LAZY_MODULES[fullname])
+        return spec
+
+def install():
+    """
+    Defer the modules of LAZY_MODULES that are imported from now on until they are used.
+    """
+    if not any(isinstance(finder, DeferredFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, DeferredFinder())
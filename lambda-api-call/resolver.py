@@ -0,0 +1,280 @@
+import os
+import abc
+import time
+import errno
+import socket
+import threading
+import selectors
+from urllib3.util import connection
+from urllib3.util.timeout import _DEFAULT_TIMEOUT
+from urllib3.exceptions import LocationParseError
+
+class Resolver(abc.ABC):
+    """
+    Resolves a host and port to the addresses to connect to. Subclass this to plug in another way of resolving hosts.
+    """
+    @abc.abstractmethod
+    def resolve(self, host, port, family):
+        """
+        Resolve a host and port.
+
+        Parameters:
+        host (str): The host to resolve.
+        port (int): The port to connect to.
+        family (int): The address family to resolve for, such as socket.AF_UNSPEC.
+
+        Returns:
+        list: Tuples of (family, type, proto, canonname, sockaddr) like socket.getaddrinfo returns.
+
+        Raises:
+        socket.gaierror: If the host cannot be resolved.
+        """
+
+class SystemResolver(Resolver):
+    """
+    Resolves hosts with socket.getaddrinfo, which is what urllib3 does on its own.
+    """
+    def resolve(self, host, port, family):
+        return socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+
+class CachingResolver(Resolver):
+    """
+    Caches the addresses another resolver returns for a number of seconds, and the hosts it could not resolve for a shorter time.
+
+    getaddrinfo does not return the TTL of the DNS records so every address is cached for the same time.
+
+    Parameters:
+    resolver (Resolver): The resolver to cache.
+    ttl (float): Seconds that the addresses of a host are reused.
+    negative_ttl (float): Seconds that a host that could not be resolved is not resolved again.
+    clock (callable): Returns the current time in seconds, time.monotonic by default.
+    """
+    def __init__(self, resolver, ttl=60, negative_ttl=5, clock=time.monotonic):
+        self.resolver = resolver
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        # the time an entry expires, the addresses or None if the host could not be resolved, and the arguments of the error
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.negative_hits = 0
+
+    def resolve(self, host, port, family):
+        key = (host, port, family)
+        with self.lock:
+            self.lookups += 1
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                if entry[1] is None:
+                    self.negative_hits += 1
+                    raise socket.gaierror(*entry[2])
+                self.hits += 1
+                return entry[1]
+        # the lock is not held while resolving so that a slow lookup of one host does not hold up the others
+        try:
+            addresses = self.resolver.resolve(host, port, family)
+        except socket.gaierror as e:
+            with self.lock:
+                self.entries[key] = (self.clock() + self.negative_ttl, None, e.args)
+            raise
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, addresses, None)
+        return addresses
+
+    def get_stats(self):
+        """
+        Count the lookups and the lookups that were saved by the cache.
+
+        Returns:
+        dict: The number of lookups, the lookups answered with cached addresses and the lookups answered with a cached failure.
+        """
+        with self.lock:
+            return {'lookups': self.lookups, 'hits': self.hits, 'negative_hits': self.negative_hits}
+
+# the resolver of create_connection, set with install()
+resolver = SystemResolver()
+# seconds that create_connection waits for an address to connect before it also tries the next one, set with install()
+# the addresses are tried one after the other like urllib3 does if this is None
+connection_attempt_delay = None
+
+def interleave_families(addresses):
+    """
+    Order addresses so that their families alternate, starting with the family of the first one, as RFC 8305 recommends.
+
+    Parameters:
+    addresses (list): Tuples like socket.getaddrinfo returns.
+
+    Returns:
+    list: The same tuples, with the order within each family kept.
+    """
+    families = {}
+    for address in addresses:
+        families.setdefault(address[0], []).append(address)
+    ordered = []
+    while families:
+        for family in list(families):
+            ordered.append(families[family].pop(0))
+            if not families[family]:
+                del families[family]
+    return ordered
+
+def race_connections(addresses, timeout, source_address, socket_options):
+    """
+    Connect to addresses the way RFC 8305 does, starting an attempt on the next address every connection_attempt_delay seconds
+    or as soon as an attempt fails, and keeping the first socket that connects.
+
+    Parameters:
+    addresses (list): Tuples like socket.getaddrinfo returns, in the order to try them.
+    timeout (float): Seconds that each attempt is given to connect, or None to wait as long as the system does.
+    source_address (tuple): The host and port to bind the sockets to before connecting.
+    socket_options (list): Tuples of the arguments of setsockopt to set before connecting.
+
+    Returns:
+    socket: The connected socket, in non-blocking mode.
+
+    Raises:
+    OSError: The error of the last attempt that failed if none of the addresses could be connected to.
+    """
+    pending = list(addresses)
+    # the sockets that are still connecting and the time each one times out
+    attempts = {}
+    selector = selectors.DefaultSelector()
+    next_attempt = time.monotonic()
+    winner = None
+    err = None
+    try:
+        while winner is None and (pending or attempts):
+            now = time.monotonic()
+            if pending and (not attempts or now >= next_attempt):
+                af, socktype, proto, _, sa = pending.pop(0)
+                sock = None
+                try:
+                    sock = socket.socket(af, socktype, proto)
+                    connection._set_socket_options(sock, socket_options)
+                    if source_address:
+                        sock.bind(source_address)
+                    sock.setblocking(False)
+                    result = sock.connect_ex(sa)
+                    if result == 0:
+                        winner = sock
+                        break
+                    if result not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                        raise OSError(result, os.strerror(result))
+                except OSError as e:
+                    # the next address is tried straight away when an attempt fails
+                    err = e
+                    if sock is not None:
+                        sock.close()
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE)
+                attempts[sock] = None if timeout is None else now + timeout
+                next_attempt = now + connection_attempt_delay
+            deadlines = [deadline for deadline in attempts.values() if deadline is not None]
+            if pending:
+                deadlines.append(next_attempt)
+            wait = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                del attempts[sock]
+                result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if result == 0:
+                    winner = sock
+                    break
+                err = OSError(result, os.strerror(result))
+                sock.close()
+                next_attempt = time.monotonic()
+            if winner is not None:
+                break
+            now = time.monotonic()
+            for sock, deadline in list(attempts.items()):
+                if deadline is not None and now >= deadline:
+                    selector.unregister(sock)
+                    del attempts[sock]
+                    sock.close()
+                    err = socket.timeout('timed out')
+                    next_attempt = now
+    finally:
+        # the attempts that lost the race are cancelled
+        for sock in attempts:
+            sock.close()
+        selector.close()
+    if winner is not None:
+        return winner
+    if err is not None:
+        raise err
+    raise OSError('getaddrinfo returns an empty list')
+
+def create_connection(address, timeout=_DEFAULT_TIMEOUT, source_address=None, socket_options=None):
+    """
+    Connect to an address, resolving its host with the installed resolver.
+
+    This is urllib3.util.connection.create_connection with socket.getaddrinfo replaced by the resolver.
+    If connection_attempt_delay is set and the host has more than one address, the addresses are raced instead of tried one after the other,
+    so that an address that does not answer, such as a blackholed IPv6 address, does not cost a whole timeout.
+
+    Parameters:
+    address (tuple): The host and port to connect to.
+    timeout (float): The timeout of the socket, the default timeout of sockets if not given.
+    source_address (tuple): The host and port to bind the socket to before connecting.
+    socket_options (list): Tuples of the arguments of setsockopt to set before connecting.
+
+    Returns:
+    socket: The connected socket.
+
+    Raises:
+    OSError: The error of the last address that was tried if none of them could be connected to.
+    """
+    host, port = address
+    if host.startswith('['):
+        host = host.strip('[]')
+    try:
+        host.encode('idna')
+    except UnicodeError:
+        raise LocationParseError(f"'{host}', label empty or too long") from None
+    addresses = resolver.resolve(host, port, connection.allowed_gai_family())
+    if connection_attempt_delay is not None and len(addresses) > 1:
+        sock = race_connections(
+            interleave_families(addresses),
+            socket.getdefaulttimeout() if timeout is _DEFAULT_TIMEOUT else timeout,
+            source_address, socket_options
+        )
+        # the socket goes back to the timeout it would have had if it had been connected on its own
+        sock.settimeout(socket.getdefaulttimeout() if timeout is _DEFAULT_TIMEOUT else timeout)
+        return sock
+    err = None
+    for af, socktype, proto, _, sa in addresses:
+        sock = None
+        try:
+            sock = socket.socket(af, socktype, proto)
+            connection._set_socket_options(sock, socket_options)
+            if timeout is not _DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sa)
+            return sock
+        except OSError as e:
+            err = e
+            if sock is not None:
+                sock.close()
+    if err is not None:
+        raise err
+    raise OSError('getaddrinfo returns an empty list')
+
+def install(new_resolver, new_connection_attempt_delay=None):
+    """
+    Make every urllib3 connection of the process, including those of boto3, resolve hosts with a resolver.
+
+    Parameters:
+    new_resolver (Resolver): The resolver to use.
+    new_connection_attempt_delay (float): Seconds to wait for an address to connect before also trying the next one,
+    RFC 8305 recommends 0.25. The addresses are tried one after the other if this is None.
+    """
+    global resolver, connection_attempt_delay
+    resolver = new_resolver
+    connection_attempt_delay = new_connection_attempt_delay
+    # urllib3 looks create_connection up on the module every time it opens a connection
+    connection.create_connection = create_connection
@@ -0,0 +1,161 @@
+import os
+import ssl
+import threading
+import requests
+from requests.utils import DEFAULT_CA_BUNDLE_PATH, extract_zipped_paths
+from urllib3.util.ssl_ import create_urllib3_context
+
+# TLS contexts keyed on the verify and cert arguments of requests and the options of the context
+# a context holds the parsed CA bundle, so every connection pool of the container shares a context instead of parsing the bundle again
+contexts = {}
+contexts_lock = threading.Lock()
+contexts_created = 0
+contexts_reused = 0
+# the CA bundle that requests uses when verify is True, resolved once rather than on every request
+default_ca_bundle = None
+# the latest TLS session of each host and port, for the contexts that resume sessions
+sessions = {}
+sessions_lock = threading.Lock()
+handshakes_full = 0
+handshakes_resumed = 0
+
+class SessionSavingSSLSocket(ssl.SSLSocket):
+    """
+    An SSLSocket that saves its session for the next connection to the same host and port.
+
+    The session is saved after the first read because TLS 1.3 servers only send the session ticket once the handshake is over.
+    """
+    session_key = None
+
+    def read(self, len=1024, buffer=None):
+        data = super().read(len, buffer)
+        if self.session_key is not None:
+            session = self.session
+            if session is not None and session.has_ticket:
+                with sessions_lock:
+                    sessions[self.session_key] = session
+                self.session_key = None
+        return data
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    An SSLContext that resumes the latest session of a host and port when it connects to it again,
+    so that the connection skips the key exchange of a full handshake.
+    """
+    sslsocket_class = SessionSavingSSLSocket
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True, server_hostname=None, session=None):
+        global handshakes_full, handshakes_resumed
+        key = (server_hostname, sock.getpeername()[1]) if not server_side else None
+        if session is None and key is not None:
+            with sessions_lock:
+                session = sessions.get(key)
+        ssl_sock = super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs, server_hostname, session)
+        if key is not None:
+            ssl_sock.session_key = key
+            with sessions_lock:
+                if ssl_sock.session_reused:
+                    handshakes_resumed += 1
+                else:
+                    handshakes_full += 1
+        return ssl_sock
+
+def get_ssl_context(verify=True, cert=None, resume_sessions=False, **options):
+    """
+    Retrieve the TLS context for the verify and cert arguments of a request, creating it the first time.
+
+    Parameters:
+    verify (bool or str): Whether the certificate of the server is verified, or the path of the CA bundle or directory to verify it with.
+    cert (str or tuple): The client certificate, or the client certificate and its key.
+    resume_sessions (bool): Whether connections resume the TLS session of the previous connection to the same host and port.
+    options: The keyword arguments of create_urllib3_context, such as ssl_minimum_version.
+
+    Returns:
+    SSLContext: The shared context.
+    """
+    global contexts_created, contexts_reused, default_ca_bundle
+    key = (verify, tuple(cert) if isinstance(cert, (list, tuple)) else cert, resume_sessions, tuple(sorted(options.items())))
+    with contexts_lock:
+        context = contexts.get(key)
+        if context is not None:
+            contexts_reused += 1
+            return context
+        context = create_urllib3_context(**options)
+        if resume_sessions:
+            # the context keeps every option urllib3 set, only how it wraps sockets changes
+            context.__class__ = ResumingSSLContext
+            # urllib3 turns session tickets off, which would leave nothing to resume with TLS 1.2
+            context.options &= ~ssl.OP_NO_TICKET
+        if verify:
+            if verify is True:
+                if default_ca_bundle is None:
+                    default_ca_bundle = extract_zipped_paths(DEFAULT_CA_BUNDLE_PATH)
+                location = default_ca_bundle
+            else:
+                location = verify
+            if not location or not os.path.exists(location):
+                raise OSError(f'Could not find a suitable TLS CA certificate bundle, invalid path: {location}')
+            if os.path.isdir(location):
+                context.load_verify_locations(capath=location)
+            else:
+                context.load_verify_locations(cafile=location)
+        else:
+            context.check_hostname = False
+        if cert:
+            if isinstance(cert, (list, tuple)):
+                context.load_cert_chain(cert[0], cert[1])
+            else:
+                context.load_cert_chain(cert)
+        contexts[key] = context
+        contexts_created += 1
+        return context
+
+def get_context_stats():
+    """
+    Count the TLS contexts that were created and the times a context was reused.
+
+    Returns:
+    tuple: The number of contexts created and the number of times one was reused.
+    """
+    return contexts_created, contexts_reused
+
+def get_handshake_stats():
+    """
+    Count the TLS handshakes of the contexts that resume sessions.
+
+    Returns:
+    tuple: The number of full handshakes and the number of handshakes that resumed a session.
+    """
+    return handshakes_full, handshakes_resumed
+
+class SharedContextAdapter(requests.adapters.HTTPAdapter):
+    """
+    An HTTPAdapter whose HTTPS connections use the shared TLS contexts of get_ssl_context.
+
+    Requests otherwise hands urllib3 the path of the CA bundle, which loads it into a new context for every connection.
+
+    Parameters:
+    resume_sessions (bool): Whether new connections resume the TLS session of the previous connection to the same host.
+    """
+    __attrs__ = requests.adapters.HTTPAdapter.__attrs__ + ['resume_sessions']
+
+    def __init__(self, *args, resume_sessions=False, **kwargs):
+        # this is needed by init_poolmanager, which the constructor of HTTPAdapter calls
+        self.resume_sessions = resume_sessions
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=requests.adapters.DEFAULT_POOLBLOCK, **pool_kwargs):
+        pool_kwargs.setdefault('ssl_context', get_ssl_context(resume_sessions=self.resume_sessions))
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        if not url.lower().startswith('https'):
+            super().cert_verify(conn, url, verify, cert)
+            return
+        # the CA bundle and client certificate are already loaded into the context so urllib3 is not given them again
+        conn.conn_kw['ssl_context'] = get_ssl_context(verify, cert, resume_sessions=self.resume_sessions)
+        conn.cert_reqs = 'CERT_REQUIRED' if verify else 'CERT_NONE'
+        conn.ca_certs = None
+        conn.ca_cert_dir = None
+        conn.cert_file = None
+        conn.key_file = None
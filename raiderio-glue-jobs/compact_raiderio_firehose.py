@@ -0,0 +1,189 @@
+import boto3
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ssm_config import get_ssm_parameter
+from s3_purge import delete_keys
+
+# Set up logging and AWS resources
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+s3_client = boto3.client('s3')
+
+# the prefix of the firehose bucket that the compacted files are written to and that the crawler reads from
+# the lambda function empties the whole bucket, so the compacted files are replaced on every run like the firehose files
+COMPACTED_PREFIX = 'compacted/'
+# the prefix of the firehose bucket that records which firehose objects have been compacted, outside of what the crawler reads
+MANIFEST_PREFIX = 'compaction-manifests/'
+# the size that each compacted file is filled up to before the next one is started
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+# the number of rows that are held in memory before they are written to the compacted file as a row group
+ROWS_PER_ROW_GROUP = 100000
+PERCENTILES = ['p999', 'p990', 'p900', 'p750', 'p600']
+# the columns the lambda function writes to the firehose, columns missing from older rows are written as null
+SCHEMA = pa.schema(
+    [('expansion', pa.string()), ('season', pa.int64()), ('full_season', pa.int64())]
+    + [field for percentile in PERCENTILES for field in ((percentile, pa.float64()), (f'{percentile}_population', pa.int64()))]
+    + [('population', pa.int64()), ('faction', pa.string()), ('region', pa.string()), ('ingested_at', pa.string())]
+)
+
+FIREHOSE_BUCKET = get_ssm_parameter('raiderio_firehose_bucket')
+
+def list_partitions(bucket):
+    """
+    List the objects the firehose has written, grouped by the prefix they were written under.
+
+    Parameters:
+    bucket (str): Name of the firehose bucket.
+
+    Returns:
+    dict: The keys and sizes of the objects keyed on their prefix, such as 2024/01/02/03/.
+    """
+    partitions = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            if obj['Key'].startswith((COMPACTED_PREFIX, MANIFEST_PREFIX)) or obj['Key'].endswith('/'):
+                continue
+            prefix = obj['Key'].rpartition('/')[0]
+            partitions.setdefault(f'{prefix}/' if prefix else '', []).append((obj['Key'], obj['Size']))
+    return partitions
+
+def get_source_id(keys):
+    """
+    Name the compacted files of a set of firehose objects after the objects, so that compacting the same objects again
+    overwrites the files rather than adding a second copy of their rows.
+
+    Parameters:
+    keys (list): Keys of the firehose objects.
+
+    Returns:
+    str: A hash of the sorted keys.
+    """
+    return hashlib.sha256('\n'.join(sorted(keys)).encode('utf-8')).hexdigest()[:16]
+
+def load_compacted_keys(bucket):
+    """
+    Read the keys of the firehose objects that an earlier run compacted but may not have finished deleting.
+
+    Parameters:
+    bucket (str): Name of the firehose bucket.
+
+    Returns:
+    set: The keys recorded in every manifest under MANIFEST_PREFIX.
+    """
+    compacted = set()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=MANIFEST_PREFIX):
+        for obj in page.get('Contents', []):
+            manifest = json.loads(s3_client.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read())
+            compacted.update(manifest['keys'])
+    return compacted
+
+def read_rows(bucket, keys):
+    """
+    Stream the rows of newline delimited json objects without holding an object in memory.
+
+    Parameters:
+    bucket (str): Name of the firehose bucket.
+    keys (list): Keys of the objects to read.
+
+    Yields:
+    dict: Each row of each object.
+    """
+    for key in keys:
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+        for line in body.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+def compact_partition(bucket, prefix, keys):
+    """
+    Merge the objects of a partition into Snappy Parquet files of about TARGET_FILE_BYTES each.
+
+    Rows are written a row group at a time to a local file that is uploaded once it is full, so memory stays bounded
+    by ROWS_PER_ROW_GROUP whatever the size of the partition.
+
+    Parameters:
+    bucket (str): Name of the firehose bucket.
+    prefix (str): The prefix of the partition.
+    keys (list): Keys of the objects of the partition.
+
+    Returns:
+    list: The key and size of each compacted file that was written.
+    """
+    source_id = get_source_id(keys)
+    files = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'compacted.parquet')
+        writer = None
+        rows = []
+
+        def upload():
+            writer.close()
+            key = f'{COMPACTED_PREFIX}{prefix}{source_id}-{len(files):05d}.snappy.parquet'
+            s3_client.upload_file(path, bucket, key)
+            files.append((key, os.path.getsize(path)))
+
+        for row in read_rows(bucket, keys):
+            rows.append(row)
+            if len(rows) < ROWS_PER_ROW_GROUP:
+                continue
+            if writer is None:
+                writer = pq.ParquetWriter(path, SCHEMA, compression='snappy')
+            writer.write_table(pa.Table.from_pylist(rows, schema=SCHEMA))
+            rows = []
+            if os.path.getsize(path) >= TARGET_FILE_BYTES:
+                upload()
+                writer = None
+        if rows:
+            if writer is None:
+                writer = pq.ParquetWriter(path, SCHEMA, compression='snappy')
+            writer.write_table(pa.Table.from_pylist(rows, schema=SCHEMA))
+        if writer is not None:
+            upload()
+    return files
+
+try:
+    start_time = time.perf_counter()
+    partitions = list_partitions(FIREHOSE_BUCKET)
+    compacted = load_compacted_keys(FIREHOSE_BUCKET)
+    files_before = sum(len(objects) for objects in partitions.values())
+    bytes_before = sum(size for objects in partitions.values() for _, size in objects)
+    files_after = 0
+    bytes_after = 0
+    for prefix, objects in sorted(partitions.items()):
+        # objects an earlier run compacted and then failed to delete are only deleted, compacting them again would duplicate their rows
+        leftover = [key for key, _ in objects if key in compacted]
+        if leftover:
+            delete_keys(s3_client, FIREHOSE_BUCKET, leftover)
+            logger.info(f"Deleted {len(leftover)} objects of {prefix or '/'} that were already compacted")
+        keys = [key for key, _ in objects if key not in compacted]
+        if not keys:
+            continue
+        files = compact_partition(FIREHOSE_BUCKET, prefix, keys)
+        # the objects are recorded as compacted before any of them is deleted, so a run that fails while deleting can be rerun
+        s3_client.put_object(
+            Bucket=FIREHOSE_BUCKET,
+            Key=f'{MANIFEST_PREFIX}{prefix}{get_source_id(keys)}.json',
+            Body=json.dumps({'keys': sorted(keys), 'files': [key for key, _ in files]}).encode('utf-8'),
+            ContentType='application/json'
+        )
+        # the firehose files are only deleted once the partition is safely compacted
+        delete_keys(s3_client, FIREHOSE_BUCKET, keys)
+        files_after += len(files)
+        bytes_after += sum(size for _, size in files)
+        logger.info(f"Compacted {len(keys)} objects of {prefix or '/'} into {len(files)} files")
+    logger.info(
+        f"Compacted {len(partitions)} partitions of {FIREHOSE_BUCKET} in {time.perf_counter() - start_time:.2f}s: "
+        f"{files_before} files ({bytes_before} bytes) before, {files_after} files ({bytes_after} bytes) after"
+    )
+except Exception as e:
+    logger.error(f"Failed to execute job: {str(e)}")
+    sys.exit(1)  # Exit with error code 1 to indicate failure to AWS Glue
@@ -0,0 +1,56 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+def run_timed(func):
+    """
+    Run a function and measure how long it took.
+
+    Parameters:
+    func (callable): The function to run, taking no arguments.
+
+    Returns:
+    float: The number of seconds the function took.
+    """
+    start_time = time.perf_counter()
+    func()
+    return time.perf_counter() - start_time
+
+def run_steps(steps, max_workers=None):
+    """
+    Run steps as soon as the steps they depend on have finished, running independent steps at the same time.
+
+    Parameters:
+    steps (dict): The steps to run keyed on their name. Each step is a tuple of the function to run,
+    taking no arguments, and the list of names of the steps it depends on.
+    max_workers (int): The number of steps that are allowed to run at once. Defaults to the number of steps.
+
+    Returns:
+    dict: The number of seconds each step took keyed on its name.
+
+    Raises:
+    ValueError: If steps depend on steps that do not exist or on each other.
+    Exception: The first exception raised by a step. Steps that are already running are allowed to finish.
+    """
+    latencies = {}
+    remaining = dict(steps)
+    running = {}
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(steps))) as executor:
+        while remaining or running:
+            ready = [name for name, (_, dependencies) in remaining.items() if all(dependency in latencies for dependency in dependencies)]
+            for name in ready:
+                func, _ = remaining.pop(name)
+                logger.info(f"Starting step {name}")
+                running[executor.submit(run_timed, func)] = name
+            if not running:
+                raise ValueError(f"Steps {', '.join(remaining)} depend on steps that do not exist or on each other")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                latencies[name] = future.result()
+                logger.info(f"Step {name} finished in {latencies[name]:.2f}s")
+    logger.info(f"All steps finished in {time.perf_counter() - start_time:.2f}s, the sum of the steps was {sum(latencies.values()):.2f}s")
+    return latencies
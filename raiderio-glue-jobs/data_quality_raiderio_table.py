@@ -1,83 +1,71 @@
-# boto3 is still needed to interact with the parameter store
-import boto3
 # use awswrangler over boto3 to more efficiently write a csv to s3
 import awswrangler as wr
+import pandas as pd
 import datetime
 import sys
 import logging
+from ssm_config import get_ssm_parameter
+from query_backend import get_backend
+from dq_rules import RULES, get_violations_query, get_violation_bitmap, count_violations
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
-ssm_client = boto3.client('ssm')
-
-def get_ssm_parameter(param_name):
-    """
-    Retrieve a parameter from AWS Systems Manager Parameter Store.
-
-    Parameters:
-    param_name (str): The name of the parameter to retrieve.
-
-    Returns:
-    str: The value of the parameter.
-
-    Raises:
-    SystemExit: If the parameter cannot be retrieved due to it not existing or other AWS errors.
-    """
-    try:
-        # Attempt to retrieve the parameter
-        response = ssm_client.get_parameter(Name=param_name, WithDecryption=True)
-        return response['Parameter']['Value']
-    except ssm_client.exceptions.ParameterNotFound as e:
-        # Log the error and the parameter name if not found
-        logger.error(f"Parameter retrieval failed for {param_name}: {str(e)}")
-        sys.exit(f"Parameter retrieval failed for {param_name}: {str(e)}")
-    except Exception as e:
-        # Handle other possible exceptions
-        logger.error(f"An error occurred while retrieving {param_name}: {str(e)}")
-        sys.exit(f"An error occurred while retrieving {param_name}: {str(e)}")
 
 # Retrieve parameters safely
 DATABASE = get_ssm_parameter('raiderio_database')
 TEMP_TABLE = get_ssm_parameter('raiderio_temp_table')
 DATA_QUALITY_BUCKET = get_ssm_parameter('raiderio_data_quality_bucket')
+TEMP_BUCKET = get_ssm_parameter('raiderio_temp_bucket')
+QUERY_OUTPUT_BUCKET = get_ssm_parameter('raiderio_query_results_bucket')
+backend = get_backend(DATABASE, QUERY_OUTPUT_BUCKET)
 
 current_date = datetime.date.today()
 
-# Define the query to identify zeros in the percentile columns
-RANGE_CHECK = f"""
-SELECT 
-    *,
-     CASE WHEN p999 < 0 OR p999 > 5000 THEN 'Out of range' ELSE 'OK' END AS p999_check,
-    CASE WHEN p990 < 0 OR p990 > 5000 THEN 'Out of range' ELSE 'OK' END AS p990_check,
-    CASE WHEN p900 < 0 OR p900 > 5000 THEN 'Out of range' ELSE 'OK' END AS p900_check,
-    CASE WHEN p750 < 0 OR p750 > 5000 THEN 'Out of range' ELSE 'OK' END AS p750_check,
-    CASE WHEN p600 < 0 OR p600 > 5000 THEN 'Out of range' ELSE 'OK' END AS p600_check
-FROM 
-    {DATABASE}.{TEMP_TABLE}
-"""
-try:
-    # Run the quality check query
-    df = wr.athena.read_sql_query(sql=RANGE_CHECK, database=DATABASE)
+# athena: the rules are evaluated by the query backend and only the rows that violate them are returned
+# parquet: the parquet files of the temporary table are read a chunk at a time and the rules are evaluated here
+DQ_ENGINE = get_ssm_parameter('raiderio_dq_engine', default='athena')
+
+def find_violations_athena():
+    """
+    Find the rows of the temporary table that violate the rules with a single query.
 
-    # Filter DataFrame to include only rows with 'Zero found'
-    zero_rows = df[
-        (df['p999_check'] == 'Out of range') |
-        (df['p990_check'] == 'Out of range') |
-        (df['p900_check'] == 'Out of range') |
-        (df['p750_check'] == 'Out of range') |
-        (df['p600_check'] == 'Out of range')
-    ]
+    Returns:
+    DataFrame: The rows that violate at least one rule, with their violation bitmap.
+    """
+    return backend.read_sql(get_violations_query(RULES, f'{DATABASE}.{TEMP_TABLE}'))
+
+def find_violations_parquet():
+    """
+    Find the rows of the temporary table that violate the rules by reading its parquet files a chunk at a time.
+
+    Returns:
+    DataFrame: The rows that violate at least one rule, with their violation bitmap.
+    """
+    violations = []
+    for chunk in wr.s3.read_parquet(path=f's3://{TEMP_BUCKET}/', dataset=True, chunked=True):
+        bitmap = get_violation_bitmap(chunk, RULES)
+        violating = bitmap != 0
+        if violating.any():
+            violations.append(chunk[violating].assign(violation_bitmap=bitmap[violating]))
+    return pd.concat(violations, ignore_index=True) if violations else pd.DataFrame()
+
+try:
+    # Run the quality check
+    violations = find_violations_parquet() if DQ_ENGINE == 'parquet' else find_violations_athena()
 
-    # Check if any rows have zeros
-    if not zero_rows.empty:
+    # Check if any rows violate the rules
+    if not violations.empty:
+        for name, count in count_violations(violations['violation_bitmap'], RULES).items():
+            if count:
+                logger.error(f'Data quality rule {name} failed for {count} rows.')
         # Write the problematic rows to an S3 bucket
-        output_path = F's3://{DATA_QUALITY_BUCKET}/dq_check_{current_date}/range_check.csv'
-        wr.s3.to_csv(df=zero_rows, path=output_path, index=False)
-        logger.error(f'Zero value check failed.')
+        output_path = F's3://{DATA_QUALITY_BUCKET}/dq_check_{current_date}/violations.csv'
+        wr.s3.to_csv(df=violations, path=output_path, index=False)
+        logger.error(f'Data quality check failed for {len(violations)} rows.')
         sys.exit(1)
     else:
-        logger.info('Zero value check passed. No issues found.')
+        logger.info(f'Data quality check passed for {len(RULES)} rules. No issues found.')
 except Exception as e:
     logger.error(f"SQL query execution failed: {str(e)}")
     # Parse the exception message to react differently based on error types
@@ -85,4 +73,4 @@ except Exception as e:
         logger.error("There was a syntax error in your SQL query.")
     elif "ResourceNotFoundException" in str(e):
         logger.error("The specified table or database does not exist.")
-    sys.exit(1)
\ No newline at end of file
+    sys.exit(1)
@@ -1,84 +1,55 @@
 import boto3
 import sys
 import logging
+from ssm_config import get_ssm_parameter
+from query_backend import get_backend, AthenaBackend
+from dag_runner import run_steps
+from s3_purge import purge
 
 # Set up logging and AWS resources
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
-ssm_client = boto3.client('ssm')
-athena_client = boto3.client('athena')
 s3_client = boto3.client('s3')
 
-def get_ssm_parameter(param_name):
-    """
-    Retrieve a parameter from AWS Systems Manager Parameter Store.
-
-    Parameters:
-    param_name (str): The name of the parameter to retrieve.
-
-    Returns:
-    str: The value of the parameter.
-
-    Raises:
-    SystemExit: If the parameter cannot be retrieved due to it not existing or other AWS errors.
-    """
-    try:
-        response = ssm_client.get_parameter(Name=param_name, WithDecryption=True)
-        return response['Parameter']['Value']
-    except ssm_client.exceptions.ParameterNotFound as e:
-        logger.error(f"Parameter retrieval failed for {param_name}: {str(e)}")
-        sys.exit(f"Parameter retrieval failed for {param_name}: {str(e)}")
-    except Exception as e:
-        logger.error(f"An error occurred while retrieving {param_name}: {str(e)}")
-        sys.exit(f"An error occurred while retrieving {param_name}: {str(e)}")
+# the number of delete_objects calls that are allowed to be in flight at once
+PURGE_WORKERS = 4
 
-def execute_query(query, database, output_bucket):
+def execute_query(query, backend):
     """
-    Execute an SQL query using Amazon Athena.
+    Execute an SQL query and wait for it to finish.
 
     Parameters:
-    query (str): SQL query string to be executed.
-    database (str): Database to execute the query against.
-    output_bucket (str): S3 bucket to store query execution results.
-
-    Returns:
-    str: The Query Execution ID from Athena.
+    query (dict): The name of the query and the SQL query string to be executed.
+    backend (AthenaBackend or DuckDBBackend): The query backend to execute the query with.
 
     Raises:
     SystemExit: If the query fails to execute.
     """
     try:
-        response = athena_client.start_query_execution(
-            QueryString=query['sql'],
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': f's3://{output_bucket}'}
-        )
-        query_execution_id = response['QueryExecutionId']
-        logger.info(f"Query {query['name']} executed with ID: {query_execution_id}")
-        return query_execution_id
+        backend.execute(query['sql'])
+        logger.info(f"Query {query['name']} executed")
     except Exception as e:
         logger.error(f"Query execution failed: {str(e)}")
         sys.exit(1)
 
-def empty_s3_bucket(bucket):
+def empty_s3_bucket(bucket, max_workers=1):
     """
     Empty all objects from a specified S3 bucket.
 
     Parameters:
     bucket (str): Name of the S3 bucket to be emptied.
+    max_workers (int): The number of batches that are allowed to be deleted at once.
+
+    Returns:
+    int: The number of objects deleted.
 
     Raises:
     SystemExit: If unable to delete objects from the bucket.
     """
     try:
-        while True:
-            objects = s3_client.list_objects(Bucket=bucket)
-            content = objects.get('Contents', [])
-            if len(content) == 0:
-                break
-            for obj in content:
-                s3_client.delete_object(Bucket=bucket, Key=obj['Key'])
-        logger.info("S3 bucket emptied successfully.")
+        stats = purge(s3_client, bucket, max_workers=max_workers)
+        logger.info(f"S3 bucket {bucket} emptied successfully. Deleted {stats['objects']} objects in {stats['seconds']:.2f}s ({stats['objects_per_second']:.0f} objects/sec).")
+        return stats['objects']
     except Exception as e:
         logger.error(f"Failed to empty bucket {bucket}: {str(e)}")
         sys.exit(1)
@@ -90,6 +61,8 @@ if __name__ == "__main__":
     PROD_TABLE = get_ssm_parameter('raiderio_prod_table')
     TEMP_BUCKET = get_ssm_parameter('raiderio_temp_bucket')
     QUERY_OUTPUT_BUCKET = get_ssm_parameter('raiderio_query_results_bucket')
+    PUBLISH_MODE = get_ssm_parameter('raiderio_publish_mode', default='full')
+    backend = get_backend(DATABASE, QUERY_OUTPUT_BUCKET)
 
     temp_table_query = {
         'name': 'Deletion of temporary source table',
@@ -100,10 +73,20 @@ if __name__ == "__main__":
         'sql': f'DROP TABLE IF EXISTS {DATABASE}.{PROD_TABLE};'
     }
 
-    # Execute SQL statements to drop tables
-    for query in [temp_table_query, prod_table_query]:
-        execute_query(query, DATABASE, QUERY_OUTPUT_BUCKET)
-
-    # Empty the bucket with the temp files and the query results bucket, we'll leave the prod bucket)
-    empty_s3_bucket(TEMP_BUCKET)
-    empty_s3_bucket(QUERY_OUTPUT_BUCKET)
+    # The tables are dropped at the same time and each bucket is emptied once the tables using it are gone
+    # an incremental publish only rewrites the changed partitions of the production table, a swap publish repoints it
+    # and a snapshot publish appends to it, so in all of these cases it needs to be kept
+    keep_prod_table = PUBLISH_MODE in ['incremental', 'swap', 'snapshot']
+    drop_steps = ['drop temp table'] if keep_prod_table else ['drop temp table', 'drop prod table']
+    steps = {
+        'drop temp table': (lambda: execute_query(temp_table_query, backend), []),
+    }
+    if not keep_prod_table:
+        steps['drop prod table'] = (lambda: execute_query(prod_table_query, backend), [])
+    # the duckdb backend empties a location itself before it creates a table there
+    if isinstance(backend, AthenaBackend):
+        # Empty the bucket with the temp files and the query results bucket, we'll leave the prod bucket
+        steps['purge temp bucket'] = (lambda: empty_s3_bucket(TEMP_BUCKET, max_workers=PURGE_WORKERS), ['drop temp table'])
+        # the drops write their results to the query results bucket so it is emptied last
+        steps['purge query results bucket'] = (lambda: empty_s3_bucket(QUERY_OUTPUT_BUCKET, max_workers=PURGE_WORKERS), drop_steps)
+    run_steps(steps)
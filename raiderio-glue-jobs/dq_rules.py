@@ -0,0 +1,148 @@
+import numpy as np
+
+PERCENTILES = ['p999', 'p990', 'p900', 'p750', 'p600']
+
+# The rules every row of the cutoff tables must follow, each rule is one bit of a row's violation bitmap
+# range: the column is between min and max
+# not_null: the column has a value
+# descending: each column is at least as large as the column after it
+# at_most: each column is no larger than the limit column
+RULES = (
+    [{'name': f'{percentile}_range', 'type': 'range', 'column': percentile, 'min': 0, 'max': 5000} for percentile in PERCENTILES]
+    + [{'name': f'{column}_not_null', 'type': 'not_null', 'column': column} for column in PERCENTILES + ['population']]
+    + [{'name': 'percentile_order', 'type': 'descending', 'columns': PERCENTILES}]
+    + [{'name': 'population_consistency', 'type': 'at_most', 'columns': [f'{percentile}_population' for percentile in PERCENTILES], 'limit': 'population'}]
+)
+# the violation bitmap of a row has to fit in a signed 64 bit athena bigint
+MAX_RULES = 63
+
+def check_rules(rules):
+    """
+    Make sure the rules fit in a violation bitmap.
+
+    Parameters:
+    rules (list): The rules to check.
+
+    Raises:
+    ValueError: If there are more than MAX_RULES rules.
+    """
+    if len(rules) > MAX_RULES:
+        raise ValueError(f"{len(rules)} rules do not fit in a violation bitmap of {MAX_RULES} bits")
+
+def get_violation_condition(rule):
+    """
+    Build the SQL condition that is true when a row violates a rule.
+
+    Parameters:
+    rule (dict): The rule to build the condition for.
+
+    Returns:
+    str: The SQL condition. It is never null so that it can be counted and filtered on.
+
+    Raises:
+    ValueError: If the type of the rule is unknown.
+    """
+    if rule['type'] == 'range':
+        condition = f"{rule['column']} < {rule['min']} OR {rule['column']} > {rule['max']}"
+    elif rule['type'] == 'not_null':
+        condition = f"{rule['column']} IS NULL"
+    elif rule['type'] == 'descending':
+        columns = rule['columns']
+        condition = ' OR '.join(f'{larger} < {smaller}' for larger, smaller in zip(columns, columns[1:]))
+    elif rule['type'] == 'at_most':
+        condition = ' OR '.join(f"{column} > {rule['limit']}" for column in rule['columns'])
+    else:
+        raise ValueError(f"Unknown rule type {rule['type']} for rule {rule['name']}")
+    return f'COALESCE({condition}, FALSE)'
+
+def get_violations_query(rules, table):
+    """
+    Build a single query that returns only the rows of a table that violate at least one rule.
+
+    Each row is returned with a violation_bitmap column in which bit i is set when the row violates rules[i].
+
+    Parameters:
+    rules (list): The rules to check.
+    table (str): The table to check, including its database.
+
+    Returns:
+    str: The SQL query.
+    """
+    check_rules(rules)
+    conditions = [get_violation_condition(rule) for rule in rules]
+    bitmap = '\n        + '.join(f'IF({condition}, {1 << bit}, 0)' for bit, condition in enumerate(conditions))
+    return f"""
+    SELECT
+        *,
+        {bitmap} AS violation_bitmap
+    FROM
+        {table}
+    WHERE
+        {' OR '.join(conditions)}
+    """
+
+def get_violation_mask(df, rule):
+    """
+    Evaluate a rule over every row of a DataFrame at once.
+
+    Missing values only violate not_null rules, the same as in get_violation_condition.
+
+    Parameters:
+    df (DataFrame): The rows to check.
+    rule (dict): The rule to evaluate.
+
+    Returns:
+    ndarray: A boolean array that is true for the rows that violate the rule.
+
+    Raises:
+    ValueError: If the type of the rule is unknown.
+    """
+    if rule['type'] == 'range':
+        values = df[rule['column']].to_numpy(dtype='float64', na_value=np.nan)
+        return (values < rule['min']) | (values > rule['max'])
+    if rule['type'] == 'not_null':
+        return df[rule['column']].isna().to_numpy()
+    if rule['type'] == 'descending':
+        values = [df[column].to_numpy(dtype='float64', na_value=np.nan) for column in rule['columns']]
+        mask = np.zeros(len(df), dtype=bool)
+        for larger, smaller in zip(values, values[1:]):
+            mask |= larger < smaller
+        return mask
+    if rule['type'] == 'at_most':
+        limit = df[rule['limit']].to_numpy(dtype='float64', na_value=np.nan)
+        mask = np.zeros(len(df), dtype=bool)
+        for column in rule['columns']:
+            mask |= df[column].to_numpy(dtype='float64', na_value=np.nan) > limit
+        return mask
+    raise ValueError(f"Unknown rule type {rule['type']} for rule {rule['name']}")
+
+def get_violation_bitmap(df, rules):
+    """
+    Evaluate every rule over every row of a DataFrame.
+
+    Parameters:
+    df (DataFrame): The rows to check.
+    rules (list): The rules to check.
+
+    Returns:
+    ndarray: The violation bitmap of every row, bit i is set when the row violates rules[i].
+    """
+    check_rules(rules)
+    bitmap = np.zeros(len(df), dtype=np.uint64)
+    for bit, rule in enumerate(rules):
+        bitmap |= get_violation_mask(df, rule).astype(np.uint64) << np.uint64(bit)
+    return bitmap
+
+def count_violations(bitmap, rules):
+    """
+    Count the rows that violate each rule.
+
+    Parameters:
+    bitmap (ndarray): The violation bitmap of every row.
+    rules (list): The rules that the bitmap was built from.
+
+    Returns:
+    dict: The number of rows that violate each rule keyed on the name of the rule.
+    """
+    bitmap = np.asarray(bitmap, dtype=np.uint64)
+    return {rule['name']: int(np.count_nonzero(bitmap & np.uint64(1 << bit))) for bit, rule in enumerate(rules)}
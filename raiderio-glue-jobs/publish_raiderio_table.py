@@ -1,28 +1,40 @@
+import re
 import boto3
 from datetime import datetime
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from ssm_config import get_ssm_parameter
+from query_backend import get_backend
+from s3_purge import purge
+import query_cache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
-ssm_client = boto3.client('ssm')
-client = boto3.client('athena')
-
-def get_ssm_parameter(param_name):
-    try:
-        # Attempt to retrieve the parameter
-        response = ssm_client.get_parameter(Name=param_name, WithDecryption=True)
-        return response['Parameter']['Value']
-    except ssm_client.exceptions.ParameterNotFound as e:
-        # Log the error and the parameter name if not found
-        logger.error(f"Parameter retrieval failed for {param_name}: {str(e)}")
-        sys.exit(f"Parameter retrieval failed for {param_name}: {str(e)}")
-    except Exception as e:
-        # Handle other possible exceptions
-        logger.error(f"An error occurred while retrieving {param_name}: {str(e)}")
-        sys.exit(f"An error occurred while retrieving {param_name}: {str(e)}")
+glue_client = boto3.client('glue')
+s3_client = boto3.client('s3')
 
+# the types of partition column whose values need to be quoted in a query
+STRING_TYPES = ['string', 'varchar', 'char']
+PERCENTILES = ['p999', 'p990', 'p900', 'p750', 'p600']
+# the number of objects that are copied from the temporary bucket at once
+COPY_WORKERS = 16
+# batch_create_partition and batch_update_partition accept at most 100 partitions per call, batch_delete_partition 25
+PARTITION_BATCH_SIZE = 100
+PARTITION_DELETE_BATCH_SIZE = 25
+# the columns of the snapshot table, the partition columns come last as athena requires
+SNAPSHOT_PARTITION_COLUMNS = ['full_season', 'ingest_date']
+# the parameter of a snapshot partition that is set once the partition is a single file that will not change again
+COMPACTED_PARAMETER = 'compacted'
+SNAPSHOT_COLUMNS = (
+    ['season']
+    + [column for percentile in PERCENTILES for column in (percentile, f'{percentile}_population')]
+    + ['population', 'faction', 'expansion', 'region', 'ingested_at']
+    + SNAPSHOT_PARTITION_COLUMNS
+)
+# the keys of a table from the data catalog that can be used to create or update a table
+TABLE_INPUT_KEYS = ['Description', 'Owner', 'Retention', 'StorageDescriptor', 'PartitionKeys', 'TableType', 'Parameters']
 
 DATABASE = get_ssm_parameter('raiderio_database')
 TEMP_TABLE = get_ssm_parameter('raiderio_temp_table')
@@ -31,46 +43,614 @@ PROD_TABLE = get_ssm_parameter('raiderio_prod_table')
 TEMP_BUCKET = get_ssm_parameter('raiderio_temp_bucket')
 QUERY_OUTPUT_BUCKET = get_ssm_parameter('raiderio_query_results_bucket')
 PROD_BUCKET=get_ssm_parameter('raiderio_prod_bucket')
+SUMMARY_TABLE = get_ssm_parameter('raiderio_summary_table', default='raiderio_summary_table')
+# where dashboard query results are cached, the cache is invalidated after every publish
+QUERY_CACHE_LOCATION = get_ssm_parameter('raiderio_query_cache_location', default='')
+# the result of the summary query is written to this name in the cache location after every publish for the dashboards to read
+SUMMARY_RESULT_NAME = 'summary.json'
+
+# full: recreate the production table from the temporary table
+# incremental: only rewrite the partitions of the production table whose data has changed
+# swap: copy the parquet files of the temporary table and point the production table at the copies
+# snapshot: append the rows of every run to the production table so that the history of each season is kept
+PUBLISH_MODE = get_ssm_parameter('raiderio_publish_mode', default='full')
+# the table with only the latest snapshot of each season when the snapshot publish mode is used
+LATEST_TABLE = get_ssm_parameter('raiderio_latest_table', default=f'{PROD_TABLE}_latest')
+# the number of publishes to keep in the production bucket, all of them are kept if this is not set
+PROD_RETENTION = get_ssm_parameter('raiderio_prod_retention', default='')
+# the prefixes of the production bucket that hold a publish are named after current_date, other prefixes such as snapshots/ are never expired
+PUBLISH_PREFIX = re.compile(r'^\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2}(_\d+)?/$')
+
+backend = get_backend(DATABASE, QUERY_OUTPUT_BUCKET)
 
 current_date = str(str(datetime.utcnow()).replace('-', '_').replace(' ', '_').replace(':', '_').replace('.', '_'))
 
-# Refresh the table
-query_string = f"""
-    CREATE TABLE {PROD_TABLE} WITH
-    (external_location='s3://{PROD_BUCKET}/{current_date}/',
-    format='PARQUET',
-    write_compression='SNAPPY',
-    partitioned_by = ARRAY['{PARTITION_COLUMN}'])
-    AS
+def get_prod_table():
+    """
+    Retrieve the production table from the Glue data catalog.
+
+    Returns:
+    dict: The production table, or None if it does not exist.
+    """
+    try:
+        return glue_client.get_table(DatabaseName=DATABASE, Name=PROD_TABLE)['Table']
+    except glue_client.exceptions.EntityNotFoundException:
+        return None
+
+def format_partition_value(value, partition_type):
+    """
+    Format a partition value so that it can be used as a literal in a query.
 
-    SELECT
-        *
-    FROM "{DATABASE}"."{TEMP_TABLE}"
+    Parameters:
+    value (str): The partition value as returned by Athena.
+    partition_type (str): The type of the partition column.
 
-    ;
+    Returns:
+    str: The value as a query literal.
     """
-try:
-    response = client.start_query_execution(
-        QueryString=query_string,
-        QueryExecutionContext={'Database': DATABASE}, 
-        ResultConfiguration={'OutputLocation': f's3://{QUERY_OUTPUT_BUCKET}'}
+    if partition_type.split('(')[0].lower() in STRING_TYPES:
+        return "'" + value.replace("'", "''") + "'"
+    return value
+
+def delete_s3_location(location):
+    """
+    Delete all objects under an S3 location.
+
+    Parameters:
+    location (str): The location to delete, in the form s3://bucket/prefix.
+
+    Raises:
+    Exception: If any of the objects could not be deleted.
+    """
+    bucket, _, prefix = location.replace('s3://', '', 1).partition('/')
+    stats = purge(s3_client, bucket, prefix)
+    logger.info(f"Deleted {stats['objects']} objects from {location} in {stats['seconds']:.2f}s")
+
+def publish_full():
+    """
+    Recreate the production table from the temporary table in a new location of the production bucket.
+    """
+    query_string = f"""
+        CREATE TABLE {PROD_TABLE} WITH
+        (external_location='s3://{PROD_BUCKET}/{current_date}/',
+        format='PARQUET',
+        write_compression='SNAPPY',
+        partitioned_by = ARRAY['{PARTITION_COLUMN}', 'region'])
+        AS
+
+        SELECT
+            *
+        FROM "{DATABASE}"."{TEMP_TABLE}"
+
+        ;
+        """
+    backend.execute(query_string)
+
+def get_partition_spec(partition_keys, values):
+    """
+    Build the condition that matches the rows of a partition, with its values as literals so that Athena only reads that partition.
+
+    Parameters:
+    partition_keys (list): The partition keys of the table from the Glue data catalog.
+    values (list): The values of the partition.
+
+    Returns:
+    str: The SQL condition.
+    """
+    return ' AND '.join(f"{key['Name']} = {format_partition_value(value, key['Type'])}" for key, value in zip(partition_keys, values))
+
+def check_batch_errors(response, action):
+    """
+    Raise if a batch call to the Glue data catalog failed for any of its partitions.
+
+    Parameters:
+    response (dict): The response of the batch call.
+    action (str): What the call did, for the error message.
+
+    Raises:
+    Exception: If the response holds any errors.
+    """
+    errors = response.get('Errors', [])
+    if errors:
+        raise Exception(f"{len(errors)} partitions could not be {action}, first error: {errors[0].get('ErrorDetail', {}).get('ErrorMessage')}")
+
+def publish_incremental(prod_table):
+    """
+    Rewrite the partitions of the production table whose rows differ from the temporary table.
+
+    The production table is only read for the partitions that are in the temporary table, with their values as literals
+    so that Athena prunes every other partition, so the bytes scanned scale with the changed seasons rather than the whole history.
+    The changed partitions are written to a new location and repointed in the data catalog before their old files are deleted,
+    so the production table is never without them and a failed publish leaves it as it was.
+
+    Data is replaced a season at a time. A partition holds every season of an expansion but the lambda function only puts
+    the seasons that changed onto the firehose, so the seasons of a changed partition that are not in the temporary table
+    are carried over from the production table into its new files.
+
+    Parameters:
+    prod_table (dict): The production table from the Glue data catalog.
+    """
+    partition_keys = prod_table['PartitionKeys']
+    partition_columns = ', '.join(key['Name'] for key in partition_keys)
+
+    # the temporary table only holds what was put onto the firehose this run
+    temp_rows = backend.execute(f'SELECT DISTINCT {partition_columns}, full_season FROM "{DATABASE}"."{TEMP_TABLE}";')
+    temp_seasons = {}
+    for row in temp_rows:
+        temp_seasons.setdefault(tuple(str(row[key['Name']]) for key in partition_keys), set()).add(int(row['full_season']))
+    if not temp_seasons:
+        logger.info('The temporary table is empty. Nothing to publish.')
+        return
+    prod_filter = ' OR '.join(
+        f"({get_partition_spec(partition_keys, values)} AND full_season IN ({', '.join(str(season) for season in sorted(seasons))}))"
+        for values, seasons in temp_seasons.items()
     )
+    # a season has changed if it gained rows or lost rows, such as a faction that is no longer fetched,
+    # so the rows are compared both ways and the production side only for the seasons in the temporary table
+    changed_query = f"""
+        SELECT DISTINCT {partition_columns}
+        FROM (
+            (
+                SELECT * FROM "{DATABASE}"."{TEMP_TABLE}"
+                EXCEPT
+                SELECT * FROM "{DATABASE}"."{PROD_TABLE}"
+                WHERE {prod_filter}
+            )
+            UNION ALL
+            (
+                SELECT * FROM "{DATABASE}"."{PROD_TABLE}"
+                WHERE {prod_filter}
+                EXCEPT
+                SELECT * FROM "{DATABASE}"."{TEMP_TABLE}"
+            )
+        )
+        ;
+        """
+    changed_values = [[str(row[key['Name']]) for key in partition_keys] for row in backend.execute(changed_query)]
+    if not changed_values:
+        logger.info('No partitions have changed. Nothing to publish.')
+        return
+    logger.info(f"Publishing {len(changed_values)} changed partitions: {', '.join('/'.join(values) for values in changed_values)}")
+
+    staging_table = f'{PROD_TABLE}_staging'
+    old_locations = []
+    # athena writes at most 100 partitions with a single query
+    for i in range(0, len(changed_values), PARTITION_BATCH_SIZE):
+        batch = changed_values[i:i + PARTITION_BATCH_SIZE]
+        location = f's3://{PROD_BUCKET}/{current_date}/{i // PARTITION_BATCH_SIZE}/'
+        backend.execute(f'DROP TABLE IF EXISTS {staging_table};')
+        backend.execute(f"""
+            CREATE TABLE {staging_table} WITH
+            (external_location='{location}',
+            format='PARQUET',
+            write_compression='SNAPPY',
+            partitioned_by = ARRAY[{', '.join(f"'{key['Name']}'" for key in partition_keys)}])
+            AS
+
+            SELECT
+                *
+            FROM "{DATABASE}"."{TEMP_TABLE}"
+            WHERE {' OR '.join(f'({get_partition_spec(partition_keys, values)})' for values in batch)}
+
+            UNION ALL
+
+            SELECT
+                *
+            FROM "{DATABASE}"."{PROD_TABLE}"
+            WHERE {' OR '.join(
+                f"({get_partition_spec(partition_keys, values)} AND full_season NOT IN ({', '.join(str(season) for season in sorted(temp_seasons[tuple(values)]))}))"
+                for values in batch
+            )}
 
-    # Get the query execution ID
-    query_execution_id = response['QueryExecutionId']
+            ;
+            """)
+        # dropping the table only removes it from the data catalog, the files it wrote are kept
+        backend.execute(f'DROP TABLE IF EXISTS {staging_table};')
 
-    # Check the status of the query execution
-    query_status = client.get_query_execution(QueryExecutionId=query_execution_id)
+        new = []
+        updated = []
+        for values in batch:
+            partition_input = {
+                'Values': values,
+                'StorageDescriptor': {
+                    **prod_table['StorageDescriptor'],
+                    'Location': location + '/'.join(f"{key['Name']}={value}" for key, value in zip(partition_keys, values)) + '/'
+                }
+            }
+            try:
+                partition = glue_client.get_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, PartitionValues=values)['Partition']
+            except glue_client.exceptions.EntityNotFoundException:
+                new.append(partition_input)
+                continue
+            partition_input['StorageDescriptor'] = {**partition['StorageDescriptor'], 'Location': partition_input['StorageDescriptor']['Location']}
+            partition_input['Parameters'] = partition.get('Parameters', {})
+            updated.append({'PartitionValueList': values, 'PartitionInput': partition_input})
+            old_locations.append(partition['StorageDescriptor']['Location'])
+        if new:
+            check_batch_errors(glue_client.batch_create_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, PartitionInputList=new), 'created')
+        if updated:
+            check_batch_errors(glue_client.batch_update_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, Entries=updated), 'repointed')
 
-    # Wait until query execution is finished
-    while query_status['QueryExecution']['Status']['State'] in ['QUEUED', 'RUNNING']:
-        query_status = client.get_query_execution(QueryExecutionId=query_execution_id)
+    # the old files are only deleted once every changed partition points at its new files
+    for old_location in old_locations:
+        delete_s3_location(old_location.rstrip('/') + '/')
 
-    if query_status['QueryExecution']['Status']['State'] == 'FAILED':
-        raise Exception(query_status['QueryExecution']['Status']['StateChangeReason'])
+def copy_temp_files(location):
+    """
+    Copy every object of the temporary bucket to a location in the production bucket with server side copies.
+
+    Parameters:
+    location (str): The location to copy to, in the form s3://bucket/prefix/.
+
+    Returns:
+    int: The number of objects copied.
+    """
+    bucket, _, prefix = location.replace('s3://', '', 1).partition('/')
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=TEMP_BUCKET):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        list(executor.map(
+            lambda key: s3_client.copy_object(Bucket=bucket, Key=f'{prefix}{key}', CopySource={'Bucket': TEMP_BUCKET, 'Key': key}),
+            keys
+        ))
+    return len(keys)
+
+def relocate(storage_descriptor, location):
+    """
+    Point a storage descriptor of the temporary table at the same files under a new location.
+
+    Parameters:
+    storage_descriptor (dict): The storage descriptor of the temporary table or one of its partitions.
+    location (str): The location the temporary bucket was copied to.
+
+    Returns:
+    dict: A copy of the storage descriptor with its location moved.
+    """
+    return {**storage_descriptor, 'Location': storage_descriptor['Location'].replace(f's3://{TEMP_BUCKET}/', location, 1)}
+
+def get_partitions(table_name):
+    """
+    Retrieve every partition of a table from the Glue data catalog.
+
+    Parameters:
+    table_name (str): The name of the table.
+
+    Returns:
+    list: The partitions of the table.
+    """
+    partitions = []
+    paginator = glue_client.get_paginator('get_partitions')
+    for page in paginator.paginate(DatabaseName=DATABASE, TableName=table_name):
+        partitions.extend(page['Partitions'])
+    return partitions
 
+def publish_swap(prod_table):
+    """
+    Point the production table at copies of the parquet files of the temporary table.
+
+    The files are copied within S3 and the table is repointed in the data catalog, so nothing is
+    rewritten by Athena and the time taken hardly depends on the amount of data.
+
+    The repoint is not atomic. Partitions are created, moved and removed in batches over several calls,
+    so a query running at the same time can see some partitions at the new files and some at the old ones.
+    A batch that fails for any partition stops the publish before the table itself is repointed.
+
+    Parameters:
+    prod_table (dict): The production table from the Glue data catalog, or None if it does not exist.
+    """
+    location = f's3://{PROD_BUCKET}/{current_date}/'
+    copied = copy_temp_files(location)
+    logger.info(f"Copied {copied} objects from the temporary bucket to {location}")
+
+    temp_table = glue_client.get_table(DatabaseName=DATABASE, Name=TEMP_TABLE)['Table']
+    table_input = {key: temp_table[key] for key in TABLE_INPUT_KEYS if key in temp_table}
+    table_input['Name'] = PROD_TABLE
+    table_input['StorageDescriptor'] = relocate(temp_table['StorageDescriptor'], location)
+    partition_inputs = {
+        tuple(partition['Values']): {
+            'Values': partition['Values'],
+            'StorageDescriptor': relocate(partition['StorageDescriptor'], location),
+            'Parameters': partition.get('Parameters', {})
+        }
+        for partition in get_partitions(TEMP_TABLE)
+    }
+
+    if prod_table is None:
+        glue_client.create_table(DatabaseName=DATABASE, TableInput=table_input)
+        existing = set()
+    else:
+        existing = {tuple(partition['Values']) for partition in get_partitions(PROD_TABLE)}
+    # the data catalog has no transactions so every partition is repointed before the table itself
+    new = [partition_inputs[values] for values in partition_inputs if values not in existing]
+    updated = [{'PartitionValueList': list(values), 'PartitionInput': partition_inputs[values]} for values in partition_inputs if values in existing]
+    removed = [{'Values': list(values)} for values in existing if values not in partition_inputs]
+    for i in range(0, len(new), PARTITION_BATCH_SIZE):
+        check_batch_errors(glue_client.batch_create_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, PartitionInputList=new[i:i + PARTITION_BATCH_SIZE]), 'created')
+    for i in range(0, len(updated), PARTITION_BATCH_SIZE):
+        check_batch_errors(glue_client.batch_update_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, Entries=updated[i:i + PARTITION_BATCH_SIZE]), 'repointed')
+    for i in range(0, len(removed), PARTITION_DELETE_BATCH_SIZE):
+        check_batch_errors(glue_client.batch_delete_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, PartitionsToDelete=removed[i:i + PARTITION_DELETE_BATCH_SIZE]), 'removed')
+    if prod_table is not None:
+        glue_client.update_table(DatabaseName=DATABASE, TableInput=table_input)
+    logger.info(f"Pointed {PROD_TABLE} at {location}: {len(new)} partitions created, {len(updated)} moved, {len(removed)} removed")
+
+def count_objects(location):
+    """
+    Count the objects under an S3 location.
+
+    Parameters:
+    location (str): The location to count, in the form s3://bucket/prefix.
+
+    Returns:
+    int: The number of objects.
+    """
+    bucket, _, prefix = location.replace('s3://', '', 1).partition('/')
+    paginator = s3_client.get_paginator('list_objects_v2')
+    return sum(page.get('KeyCount', 0) for page in paginator.paginate(Bucket=bucket, Prefix=prefix))
+
+def publish_snapshot(prod_table):
+    """
+    Append the rows of the temporary table to the production table, partitioned by season and the date they were ingested.
+
+    Rows of a run that has already been published are skipped so the job can be rerun safely. Only the ingest_date
+    partitions of the incoming rows are read to find them, so Athena prunes the rest of the history.
+
+    Parameters:
+    prod_table (dict): The production table from the Glue data catalog, or None if it does not exist.
+    """
+    columns = ', '.join(column for column in SNAPSHOT_COLUMNS if column != 'ingest_date')
+    select = f"""
+        SELECT
+            {columns}
+            ,substr(ingested_at, 1, 10) AS ingest_date
+        FROM "{DATABASE}"."{TEMP_TABLE}" temp_rows
+        """
+    if prod_table is None:
+        backend.execute(f"""
+            CREATE TABLE {PROD_TABLE} WITH
+            (external_location='s3://{PROD_BUCKET}/snapshots/',
+            format='PARQUET',
+            write_compression='SNAPPY',
+            partitioned_by = ARRAY[{', '.join(f"'{column}'" for column in SNAPSHOT_PARTITION_COLUMNS)}])
+            AS
+            {select}
+            ;
+            """)
+        return
+    ingest_dates = [row['ingest_date'] for row in backend.execute(f'SELECT DISTINCT substr(ingested_at, 1, 10) AS ingest_date FROM "{DATABASE}"."{TEMP_TABLE}";')]
+    if not ingest_dates:
+        logger.info('The temporary table is empty. Nothing to publish.')
+        return
+    backend.execute(f"""
+        INSERT INTO "{DATABASE}"."{PROD_TABLE}"
+        {select}
+        WHERE NOT EXISTS (
+            SELECT 1 FROM "{DATABASE}"."{PROD_TABLE}" prod_rows
+            WHERE prod_rows.ingest_date IN ({', '.join(format_partition_value(ingest_date, 'string') for ingest_date in sorted(ingest_dates))})
+            AND prod_rows.ingested_at = temp_rows.ingested_at
+        )
+        ;
+        """)
+
+def get_compacted_entry(partition, location):
+    """
+    Build the batch_update_partition entry that points a partition at a location and marks it as compacted.
+
+    Parameters:
+    partition (dict): The partition from the Glue data catalog.
+    location (str): The location of the single file of the partition.
+
+    Returns:
+    dict: The entry for batch_update_partition.
+    """
+    return {
+        'PartitionValueList': partition['Values'],
+        'PartitionInput': {
+            'Values': partition['Values'],
+            'StorageDescriptor': {**partition['StorageDescriptor'], 'Location': location},
+            'Parameters': {**partition.get('Parameters', {}), COMPACTED_PARAMETER: 'true'}
+        }
+    }
+
+def compact_snapshots():
+    """
+    Rewrite each partition of the production table from an earlier day that is spread over several files as a single file.
+
+    Every run of the snapshot publish mode adds small files to the partitions of the day it ran on,
+    so once a day has passed its partitions are rewritten to keep the number of files scanned down.
+    The partitions are pointed at the rewritten files in the data catalog and the small files are deleted.
+
+    Partitions of an earlier day never change again, so once one has been checked it is marked as compacted in its
+    parameters and is neither listed nor rewritten by later runs.
+    """
+    prod_table = get_prod_table()
+    partition_keys = prod_table['PartitionKeys']
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    unchecked = [
+        partition for partition in get_partitions(PROD_TABLE)
+        if partition['Values'][-1] < today and partition.get('Parameters', {}).get(COMPACTED_PARAMETER) != 'true'
+    ]
+    fragmented = []
+    settled = []
+    for partition in unchecked:
+        (fragmented if count_objects(partition['StorageDescriptor']['Location']) > 1 else settled).append(partition)
+    # partitions that are already a single file only need to be marked
+    for i in range(0, len(settled), PARTITION_BATCH_SIZE):
+        entries = [get_compacted_entry(partition, partition['StorageDescriptor']['Location']) for partition in settled[i:i + PARTITION_BATCH_SIZE]]
+        check_batch_errors(glue_client.batch_update_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, Entries=entries), 'marked as compacted')
+    compacted_table = f'{PROD_TABLE}_compacted'
+    # athena writes at most 100 partitions with a single query
+    for i in range(0, len(fragmented), PARTITION_BATCH_SIZE):
+        batch = fragmented[i:i + PARTITION_BATCH_SIZE]
+        location = f's3://{PROD_BUCKET}/snapshots/compacted/{current_date}/{i // PARTITION_BATCH_SIZE}/'
+        specs = [get_partition_spec(partition_keys, partition['Values']) for partition in batch]
+        backend.execute(f'DROP TABLE IF EXISTS {compacted_table};')
+        backend.execute(f"""
+            CREATE TABLE {compacted_table} WITH
+            (external_location='{location}',
+            format='PARQUET',
+            write_compression='SNAPPY',
+            partitioned_by = ARRAY[{', '.join(f"'{key['Name']}'" for key in partition_keys)}])
+            AS
+
+            SELECT
+                *
+            FROM "{DATABASE}"."{PROD_TABLE}"
+            WHERE {' OR '.join(f'({spec})' for spec in specs)}
+
+            ;
+            """)
+        # dropping the table only removes it from the data catalog, the files it wrote are kept
+        backend.execute(f'DROP TABLE IF EXISTS {compacted_table};')
+        entries = [
+            get_compacted_entry(partition, location + '/'.join(f"{key['Name']}={value}" for key, value in zip(partition_keys, partition['Values'])) + '/')
+            for partition in batch
+        ]
+        # the small files are only deleted once every partition of the batch points at its compacted file
+        check_batch_errors(glue_client.batch_update_partition(DatabaseName=DATABASE, TableName=PROD_TABLE, Entries=entries), 'compacted')
+        for partition in batch:
+            delete_s3_location(partition['StorageDescriptor']['Location'].rstrip('/') + '/')
+    logger.info(f"Compacted {len(fragmented)} partitions of {PROD_TABLE} and marked {len(settled)} that were already a single file")
+
+def publish_latest():
+    """
+    Recreate the table with only the latest snapshot of each season, region and faction of the production table.
+
+    Queries for the current cutoffs read this small table rather than every snapshot.
+    """
+    backend.execute(f'DROP TABLE IF EXISTS {LATEST_TABLE};')
+    query_string = f"""
+        CREATE TABLE {LATEST_TABLE} WITH
+        (external_location='s3://{PROD_BUCKET}/{current_date}/latest/',
+        format='PARQUET',
+        write_compression='SNAPPY')
+        AS
+
+        SELECT
+            {', '.join(SNAPSHOT_COLUMNS)}
+        FROM (
+            SELECT
+                *
+                ,row_number() OVER (PARTITION BY full_season, region, faction ORDER BY ingested_at DESC) AS snapshot_rank
+            FROM "{DATABASE}"."{PROD_TABLE}"
+        )
+        WHERE snapshot_rank = 1
+
+        ;
+        """
+    backend.execute(query_string)
+
+def publish_summary(source_table):
+    """
+    Recreate the summary table with one row per season and percentile of a table.
+
+    The grafana panels all read from this small table instead of each scanning the production table.
+
+    Parameters:
+    source_table (str): The table to summarize, the production table or the latest snapshot table.
+    """
+    percentiles = ', '.join(f"'{percentile}'" for percentile in PERCENTILES)
+    scores = ', '.join(PERCENTILES)
+    populations = ', '.join(f'{percentile}_population' for percentile in PERCENTILES)
+    backend.execute(f'DROP TABLE IF EXISTS {SUMMARY_TABLE};')
+    query_string = f"""
+        CREATE TABLE {SUMMARY_TABLE} WITH
+        (external_location='s3://{PROD_BUCKET}/{current_date}/summary/',
+        format='PARQUET',
+        write_compression='SNAPPY')
+        AS
+
+        SELECT
+            CONCAT(expansion, concat(' - S', cast(season as varchar(10)))) AS season_label
+            ,full_season
+            ,region
+            ,faction
+            ,percentile
+            ,score
+            ,population_in_percentile
+            ,population AS total_population
+        FROM "{DATABASE}"."{source_table}"
+        CROSS JOIN UNNEST(
+            ARRAY[{percentiles}],
+            ARRAY[{scores}],
+            ARRAY[{populations}]
+        ) AS summary (percentile, score, population_in_percentile)
+        ORDER BY full_season
+
+        ;
+        """
+    backend.execute(query_string)
+
+def cache_summary():
+    """
+    Cache the rows of the summary table for the new version of the production table and write them to SUMMARY_RESULT_NAME.
+
+    The dashboards read SUMMARY_RESULT_NAME instead of each running the summary query against Athena.
+    """
+    query_string = f"""
+        SELECT
+            season_label
+            ,full_season
+            ,region
+            ,faction
+            ,percentile
+            ,score
+            ,population_in_percentile
+            ,total_population
+        FROM "{DATABASE}"."{SUMMARY_TABLE}"
+        ORDER BY full_season, region, faction, percentile
+        """
+    rows = query_cache.publish_rows(query_string, backend.execute, QUERY_CACHE_LOCATION, SUMMARY_RESULT_NAME)
+    logger.info(f"Cached {len(rows)} summary rows as {SUMMARY_RESULT_NAME} in {QUERY_CACHE_LOCATION}")
+
+def collect_garbage(keep):
+    """
+    Delete all but the latest publishes from the production bucket.
+
+    Only the prefixes named after the time of a publish are counted. The publish of this run, which also holds the summary
+    and latest tables, and the publishes the production table or any of its partitions point at are always kept,
+    an incremental publish leaves the partitions it did not rewrite in the publishes before it.
+
+    Parameters:
+    keep (int): The number of publishes to keep.
+    """
+    prod_table = get_prod_table()
+    referenced = {f'{current_date}/'}
+    if prod_table is not None:
+        locations = [prod_table['StorageDescriptor']['Location']] + [partition['StorageDescriptor']['Location'] for partition in get_partitions(PROD_TABLE)]
+        referenced |= {location.replace(f's3://{PROD_BUCKET}/', '', 1).split('/')[0] + '/' for location in locations}
+    prefixes = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=PROD_BUCKET, Delimiter='/'):
+        prefixes.extend(common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', []) if PUBLISH_PREFIX.match(common_prefix['Prefix']))
+    # the prefixes are timestamps so sorting them puts the latest publish last
+    expired = [prefix for prefix in sorted(prefixes)[:-keep] if prefix not in referenced] if keep > 0 else []
+    for prefix in expired:
+        delete_s3_location(f's3://{PROD_BUCKET}/{prefix}')
+    logger.info(f"Deleted {len(expired)} expired publishes from {PROD_BUCKET}")
+
+try:
+    prod_table = get_prod_table() if PUBLISH_MODE in ['incremental', 'swap', 'snapshot'] else None
+    if PUBLISH_MODE == 'snapshot':
+        publish_snapshot(prod_table)
+        compact_snapshots()
+        publish_latest()
+    elif PUBLISH_MODE == 'swap':
+        publish_swap(prod_table)
+    elif prod_table is None:
+        # the first incremental publish needs to create the production table
+        publish_full()
+    else:
+        publish_incremental(prod_table)
+    # the production table holds every snapshot in the snapshot publish mode so only the latest are summarized
+    publish_summary(LATEST_TABLE if PUBLISH_MODE == 'snapshot' else PROD_TABLE)
+    if QUERY_CACHE_LOCATION:
+        query_cache.set_version(QUERY_CACHE_LOCATION, current_date)
+        cache_summary()
+    if PROD_RETENTION:
+        collect_garbage(int(PROD_RETENTION))
 except Exception as e:
     logger.error(f"Failed to execute job: {str(e)}")
     sys.exit(1)  # Exit with error code 1 to indicate failure to AWS Glue
-
-
@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import shutil
+import logging
+import boto3
+from query_runner import run_query, get_query_rows
+
+logger = logging.getLogger(__name__)
+
+# athena: queries are run by Amazon Athena
+# duckdb: the same queries are run by DuckDB against local directories that stand in for the S3 buckets
+QUERY_BACKEND = os.environ.get('RAIDERIO_QUERY_BACKEND', 'athena')
+# the local directory that holds a directory for each bucket when the duckdb backend is used
+LOCAL_ROOT = os.environ.get('RAIDERIO_LOCAL_ROOT', '')
+
+class AthenaBackend:
+    """
+    Runs queries with Amazon Athena.
+    """
+    def __init__(self, database, output_bucket, client=None):
+        self.database = database
+        self.output_bucket = output_bucket
+        self.client = client or boto3.client('athena')
+
+    def execute(self, query_string):
+        """
+        Execute an SQL query and wait for it to finish.
+
+        Parameters:
+        query_string (str): SQL query string to be executed.
+
+        Returns:
+        list: One dict per result row, keyed on the column names.
+        """
+        return get_query_rows(self.client, run_query(self.client, query_string, self.database, self.output_bucket))
+
+    def read_sql(self, query_string):
+        """
+        Execute an SQL query and read its results into a DataFrame.
+
+        Parameters:
+        query_string (str): SQL query string to be executed.
+
+        Returns:
+        DataFrame: The results of the query.
+        """
+        # awswrangler is only available to the glue jobs that need it
+        import awswrangler as wr
+        # the results are unloaded to parquet so large results don't need to go through the api
+        return wr.athena.read_sql_query(sql=query_string, database=self.database, ctas_approach=True)
+
+class DuckDBBackend:
+    """
+    Runs the queries written for Athena with DuckDB against local parquet and json files.
+
+    S3 locations are mapped to directories of the root directory, so s3://bucket/prefix/ becomes root/bucket/prefix/.
+    Tables are kept as views in root/<database>.duckdb so that they outlive the job that created them.
+    """
+    def __init__(self, database, root):
+        # duckdb is only needed to run the jobs locally
+        import duckdb
+        self.database = database
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        # naming the file after the database lets queries refer to "database"."table" as they do in athena
+        self.connection = duckdb.connect(os.path.join(root, f'{database}.duckdb'))
+
+    def get_local_path(self, location):
+        """
+        Map an S3 location to its local directory.
+
+        Parameters:
+        location (str): The location in the form s3://bucket/prefix.
+
+        Returns:
+        str: The local directory.
+        """
+        return os.path.join(self.root, location.replace('s3://', '', 1))
+
+    def register_json_table(self, table, location):
+        """
+        Create a table over newline delimited json files, such as the files the firehose writes.
+
+        Parameters:
+        table (str): The name of the table.
+        location (str): The S3 location of the files.
+        """
+        path = os.path.join(self.get_local_path(location), '**', '*')
+        self.connection.cursor().execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_json_auto('{path}', format = 'newline_delimited')")
+
+    def translate(self, query_string):
+        """
+        Translate a query written for Athena into the queries DuckDB needs to do the same thing.
+
+        Parameters:
+        query_string (str): The SQL query string written for Athena.
+
+        Returns:
+        list: The SQL query strings to run with DuckDB.
+        """
+        query_string = query_string.strip().rstrip(';').strip()
+        drop = re.match(r'DROP\s+TABLE\s+(IF\s+EXISTS\s+)?(.+)$', query_string, re.IGNORECASE | re.DOTALL)
+        if drop:
+            return [f'DROP VIEW {drop.group(1) or ""}{drop.group(2)}']
+        # trino's UNNEST of several arrays becomes a lateral subquery that unnests them side by side
+        query_string = re.sub(
+            r'CROSS\s+JOIN\s+UNNEST\s*\((.*?)\)\s*AS\s+(\w+)\s*\(([^)]*)\)',
+            lambda match: 'CROSS JOIN (SELECT ' + ', '.join(f'UNNEST({array})' for array in re.findall(r'ARRAY\s*\[[^\]]*\]', match.group(1))) + f') AS {match.group(2)} ({match.group(3)})',
+            query_string,
+            flags=re.IGNORECASE | re.DOTALL
+        )
+        ctas = re.match(r'CREATE\s+TABLE\s+(\S+)\s+WITH\s*\((.*?)\)\s*AS\s+(.*)$', query_string, re.IGNORECASE | re.DOTALL)
+        if not ctas:
+            return [query_string]
+        table, properties, select = ctas.groups()
+        location = re.search(r"external_location\s*=\s*'([^']*)'", properties).group(1)
+        partitions = re.search(r'partitioned_by\s*=\s*ARRAY\s*\[([^\]]*)\]', properties)
+        compression = re.search(r"write_compression\s*=\s*'([^']*)'", properties)
+        path = self.get_local_path(location)
+        # like athena, a table can only be created in an empty location
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        options = ['FORMAT PARQUET', f"COMPRESSION {compression.group(1) if compression else 'SNAPPY'}"]
+        if partitions:
+            columns = [column.strip().strip("'") for column in partitions.group(1).split(',')]
+            options.append(f"PARTITION_BY ({', '.join(columns)})")
+            target = path
+            # like athena, only the files in the partition directories belong to the table
+            files = os.path.join(path, *['*'] * len(columns), '*.parquet')
+        else:
+            target = os.path.join(path, 'data.parquet')
+            files = target
+        return [
+            f"COPY ({select}) TO '{target}' ({', '.join(options)})",
+            f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet('{files}', hive_partitioning = {'true' if partitions else 'false'})"
+        ]
+
+    def execute(self, query_string):
+        """
+        Execute an SQL query written for Athena.
+
+        Parameters:
+        query_string (str): SQL query string to be executed.
+
+        Returns:
+        list: One dict per result row, keyed on the column names.
+        """
+        start_time = time.perf_counter()
+        cursor = self.connection.cursor()
+        rows = []
+        for statement in self.translate(query_string):
+            cursor.execute(statement)
+            if cursor.description:
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        logger.info(f"Query finished with duckdb in {time.perf_counter() - start_time:.3f}s")
+        return rows
+
+    def read_sql(self, query_string):
+        """
+        Execute an SQL query written for Athena and read its results into a DataFrame.
+
+        Parameters:
+        query_string (str): SQL query string to be executed.
+
+        Returns:
+        DataFrame: The results of the query.
+        """
+        cursor = self.connection.cursor()
+        statements = self.translate(query_string)
+        for statement in statements[:-1]:
+            cursor.execute(statement)
+        return cursor.execute(statements[-1]).fetchdf()
+
+def get_backend(database, output_bucket):
+    """
+    Create the query backend chosen with the RAIDERIO_QUERY_BACKEND environment variable.
+
+    Parameters:
+    database (str): Database to execute queries against.
+    output_bucket (str): S3 bucket to store query execution results.
+
+    Returns:
+    AthenaBackend or DuckDBBackend: The query backend.
+
+    Raises:
+    ValueError: If the backend is unknown or the duckdb backend has no RAIDERIO_LOCAL_ROOT.
+    """
+    if QUERY_BACKEND == 'athena':
+        return AthenaBackend(database, output_bucket)
+    if QUERY_BACKEND == 'duckdb':
+        if not LOCAL_ROOT:
+            raise ValueError('RAIDERIO_LOCAL_ROOT must be set to use the duckdb backend')
+        return DuckDBBackend(database, LOCAL_ROOT)
+    raise ValueError(f'Unknown query backend {QUERY_BACKEND}')
@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import hashlib
+import shutil
+import logging
+import boto3
+from s3_purge import purge
+
+logger = logging.getLogger(__name__)
+
+# the name of the object in the cache location that holds the version of the production table
+VERSION_NAME = 'version'
+# the entries of the cache are kept under a prefix named after the version they were cached for,
+# this one holds the entries cached before any version was recorded
+UNVERSIONED = 'unversioned'
+# a quoted string literal or identifier, with quotes inside it doubled
+QUOTED = r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\""
+
+s3_client = None
+hits = 0
+misses = 0
+
+def normalize_sql(sql):
+    """
+    Normalize a query so that the same query with different whitespace or a trailing semicolon shares a cache entry.
+
+    Whitespace inside quoted literals and identifiers is kept as it is, it changes what the query matches.
+
+    Parameters:
+    sql (str): The SQL query string.
+
+    Returns:
+    str: The normalized query.
+    """
+    return re.sub(f'({QUOTED})|\\s+', lambda match: match.group(1) or ' ', sql).strip().rstrip(';').strip()
+
+def read_object(location, name):
+    """
+    Read an object from the cache location.
+
+    Parameters:
+    location (str): The cache location, either s3://bucket/prefix or a local directory.
+    name (str): The name of the object.
+
+    Returns:
+    str: The contents of the object, or None if it does not exist.
+    """
+    global s3_client
+    if location.startswith('s3://'):
+        if s3_client is None:
+            s3_client = boto3.client('s3')
+        bucket, _, prefix = location.replace('s3://', '', 1).partition('/')
+        try:
+            return s3_client.get_object(Bucket=bucket, Key=f"{prefix.rstrip('/')}/{name}".lstrip('/'))['Body'].read().decode('utf-8')
+        except s3_client.exceptions.NoSuchKey:
+            return None
+    path = os.path.join(location, name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as cached:
+        return cached.read()
+
+def write_object(location, name, body):
+    """
+    Write an object to the cache location.
+
+    Parameters:
+    location (str): The cache location, either s3://bucket/prefix or a local directory.
+    name (str): The name of the object.
+    body (str): The contents of the object.
+    """
+    global s3_client
+    if location.startswith('s3://'):
+        if s3_client is None:
+            s3_client = boto3.client('s3')
+        bucket, _, prefix = location.replace('s3://', '', 1).partition('/')
+        s3_client.put_object(Bucket=bucket, Key=f"{prefix.rstrip('/')}/{name}".lstrip('/'), Body=body.encode('utf-8'))
+        return
+    path = os.path.join(location, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as cached:
+        cached.write(body)
+
+def delete_prefix(location, prefix):
+    """
+    Delete every object under a prefix of the cache location.
+
+    Parameters:
+    location (str): The cache location, either s3://bucket/prefix or a local directory.
+    prefix (str): The prefix to delete, relative to the cache location.
+
+    Raises:
+    Exception: If any of the objects could not be deleted.
+    """
+    global s3_client
+    if location.startswith('s3://'):
+        if s3_client is None:
+            s3_client = boto3.client('s3')
+        bucket, _, root = location.replace('s3://', '', 1).partition('/')
+        purge(s3_client, bucket, f"{root.rstrip('/')}/{prefix}/".lstrip('/'))
+        return
+    shutil.rmtree(os.path.join(location, prefix), ignore_errors=True)
+
+def set_version(location, version):
+    """
+    Record a new version of the production table, which invalidates every cached result.
+
+    The entries of the previous version can not be found again once the new version is recorded, so they are deleted.
+
+    Parameters:
+    location (str): The cache location, either s3://bucket/prefix or a local directory.
+    version (str): The version of the production table, such as the time it was published.
+
+    Raises:
+    Exception: If any of the entries of the previous version could not be deleted.
+    """
+    previous = read_object(location, VERSION_NAME) or UNVERSIONED
+    write_object(location, VERSION_NAME, version)
+    if previous != version:
+        delete_prefix(location, previous)
+    logger.info(f"Query cache at {location} invalidated for version {version}")
+
+def get_rows(sql, execute, location):
+    """
+    Retrieve the result rows of a query, running it only if it has not been run against the current version of the production table.
+
+    Parameters:
+    sql (str): The SQL query string.
+    execute (callable): Runs a SQL query string and returns its result rows as a list of dicts.
+    location (str): The cache location, either s3://bucket/prefix or a local directory.
+
+    Returns:
+    list: One dict per result row, keyed on the column names.
+    """
+    global hits, misses
+    version = read_object(location, VERSION_NAME) or UNVERSIONED
+    # results of older versions are never found again because they are under the prefix of their version
+    name = f"{version}/{hashlib.sha256(normalize_sql(sql).encode('utf-8')).hexdigest()}.json"
+    cached = read_object(location, name)
+    if cached is not None:
+        hits += 1
+        return json.loads(cached)
+    misses += 1
+    rows = execute(sql)
+    write_object(location, name, json.dumps(rows))
+    return rows
+
+def publish_rows(sql, execute, location, name):
+    """
+    Retrieve the result rows of a query through the cache and write them to a fixed name in the cache location as well,
+    so that a dashboard can read the latest result without knowing the key of its cache entry.
+
+    Parameters:
+    sql (str): The SQL query string.
+    execute (callable): Runs a SQL query string and returns its result rows as a list of dicts.
+    location (str): The cache location, either s3://bucket/prefix or a local directory.
+    name (str): The name of the object to write the result rows to.
+
+    Returns:
+    list: One dict per result row, keyed on the column names.
+    """
+    rows = get_rows(sql, execute, location)
+    write_object(location, name, json.dumps(rows))
+    return rows
+
+def get_stats():
+    """
+    Count the queries that were served from the cache and the queries that had to be run.
+
+    Returns:
+    dict: The number of hits and misses.
+    """
+    return {'hits': hits, 'misses': misses}
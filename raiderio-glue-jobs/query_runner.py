@@ -0,0 +1,108 @@
+import random
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait before the first status check and the most we'll ever wait between two checks
+INITIAL_DELAY = 0.5
+MAX_DELAY = 10
+# seconds to wait for a query to finish before giving up on it
+QUERY_TIMEOUT = 30 * 60
+
+def wait_for_query(client, query_execution_id, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY, timeout=QUERY_TIMEOUT):
+    """
+    Wait for an Athena query to finish, backing off exponentially between status checks.
+
+    Parameters:
+    client: The boto3 athena client to use.
+    query_execution_id (str): The Query Execution ID from Athena.
+    initial_delay (float): Seconds to wait before the first status check, the second half of which is jittered.
+    max_delay (float): The most seconds to wait between two status checks.
+    timeout (float): Seconds to wait for the query to finish.
+
+    Returns:
+    tuple: The final QueryExecution from Athena and the number of get_query_execution calls made.
+
+    Raises:
+    TimeoutError: If the query has not finished within the timeout.
+    """
+    api_calls = 0
+    delay = initial_delay
+    deadline = time.monotonic() + timeout
+    remaining = timeout
+    while True:
+        # a query is never finished as soon as it is started, so even the first check waits
+        # half of the delay is jittered so that jobs started together don't check in lockstep
+        time.sleep(max(0, min(delay / 2 + random.uniform(0, delay / 2), remaining)))
+        query_status = client.get_query_execution(QueryExecutionId=query_execution_id)
+        api_calls += 1
+        if query_status['QueryExecution']['Status']['State'] not in ['QUEUED', 'RUNNING']:
+            return query_status['QueryExecution'], api_calls
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Query {query_execution_id} did not finish within {timeout} seconds")
+        delay = min(delay * 2, max_delay)
+
+def run_query(client, query_string, database, output_bucket, timeout=QUERY_TIMEOUT):
+    """
+    Execute an SQL query using Amazon Athena and wait for it to finish.
+
+    Parameters:
+    client: The boto3 athena client to use.
+    query_string (str): SQL query string to be executed.
+    database (str): Database to execute the query against.
+    output_bucket (str): S3 bucket to store query execution results.
+    timeout (float): Seconds to wait for the query to finish.
+
+    Returns:
+    dict: The final QueryExecution from Athena, including its Statistics.
+
+    Raises:
+    Exception: If the query fails or is cancelled.
+    TimeoutError: If the query has not finished within the timeout.
+    """
+    response = client.start_query_execution(
+        QueryString=query_string,
+        QueryExecutionContext={'Database': database},
+        ResultConfiguration={'OutputLocation': f's3://{output_bucket}'}
+    )
+    query_execution_id = response['QueryExecutionId']
+    query_execution, api_calls = wait_for_query(client, query_execution_id, timeout=timeout)
+
+    status = query_execution['Status']
+    if status['State'] in ['FAILED', 'CANCELLED']:
+        raise Exception(status.get('StateChangeReason', f"Query {query_execution_id} was {status['State'].lower()}"))
+
+    statistics = query_execution.get('Statistics', {})
+    logger.info(
+        f"Query {query_execution_id} finished with {api_calls} status checks. "
+        f"Data scanned: {statistics.get('DataScannedInBytes', 0)} bytes, "
+        f"engine execution time: {statistics.get('EngineExecutionTimeInMillis', 0)} ms, "
+        f"queue time: {statistics.get('QueryQueueTimeInMillis', 0)} ms"
+    )
+    return query_execution
+
+def get_query_rows(client, query_execution):
+    """
+    Retrieve the result rows of a finished Athena query.
+
+    Parameters:
+    client: The boto3 athena client to use.
+    query_execution (dict): The QueryExecution returned by run_query.
+
+    Returns:
+    list: One dict per result row, keyed on the column names.
+    """
+    paginator = client.get_paginator('get_query_results')
+    columns = None
+    rows = []
+    for page in paginator.paginate(QueryExecutionId=query_execution['QueryExecutionId']):
+        result_rows = page['ResultSet']['Rows']
+        if columns is None:
+            columns = [column['Name'] for column in page['ResultSet']['ResultSetMetadata']['ColumnInfo']]
+            # the first row of the first page holds the column headers
+            result_rows = result_rows[1:]
+        for row in result_rows:
+            rows.append({column: value.get('VarCharValue') for column, value in zip(columns, row['Data'])})
+    return rows
@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# delete_objects accepts at most 1000 keys per call
+DELETE_BATCH_SIZE = 1000
+
+def delete_batch(s3_client, bucket, keys):
+    """
+    Delete a batch of objects from a bucket in a single delete_objects request.
+
+    Parameters:
+    s3_client: The boto3 s3 client to use.
+    bucket (str): Name of the S3 bucket to delete the objects from.
+    keys (list): Keys of the objects to delete. At most DELETE_BATCH_SIZE keys.
+
+    Returns:
+    int: The number of objects deleted.
+
+    Raises:
+    Exception: If any of the objects could not be deleted.
+    """
+    response = s3_client.delete_objects(
+        Bucket=bucket,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    errors = response.get('Errors', [])
+    if errors:
+        raise Exception(f"{len(errors)} objects could not be deleted from {bucket}, first error: {errors[0].get('Key')}: {errors[0].get('Message')}")
+    return len(keys)
+
+def delete_batches(s3_client, bucket, batches, max_workers=1):
+    """
+    Delete batches of objects from a bucket, up to max_workers batches at once.
+
+    Parameters:
+    s3_client: The boto3 s3 client to use.
+    bucket (str): Name of the S3 bucket to delete the objects from.
+    batches (iterable): Lists of at most DELETE_BATCH_SIZE keys. Batches are deleted as they are produced, so this can be a listing that is still being paged through.
+    max_workers (int): The number of batches that are allowed to be deleted at once.
+
+    Returns:
+    dict: The number of objects deleted, the seconds taken and the objects deleted per second.
+
+    Raises:
+    Exception: If any of the objects could not be deleted.
+    """
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(delete_batch, s3_client, bucket, keys) for keys in batches if keys]
+        deleted = sum(future.result() for future in futures)
+    elapsed = time.perf_counter() - start_time
+    return {
+        'objects': deleted,
+        'seconds': elapsed,
+        'objects_per_second': deleted / elapsed if elapsed > 0 else 0
+    }
+
+def delete_keys(s3_client, bucket, keys, max_workers=1):
+    """
+    Delete objects from a bucket, DELETE_BATCH_SIZE keys per request.
+
+    Parameters:
+    s3_client: The boto3 s3 client to use.
+    bucket (str): Name of the S3 bucket to delete the objects from.
+    keys (list): Keys of the objects to delete.
+    max_workers (int): The number of batches that are allowed to be deleted at once.
+
+    Returns:
+    dict: The number of objects deleted, the seconds taken and the objects deleted per second.
+
+    Raises:
+    Exception: If any of the objects could not be deleted.
+    """
+    batches = (keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE))
+    return delete_batches(s3_client, bucket, batches, max_workers)
+
+def purge(s3_client, bucket, prefix='', max_workers=1):
+    """
+    Delete every object of a bucket, or every object under a prefix of it.
+
+    Objects are listed a page of DELETE_BATCH_SIZE keys at a time with list_objects_v2 and each page is deleted with a single delete_objects request.
+
+    Parameters:
+    s3_client: The boto3 s3 client to use.
+    bucket (str): Name of the S3 bucket to purge.
+    prefix (str): Only the objects whose keys start with this are deleted.
+    max_workers (int): The number of batches that are allowed to be deleted at once.
+
+    Returns:
+    dict: The number of objects deleted, the seconds taken and the objects deleted per second.
+
+    Raises:
+    Exception: If any of the objects could not be deleted.
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig={'PageSize': DELETE_BATCH_SIZE})
+    return delete_batches(s3_client, bucket, ([obj['Key'] for obj in page.get('Contents', [])] for page in pages), max_workers)
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import logging
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# every parameter used by the glue jobs, these are all retrieved together the first time one is needed
+PARAMETER_NAMES = [
+    'raiderio_database',
+    'raiderio_data_quality_bucket',
+    'raiderio_dq_engine',
+    'raiderio_firehose_bucket',
+    'raiderio_firehose_table',
+    'raiderio_latest_table',
+    'raiderio_partition_column',
+    'raiderio_prod_bucket',
+    'raiderio_prod_retention',
+    'raiderio_prod_table',
+    'raiderio_publish_mode',
+    'raiderio_query_cache_location',
+    'raiderio_query_results_bucket',
+    'raiderio_summary_table',
+    'raiderio_temp_bucket',
+    'raiderio_temp_table',
+]
+# get_parameters accepts at most 10 names per call
+GET_PARAMETERS_BATCH_SIZE = 10
+# seconds that retrieved parameters are reused before they are retrieved again
+CACHE_TTL = 15 * 60
+# a local json file of parameter names and values that is used instead of the parameter store, to run the jobs locally
+PARAMETERS_FILE = os.environ.get('RAIDERIO_PARAMETERS_FILE')
+
+ssm_client = None
+parameters = {}
+loaded_at = None
+
+def load_parameters():
+    """
+    Retrieve every parameter of PARAMETER_NAMES from AWS Systems Manager Parameter Store into the cache.
+
+    If PARAMETERS_FILE is set, the parameters are read from that file instead.
+
+    Raises:
+    SystemExit: If the parameters cannot be retrieved due to AWS errors.
+    """
+    global ssm_client, parameters, loaded_at
+    try:
+        start_time = time.perf_counter()
+        if PARAMETERS_FILE:
+            with open(PARAMETERS_FILE) as parameters_file:
+                parameters = json.load(parameters_file)
+            loaded_at = time.monotonic()
+            return
+        if ssm_client is None:
+            ssm_client = boto3.client('ssm')
+        loaded = {}
+        for i in range(0, len(PARAMETER_NAMES), GET_PARAMETERS_BATCH_SIZE):
+            response = ssm_client.get_parameters(Names=PARAMETER_NAMES[i:i + GET_PARAMETERS_BATCH_SIZE], WithDecryption=True)
+            for parameter in response['Parameters']:
+                loaded[parameter['Name']] = parameter['Value']
+        parameters = loaded
+        loaded_at = time.monotonic()
+        logger.info(f"Retrieved {len(parameters)} parameters in {time.perf_counter() - start_time:.3f}s")
+    except Exception as e:
+        logger.error(f"An error occurred while retrieving parameters: {str(e)}")
+        sys.exit(f"An error occurred while retrieving parameters: {str(e)}")
+
+def get_ssm_parameter(param_name, default=None):
+    """
+    Retrieve a parameter from AWS Systems Manager Parameter Store.
+
+    All parameters are retrieved in a single batch the first time one is needed and are cached for CACHE_TTL seconds.
+
+    Parameters:
+    param_name (str): The name of the parameter to retrieve. Must be one of PARAMETER_NAMES.
+    default (str): The value to return if the parameter does not exist. The parameter is required if this is None.
+
+    Returns:
+    str: The value of the parameter.
+
+    Raises:
+    SystemExit: If the parameter cannot be retrieved due to it not existing or other AWS errors.
+    """
+    if loaded_at is None or time.monotonic() - loaded_at > CACHE_TTL:
+        load_parameters()
+    if param_name in parameters:
+        return parameters[param_name]
+    if default is not None:
+        return default
+    logger.error(f"Parameter retrieval failed for {param_name}: parameter not found")
+    sys.exit(f"Parameter retrieval failed for {param_name}: parameter not found")